@@ -42,6 +42,18 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 
+# Rows parsed and inserted per chunk when streaming CSV uploads
+app.config["UPLOAD_CHUNK_ROWS"] = int(os.environ.get("UPLOAD_CHUNK_ROWS", 100000))
+
+# Memory budget in bytes of the in-process candle store shared by the analysis services
+app.config["CANDLE_STORE_MAX_BYTES"] = int(os.environ.get("CANDLE_STORE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Directory of the memory-mapped candle cache shared by all workers (disabled when unset)
+app.config["CANDLE_CACHE_DIR"] = os.environ.get("CANDLE_CACHE_DIR") or None
+
+# Memory budget in bytes of the in-process cache of serialized read responses
+app.config["RESPONSE_CACHE_MAX_BYTES"] = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
 # Initialize the app with the extension
 db.init_app(app)
 
@@ -49,6 +61,17 @@ db.init_app(app)
 with app.app_context():
     import models  # noqa: F401
     db.create_all()
+    
+    # create_all() does not touch existing tables, so report schema drift
+    from init.schema import find_missing_columns, find_missing_indexes
+    missing_columns = [f"{table.name}.{column.name}" for table, column in find_missing_columns(db.engine, db.metadata)]
+    missing_indexes = [index.name for index in find_missing_indexes(db.engine, db.metadata)]
+    if missing_columns or missing_indexes:
+        logger.warning(
+            "Database schema is out of date (missing columns: %s; missing indexes: %s). "
+            "Run 'python init/db_init.py' to upgrade it.",
+            ', '.join(missing_columns) or 'none', ', '.join(missing_indexes) or 'none'
+        )
 
 # Import and register routes - must be done after models are imported
 from app_routes import register_routes
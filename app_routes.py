@@ -3,11 +3,10 @@ Market Analyzer - Application Routes
 
 This module defines all the routes and API endpoints for the application.
 """
-import os
-import pandas as pd
-from flask import render_template, request, jsonify, flash, session
-from werkzeug.utils import secure_filename
-import tempfile
+import functools
+import time
+from sqlalchemy import func
+from flask import render_template, request, jsonify, Response, make_response
 import logging
 
 # Set up logger
@@ -15,13 +14,82 @@ logger = logging.getLogger(__name__)
 
 # Import database and models
 from app import db
-from models import Candle, PriceActionPattern, FairValueGap, TradeOpportunity
+from models import Candle, PriceActionPattern, AnalysisRun, AnalysisKindEnum, TimeframeEnum
 
 # Import services
-from services.candle_service import process_csv_data, generate_higher_timeframe_candles, link_unlinked_timeframes
+from services.candle_service import ingest_csv_stream, aggregate_timeframe_cascade, reaggregate_touched_buckets, link_unlinked_timeframes
+from services.candle_store import get_candle_frame, invalidate_symbol, rebuild_symbol_cache
 from services.price_action_service import identify_price_action_patterns, validate_patterns
-from services.fvg_service import identify_fair_value_gaps
+from services.fvg_service import identify_fair_value_gaps, update_open_fvg_fills
 from services.trade_service import identify_trade_opportunities, get_trade_statistics
+from services.backtest_service import build_parameter_grid, run_backtest
+from services.chart_data_service import (load_candle_columns, load_pattern_columns, load_fvg_columns,
+                                         load_opportunity_columns, ANALYSIS_TIMEFRAMES, PATTERN_CATEGORIES, FVG_CATEGORIES,
+                                         FVG_NULLABLE, OPPORTUNITY_CATEGORIES, OPPORTUNITY_NULLABLE)
+from services.columnar import COLUMNAR_MIMETYPE, encode_columns, columns_to_records
+from services.dataset_version_service import get_dataset_version, bump_dataset_version, dataset_etag, get_response_cache
+from services.analysis_run_service import start_run, complete_run, fail_run, latest_run, run_to_dict
+
+def columnar_requested():
+    """
+    Whether the client asked for column-oriented binary data, with
+    ?format=columns or an Accept header preferring COLUMNAR_MIMETYPE
+    """
+    response_format = request.args.get('format')
+    if response_format is not None:
+        if response_format not in ('json', 'columns'):
+            raise ValueError(f"Unsupported format: {response_format}")
+        return response_format == 'columns'
+    return request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE]) == COLUMNAR_MIMETYPE
+
+def columns_response(columns, columnar, categories=None, nullable=(), meta=None):
+    """
+    Respond with columns packed by encode_columns() when columnar is set,
+    otherwise as a JSON list of row objects
+    """
+    if columnar:
+        response = Response(encode_columns(columns, categories, nullable, meta), mimetype=COLUMNAR_MIMETYPE)
+    else:
+        response = jsonify(columns_to_records(columns, categories, nullable))
+    response.vary.add('Accept')
+    return response
+
+def versioned_response(view):
+    """
+    Serve a GET endpoint of a symbol's data by dataset version.
+
+    The response gets an ETag built from the symbol's dataset version and
+    the request, If-None-Match is answered with 304 and successful
+    responses are kept in the response cache until the version changes.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Look the version up before any data is read
+        version = get_dataset_version(request.args.get('symbol', 'EUR/USD'))
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), request.headers.get('Accept', ''))
+        etag = dataset_etag(version, key)
+        
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            cache = get_response_cache()
+            cached = cache.get(key + (version,))
+            if cached is not None:
+                body, status, headers = cached
+                response = Response(body, status=status, headers=headers)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                cache.put(key + (version,), response.get_data(), response.status_code, list(response.headers.items()))
+        
+        response.set_etag(etag)
+        # Browsers revalidate with the ETag instead of reusing stale data
+        response.cache_control.no_cache = True
+        response.vary.add('Accept')
+        return response
+    
+    return wrapper
 
 def register_routes(app):
     @app.route('/')
@@ -30,86 +98,208 @@ def register_routes(app):
     
     @app.route('/api/upload', methods=['POST'])
     def upload_csv():
+        symbol = None
+        append = None
+        cleared = False
+        # Filled chunk by chunk, so a failed upload can tell what was committed
+        counts = {}
         try:
-            if 'file' not in request.files:
-                return jsonify({'error': 'No file part'}), 400
-            
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'error': 'No selected file'}), 400
+            # Accept either a multipart form upload or a raw text/csv request body
+            if request.mimetype == 'text/csv':
+                symbol = request.args.get('symbol', 'EUR/USD')
+                stream = request.stream
+            else:
+                if 'file' not in request.files:
+                    return jsonify({'error': 'No file part'}), 400
+                
+                file = request.files['file']
+                if file.filename == '':
+                    return jsonify({'error': 'No selected file'}), 400
+                
+                if not file.filename.endswith('.csv'):
+                    return jsonify({'error': 'Only CSV files are allowed'}), 400
+                
+                symbol = request.form.get('symbol', 'EUR/USD')
+                stream = file.stream
             
-            if not file.filename.endswith('.csv'):
-                return jsonify({'error': 'Only CSV files are allowed'}), 400
+            chunk_size = request.args.get('chunkSize', app.config['UPLOAD_CHUNK_ROWS'], type=int)
+            if chunk_size <= 0:
+                return jsonify({'error': 'chunkSize must be a positive integer'}), 400
             
-            symbol = request.form.get('symbol', 'EUR/USD')
+            # 'replace' rebuilds the symbol from scratch, 'append' only adds new candles
+            mode = request.form.get('mode') or request.args.get('mode', 'replace')
+            if mode not in ('replace', 'append'):
+                return jsonify({'error': f'Unsupported upload mode: {mode}'}), 400
+            append = mode == 'append'
             
-            # Create temp file to save the uploaded file
-            fd, temp_path = tempfile.mkstemp()
-            file.save(temp_path)
+            # Cached candle frames of this symbol are stale from here on
+            invalidate_symbol(symbol)
             
-            try:
-                # Process the CSV data
-                df = pd.read_csv(temp_path)
-                
+            if not append:
                 # Clean existing data for this symbol
                 Candle.query.filter_by(symbol=symbol).delete()
                 db.session.commit()
-                
-                # Process the data
-                candles = process_csv_data(df, symbol)
-                logger.info(f"Processed {len(candles)} 1-minute candles")
-                
-                # Generate higher timeframe candles
-                timeframes = ['5m', '15m', '30m', '1H', '4H']
-                for tf in timeframes:
-                    higher_tf_candles = generate_higher_timeframe_candles(candles, tf)
-                    logger.info(f"Generated {len(higher_tf_candles)} {tf} candles")
-                
-                db.session.commit()
-                
-                return jsonify({
-                    'success': True,
-                    'message': 'Data uploaded and processed successfully',
-                    'candleCount': len(candles)
-                })
+                cleared = True
             
-            finally:
-                os.close(fd)
-                os.unlink(temp_path)
+            # Stream the CSV into the database one chunk at a time
+            started = time.perf_counter()
+            ingest_csv_stream(stream, symbol, chunk_size, append=append, counts=counts)
+            ingest_seconds = time.perf_counter() - started
+            logger.info(f"Inserted {counts['inserted']} 1-minute candles in {counts['chunks']} chunks "
+                        f"({counts['skipped']} invalid rows skipped, {counts['existing']} already stored)")
+            
+            if append:
+                # Only rebuild the higher timeframe buckets the new candles fall into
+                timeframe_counts = reaggregate_touched_buckets(symbol, counts['touched_buckets'])
+            else:
+                # Generate all higher timeframe candles in one cascade
+                timeframe_counts = aggregate_timeframe_cascade(symbol)
+            
+            rebuild_symbol_cache(symbol)
+            
+            # Keep the fills of open FVGs current with the new candles
+            fvg_fill_counts = update_open_fvg_fills(symbol, counts['touched_buckets']) if append else None
+            bump_dataset_version(symbol, candles=True)
+            
+            return jsonify({
+                'success': True,
+                'message': 'Data uploaded and processed successfully',
+                'mode': mode,
+                'candleCount': counts['inserted'],
+                'skippedCount': counts['skipped'],
+                'existingCount': counts['existing'],
+                'chunkCount': counts['chunks'],
+                'timeframeCounts': timeframe_counts,
+                'fvgFillCounts': fvg_fill_counts,
+                'ingestSeconds': round(ingest_seconds, 3),
+                'rowsPerSecond': round(counts['received'] / ingest_seconds, 1) if ingest_seconds > 0 else None
+            })
         
         except Exception as e:
             logger.error(f"Error processing upload: {str(e)}")
             db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+            status = 400 if isinstance(e, ValueError) else 500
+            if append is None or (not append and not cleared):
+                # Nothing was stored yet
+                return jsonify({'error': str(e)}), status
+            
+            # Chunks committed before the failure are already stored
+            error = str(e)
+            try:
+                if not append:
+                    # The old candles are gone, so drop the partial load rather than serve half a history
+                    Candle.query.filter_by(symbol=symbol).delete()
+                    db.session.commit()
+                    error += f". The upload was rolled back and {symbol} has no candles"
+                elif counts.get('inserted'):
+                    # Keep the new candles of the committed chunks consistent with the higher timeframes
+                    reaggregate_touched_buckets(symbol, counts['touched_buckets'])
+                    update_open_fvg_fills(symbol, counts['touched_buckets'])
+                    error += f". {counts['inserted']} new candles from earlier chunks were kept"
+            except Exception as cleanup_error:
+                db.session.rollback()
+                logger.error(f"Error cleaning up failed upload: {str(cleanup_error)}")
+                error += f". {symbol} may be partially loaded; upload the file again"
+            finally:
+                invalidate_symbol(symbol)
+                bump_dataset_version(symbol, candles=True)
+            
+            return jsonify({
+                'error': error,
+                'mode': 'append' if append else 'replace',
+                'candleCount': counts.get('inserted', 0) if append else 0
+            }), status
     
     @app.route('/api/candles', methods=['GET'])
+    @versioned_response
     def get_candles():
         try:
             symbol = request.args.get('symbol', 'EUR/USD')
             timeframe = request.args.get('timeframe', '1m')
             
+            # Optional window in epoch seconds, newest-candle limit and downsampling target
+            start = request.args.get('from', type=float)
+            end = request.args.get('to', type=float)
+            limit = request.args.get('limit', type=int)
+            max_points = request.args.get('maxPoints', type=int)
+            if (limit is not None and limit <= 0) or (max_points is not None and max_points <= 0):
+                return jsonify({'error': 'limit and maxPoints must be positive integers'}), 400
+            try:
+                columnar = columnar_requested()
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
             # Get candles for the specified symbol and timeframe
-            from models import TimeframeEnum
-            timeframe_enum = TimeframeEnum(timeframe)
-            candles = Candle.query.filter_by(symbol=symbol, timeframe=timeframe_enum).order_by(Candle.timestamp).all()
-            
-            candle_data = [{
-                'id': c.candle_id,
-                'time': c.timestamp.timestamp(),
-                'open': c.open_price,
-                'high': c.high_price,
-                'low': c.low_price,
-                'close': c.close_price,
-                'volume': c.volume
-            } for c in candles]
-            
-            return jsonify(candle_data)
+            columns, window = load_candle_columns(symbol, timeframe, start, end, limit, max_points)
+            
+            response = columns_response(columns, columnar, meta=window)
+            # Candles in the window and candles merged into each returned candle
+            response.headers['X-Window-Count'] = str(window['windowCount'])
+            response.headers['X-Bucket-Size'] = str(window['bucketSize'])
+            return response
         
         except Exception as e:
             logger.error(f"Error retrieving candles: {str(e)}")
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/chart', methods=['GET'])
+    @versioned_response
+    def get_chart():
+        try:
+            symbol = request.args.get('symbol', 'EUR/USD')
+            timeframe = request.args.get('timeframe', '1m')
+            
+            # Same window parameters as /api/candles
+            start = request.args.get('from', type=float)
+            end = request.args.get('to', type=float)
+            limit = request.args.get('limit', type=int)
+            max_points = request.args.get('maxPoints', type=int)
+            if (limit is not None and limit <= 0) or (max_points is not None and max_points <= 0):
+                return jsonify({'error': 'limit and maxPoints must be positive integers'}), 400
+            
+            # Overlays to include, all by default
+            include = request.args.get('include', 'patterns,fvgs,opportunities').split(',')
+            unknown = set(include) - {'', 'patterns', 'fvgs', 'opportunities'}
+            if unknown:
+                return jsonify({'error': f"Unknown overlay: {', '.join(sorted(unknown))}"}), 400
+            
+            if timeframe not in {tf.value for tf in TimeframeEnum}:
+                return jsonify({'error': f'Unsupported timeframe: {timeframe}'}), 400
+            
+            candles, window = load_candle_columns(symbol, timeframe, start, end, limit, max_points)
+            
+            # Patterns and FVGs are only analyzed on ANALYSIS_TIMEFRAMES, so other timeframes have none
+            analyzed = timeframe in ANALYSIS_TIMEFRAMES
+            
+            # Overlays cover the returned candles, which start later than from when limit applies
+            if len(candles['time']):
+                start = float(candles['time'][0])
+            
+            chart_data = {
+                'symbol': symbol,
+                'timeframe': timeframe,
+                'windowCount': window['windowCount'],
+                'bucketSize': window['bucketSize'],
+                'candles': columns_to_records(candles)
+            }
+            if 'patterns' in include:
+                chart_data['patterns'] = columns_to_records(load_pattern_columns(symbol, timeframe, start, end),
+                                                            PATTERN_CATEGORIES) if analyzed else []
+            if 'fvgs' in include:
+                chart_data['fvgs'] = columns_to_records(load_fvg_columns(symbol, timeframe, start, end),
+                                                        FVG_CATEGORIES, FVG_NULLABLE) if analyzed else []
+            if 'opportunities' in include:
+                chart_data['opportunities'] = columns_to_records(load_opportunity_columns(symbol, start, end),
+                                                                 OPPORTUNITY_CATEGORIES, OPPORTUNITY_NULLABLE)
+            
+            return jsonify(chart_data)
+        
+        except Exception as e:
+            logger.error(f"Error retrieving chart data: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    
     @app.route('/api/timeframes', methods=['GET'])
+    @versioned_response
     def get_timeframes():
         try:
             symbol = request.args.get('symbol', 'EUR/USD')
@@ -149,50 +339,55 @@ def register_routes(app):
     
     @app.route('/api/analyze/price-action', methods=['POST'])
     def analyze_price_action():
+        run_id = None
         try:
             data = request.json
             symbol = data.get('symbol', 'EUR/USD')
             timeframes = data.get('timeframes', ['5m', '15m', '30m'])
             pivot_tf = data.get('pivotTimeframe', '15m')
             
-            # Clear existing price action patterns
-            PriceActionPattern.query.delete()
-            db.session.commit()
+            # Store the patterns under a new run; earlier runs stay readable until it completes
+            run = start_run(symbol, AnalysisKindEnum.PRICE_ACTION, timeframes, {'pivotTimeframe': pivot_tf})
+            run_id = run.run_id
             
             # Identify price action patterns for each timeframe
             patterns_by_tf = {}
             for tf in timeframes:
-                patterns = identify_price_action_patterns(symbol, tf)
+                patterns = identify_price_action_patterns(symbol, tf, frame=get_candle_frame(symbol, tf),
+                                                          run_id=run_id)
                 patterns_by_tf[tf] = len(patterns)
                 logger.info(f"Identified {len(patterns)} patterns for {tf}")
             
             # Validate patterns using the pivot timeframe
-            validated_patterns = validate_patterns(symbol, pivot_tf, timeframes)
+            validated_count = validate_patterns(symbol, pivot_tf, timeframes, run_id=run_id)
             
             # Prepare the response
-            from models import ValidationStatusEnum, AnalysisTimeframeEnum, PatternTypeEnum
-            
-            validation_stats = {
-                'valid': PriceActionPattern.query.filter_by(validation_status=ValidationStatusEnum.VALID).count(),
-                'invalid': PriceActionPattern.query.filter_by(validation_status=ValidationStatusEnum.INVALID).count(),
-                'pending': PriceActionPattern.query.filter_by(validation_status=ValidationStatusEnum.PENDING).count()
-            }
-            
-            pattern_counts = {}
-            for tf in timeframes:
-                tf_enum = AnalysisTimeframeEnum(tf)
-                pattern_counts[tf] = {
-                    'HH': PriceActionPattern.query.filter_by(timeframe=tf_enum, pattern_type=PatternTypeEnum.HH).count(),
-                    'HL': PriceActionPattern.query.filter_by(timeframe=tf_enum, pattern_type=PatternTypeEnum.HL).count(),
-                    'LH': PriceActionPattern.query.filter_by(timeframe=tf_enum, pattern_type=PatternTypeEnum.LH).count(),
-                    'LL': PriceActionPattern.query.filter_by(timeframe=tf_enum, pattern_type=PatternTypeEnum.LL).count(),
-                    'BOS': PriceActionPattern.query.filter_by(timeframe=tf_enum, pattern_type=PatternTypeEnum.BOS).count(),
-                    'CHoCH': PriceActionPattern.query.filter_by(timeframe=tf_enum, pattern_type=PatternTypeEnum.CHOCH).count()
-                }
+            from models import ValidationStatusEnum, PatternTypeEnum
+            
+            counts = db.session.query(
+                PriceActionPattern.timeframe,
+                PriceActionPattern.pattern_type,
+                PriceActionPattern.validation_status,
+                func.count(PriceActionPattern.pattern_id)
+            ).filter(PriceActionPattern.run_id == run_id).group_by(
+                PriceActionPattern.timeframe,
+                PriceActionPattern.pattern_type,
+                PriceActionPattern.validation_status
+            ).all()
+            
+            validation_stats = {'valid': 0, 'invalid': 0, 'pending': 0}
+            pattern_counts = {tf: {pattern_type.value: 0 for pattern_type in PatternTypeEnum} for tf in timeframes}
+            for tf_enum, pattern_type, status, count in counts:
+                validation_stats[status.name.lower()] += count
+                if tf_enum.value in pattern_counts:
+                    pattern_counts[tf_enum.value][pattern_type.value] += count
+            
+            complete_run(run)
             
             return jsonify({
                 'success': True,
                 'message': 'Price action analysis completed',
+                'runId': run_id,
                 'patternsByTimeframe': patterns_by_tf,
                 'validationStats': validation_stats,
                 'patternCounts': pattern_counts
@@ -201,158 +396,202 @@ def register_routes(app):
         except Exception as e:
             logger.error(f"Error analyzing price action: {str(e)}")
             db.session.rollback()
+            if run_id is not None:
+                fail_run(run_id)
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/analyze/fvg', methods=['POST'])
     def analyze_fvg():
+        run_id = None
         try:
             data = request.json
             symbol = data.get('symbol', 'EUR/USD')
             timeframe = data.get('timeframe', '15m')
             
-            # Clear existing FVGs
-            FairValueGap.query.delete()
-            db.session.commit()
+            # FVGs are attached to the patterns of the latest price action run
+            pattern_run = latest_run(symbol, AnalysisKindEnum.PRICE_ACTION)
+            if pattern_run is None:
+                return jsonify({'error': f'Run price action analysis for {symbol} first'}), 400
+            
+            run = start_run(symbol, AnalysisKindEnum.FVG, [timeframe], parent_run_id=pattern_run.run_id)
+            run_id = run.run_id
             
             # Identify FVGs
-            fvgs = identify_fair_value_gaps(symbol, timeframe)
+            fvg_count = identify_fair_value_gaps(symbol, timeframe, frame=get_candle_frame(symbol, timeframe),
+                                                 run_id=run_id, pattern_run_id=pattern_run.run_id)
+            
+            complete_run(run)
             
             return jsonify({
                 'success': True,
-                'message': f'Identified {len(fvgs)} Fair Value Gaps for {timeframe}',
-                'fvgCount': len(fvgs)
+                'message': f'Identified {fvg_count} Fair Value Gaps for {timeframe}',
+                'runId': run_id,
+                'fvgCount': fvg_count
             })
         
         except Exception as e:
             logger.error(f"Error analyzing FVGs: {str(e)}")
             db.session.rollback()
+            if run_id is not None:
+                fail_run(run_id)
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/analyze/opportunities', methods=['POST'])
     def analyze_opportunities():
+        run_id = None
         try:
             data = request.json
             symbol = data.get('symbol', 'EUR/USD')
             choch_timeframe = data.get('chochTimeframe', '15m')
             fvg_timeframe = data.get('fvgTimeframe', '5m')
+            # Resolve candles that reach both the stop loss and the take profit on 1-minute candles
+            intrabar = bool(data.get('intrabar', False))
             
-            # Clear existing trade opportunities
-            TradeOpportunity.query.delete()
-            db.session.commit()
+            # Combine the latest FVG run with the price action run it was built from
+            fvg_run = latest_run(symbol, AnalysisKindEnum.FVG)
+            if fvg_run is None:
+                return jsonify({'error': f'Run FVG analysis for {symbol} first'}), 400
+            
+            run = start_run(symbol, AnalysisKindEnum.OPPORTUNITIES, [choch_timeframe, fvg_timeframe],
+                            {'chochTimeframe': choch_timeframe, 'fvgTimeframe': fvg_timeframe, 'intrabar': intrabar},
+                            parent_run_id=fvg_run.run_id)
+            run_id = run.run_id
             
             # Identify trade opportunities
-            opportunities = identify_trade_opportunities(symbol, choch_timeframe, fvg_timeframe)
+            opportunity_count = identify_trade_opportunities(symbol, choch_timeframe, fvg_timeframe, run_id=run_id,
+                                                             pattern_run_id=fvg_run.parent_run_id,
+                                                             fvg_run_id=fvg_run.run_id, intrabar=intrabar)
+            
+            complete_run(run)
             
             return jsonify({
                 'success': True,
-                'message': f'Identified {len(opportunities)} trade opportunities',
-                'opportunityCount': len(opportunities)
+                'message': f'Identified {opportunity_count} trade opportunities',
+                'runId': run_id,
+                'opportunityCount': opportunity_count
             })
         
         except Exception as e:
             logger.error(f"Error analyzing trade opportunities: {str(e)}")
             db.session.rollback()
+            if run_id is not None:
+                fail_run(run_id)
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/statistics/trades', methods=['GET'])
+    @versioned_response
     def get_trades_statistics():
         try:
-            stats = get_trade_statistics()
+            symbol = request.args.get('symbol', 'EUR/USD')
+            
+            # Statistics of the latest completed opportunities run
+            run = latest_run(symbol, AnalysisKindEnum.OPPORTUNITIES)
+            stats = get_trade_statistics(symbol, run.run_id if run else None)
+            stats['run'] = run_to_dict(run)
             return jsonify(stats)
         
         except Exception as e:
             logger.error(f"Error retrieving trade statistics: {str(e)}")
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/backtest', methods=['POST'])
+    def backtest():
+        try:
+            data = request.json
+            symbol = data.get('symbol', 'EUR/USD')
+            
+            # Every combination of the given values is simulated; nothing is stored
+            try:
+                grid = build_parameter_grid(
+                    data.get('riskRewardRatios', [2.0]),
+                    data.get('stopBuffers', [0.001]),
+                    data.get('chochTimeframes', ['15m']),
+                    data.get('fvgTimeframes', ['5m']),
+                    data.get('validation', [True])
+                )
+                result = run_backtest(symbol, grid, workers=data.get('workers'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            result['success'] = True
+            return jsonify(result)
+        
+        except Exception as e:
+            logger.error(f"Error running backtest: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    
+    @app.route('/api/analysis/runs', methods=['GET'])
+    @versioned_response
+    def get_analysis_runs():
+        try:
+            symbol = request.args.get('symbol', 'EUR/USD')
+            
+            runs = AnalysisRun.query.filter_by(symbol=symbol)\
+                .order_by(AnalysisRun.run_id.desc()).all()
+            
+            return jsonify([run_to_dict(run) for run in runs])
+        
+        except Exception as e:
+            logger.error(f"Error retrieving analysis runs: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    
     @app.route('/api/data/patterns', methods=['GET'])
+    @versioned_response
     def get_patterns():
         try:
             timeframe = request.args.get('timeframe', '15m')
             symbol = request.args.get('symbol', 'EUR/USD')
             
-            from models import AnalysisTimeframeEnum
-            tf_enum = AnalysisTimeframeEnum(timeframe)
-            
-            patterns = PriceActionPattern.query.join(Candle, PriceActionPattern.candle_id == Candle.candle_id)\
-                .filter(PriceActionPattern.timeframe == tf_enum, Candle.symbol == symbol)\
-                .order_by(Candle.timestamp).all()
-            
-            pattern_data = []
-            for p in patterns:
-                candle = Candle.query.get(p.candle_id)
-                pattern_data.append({
-                    'id': p.pattern_id,
-                    'type': p.pattern_type_str,
-                    'timeframe': p.timeframe_str,
-                    'status': p.validation_status_str,
-                    'timestamp': candle.timestamp.timestamp(),
-                    'price': candle.close_price
-                })
+            try:
+                columnar = columnar_requested()
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-            return jsonify(pattern_data)
+            # Serve the latest completed price action run
+            columns = load_pattern_columns(symbol, timeframe)
+            
+            return columns_response(columns, columnar, PATTERN_CATEGORIES)
         
         except Exception as e:
             logger.error(f"Error retrieving patterns: {str(e)}")
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/data/fvgs', methods=['GET'])
+    @versioned_response
     def get_fvgs():
         try:
             timeframe = request.args.get('timeframe', '15m')
             symbol = request.args.get('symbol', 'EUR/USD')
             
-            from models import AnalysisTimeframeEnum
-            tf_enum = AnalysisTimeframeEnum(timeframe)
-            
-            fvgs = FairValueGap.query.filter_by(timeframe=tf_enum)\
-                .join(Candle, FairValueGap.candle_start_id == Candle.candle_id)\
-                .filter(Candle.symbol == symbol)\
-                .order_by(Candle.timestamp).all()
+            try:
+                columnar = columnar_requested()
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-            fvg_data = []
-            for fvg in fvgs:
-                start_candle = Candle.query.get(fvg.candle_start_id)
-                end_candle = Candle.query.get(fvg.candle_end_id)
-                
-                fvg_data.append({
-                    'id': fvg.fvg_id,
-                    'timeframe': fvg.timeframe_str,
-                    'startTime': start_candle.timestamp.timestamp(),
-                    'endTime': end_candle.timestamp.timestamp(),
-                    'startPrice': fvg.start_price,
-                    'endPrice': fvg.end_price,
-                    'fillPercentage': fvg.fill_percentage
-                })
+            # Serve the latest completed FVG run
+            columns = load_fvg_columns(symbol, timeframe)
             
-            return jsonify(fvg_data)
+            return columns_response(columns, columnar, FVG_CATEGORIES, FVG_NULLABLE)
         
         except Exception as e:
             logger.error(f"Error retrieving FVGs: {str(e)}")
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/data/opportunities', methods=['GET'])
+    @versioned_response
     def get_opportunities():
         try:
-            opportunities = TradeOpportunity.query.order_by(TradeOpportunity.creation_time).all()
+            symbol = request.args.get('symbol', 'EUR/USD')
             
-            opportunity_data = []
-            for opp in opportunities:
-                pattern = PriceActionPattern.query.get(opp.choch_pattern_id)
-                fvg = FairValueGap.query.get(opp.fvg_id)
-                
-                opportunity_data.append({
-                    'id': opp.opportunity_id,
-                    'status': opp.status_str,
-                    'entryPrice': opp.entry_price,
-                    'stopLoss': opp.stop_loss,
-                    'takeProfit': opp.take_profit,
-                    'creationTime': opp.creation_time.timestamp(),
-                    'patternType': pattern.pattern_type_str,
-                    'patternTimeframe': pattern.timeframe_str,
-                    'fvgTimeframe': fvg.timeframe_str
-                })
+            try:
+                columnar = columnar_requested()
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            # Serve the latest completed opportunities run
+            columns = load_opportunity_columns(symbol)
             
-            return jsonify(opportunity_data)
+            return columns_response(columns, columnar, OPPORTUNITY_CATEGORIES, OPPORTUNITY_NULLABLE)
         
         except Exception as e:
             logger.error(f"Error retrieving trade opportunities: {str(e)}")
@@ -366,6 +605,8 @@ def register_routes(app):
             
             # Run the linking function
             success = link_unlinked_timeframes(symbol)
+            rebuild_symbol_cache(symbol)
+            bump_dataset_version(symbol)
             
             # Count linked candles for each timeframe
             timeframes = ['5m', '15m', '30m', '1H', '4H']
@@ -0,0 +1,71 @@
+"""
+Market Analyzer - Backtests
+
+Sweeps the trade pipeline over a grid of parameters for one symbol and
+prints the combinations ranked by expectancy. Uses the candles and the
+latest price action run stored in the database at DATABASE_URL and writes
+nothing back.
+
+Usage:
+    python backtest.py EURUSD --risk-reward 1.5 2 3 --stop-buffer 0.0005 0.001 \\
+        --choch-timeframe 15m 30m --fvg-timeframe 5m --validation on off --workers 4
+"""
+import argparse
+import sys
+
+RESULT_COLUMNS = (
+    ('rank', 'Rank', '{}'),
+    ('riskRewardRatio', 'RR', '{:g}'),
+    ('stopBuffer', 'Buffer', '{:g}'),
+    ('chochTimeframe', 'CHoCH', '{}'),
+    ('fvgTimeframe', 'FVG', '{}'),
+    ('validation', 'Valid only', '{}'),
+    ('tradeCount', 'Closed', '{}'),
+    ('winRate', 'Win %', '{:.2f}'),
+    ('expectancy', 'Expectancy R', '{:.4f}'),
+    ('maxDrawdown', 'Max DD R', '{:.4f}')
+)
+
+
+def print_results(results, top):
+    rows = [[fmt.format(result[key]) for key, _, fmt in RESULT_COLUMNS] for result in results[:top]]
+    widths = [max([len(title)] + [len(row[i]) for row in rows]) for i, (_, title, _) in enumerate(RESULT_COLUMNS)]
+    print('  '.join(title.rjust(width) for (_, title, _), width in zip(RESULT_COLUMNS, widths)))
+    for row in rows:
+        print('  '.join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Market Analyzer parameter sweep backtest')
+    parser.add_argument('symbol')
+    parser.add_argument('--risk-reward', type=float, nargs='+', default=[2.0], help='risk-reward ratios')
+    parser.add_argument('--stop-buffer', type=float, nargs='+', default=[0.001],
+                        help='stop loss buffers beyond the FVG, as fractions of the price')
+    parser.add_argument('--choch-timeframe', nargs='+', default=['15m'], help='CHoCH timeframes')
+    parser.add_argument('--fvg-timeframe', nargs='+', default=['5m'], help='FVG timeframes')
+    parser.add_argument('--validation', choices=['on', 'off'], nargs='+', default=['on'],
+                        help="'on' trades only valid CHoCH patterns, 'off' all of them")
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--top', type=int, default=20, help='number of ranked combinations to print')
+    args = parser.parse_args()
+
+    from app import app
+    from services.backtest_service import build_parameter_grid, run_backtest
+
+    with app.app_context():
+        try:
+            grid = build_parameter_grid(args.risk_reward, args.stop_buffer, args.choch_timeframe,
+                                        args.fvg_timeframe, [flag == 'on' for flag in args.validation])
+            result = run_backtest(args.symbol, grid, workers=args.workers)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+
+    print(f"{result['symbol']}: {result['combinationCount']} combinations on {result['workers']} workers "
+          f"(price action run {result['priceActionRunId']})")
+    print_results(result['results'], args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,430 @@
+"""
+Market Analyzer - Benchmarks
+
+Times the optimized service paths against the implementations they replaced
+on synthetic 1-minute data. Runs against a scratch SQLite database unless
+--database-url is given.
+
+Usage:
+    python benchmark.py aggregation --rows 20000
+    python benchmark.py swings --rows 500000
+    python benchmark.py fvgs --rows 20000
+    python benchmark.py trades --rows 200000
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+BENCH_SYMBOL = 'BENCH'
+
+# Timeframes the recursive reference generator walks through, in order
+HIGHER_TIMEFRAMES = ['5m', '15m', '30m', '1H', '4H']
+
+
+def make_candle_frame(rows, seed=0):
+    """
+    Generate a random-walk 1-minute candle frame in the CSV upload layout
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2024-01-01', periods=rows, freq='min')
+    close = 1.1 + np.cumsum(rng.normal(0, 0.0002, rows))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) + rng.random(rows) * 0.0003
+    low = np.minimum(open_, close) - rng.random(rows) * 0.0003
+
+    return pd.DataFrame({
+        'timestamp': timestamps,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.integers(1, 200, rows)
+    })
+
+
+def timed(func, *args, **kwargs):
+    """
+    Run func once and return its result and the elapsed seconds
+    """
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def report(name, baseline_seconds, optimized_seconds):
+    speedup = baseline_seconds / optimized_seconds if optimized_seconds > 0 else float('inf')
+    print(f"{name}: baseline {baseline_seconds:.3f}s, optimized {optimized_seconds:.3f}s, "
+          f"speedup {speedup:.1f}x")
+
+
+def ingest_candle_frame(df):
+    """
+    Store a frame from make_candle_frame as the 1-minute candles of the
+    benchmark symbol, through the upload's streaming ingest
+    """
+    from services.candle_service import ingest_csv_stream
+
+    return ingest_csv_stream(io.StringIO(df.to_csv(index=False)), BENCH_SYMBOL)
+
+
+def reset_symbol(db, Candle):
+    Candle.query.filter_by(symbol=BENCH_SYMBOL).update({Candle.parent_candle_id: None})
+    Candle.query.filter_by(symbol=BENCH_SYMBOL).delete()
+    db.session.commit()
+
+
+def reference_higher_timeframe_candles(symbol, timeframe):
+    """
+    The recursive generator the upload route used before the cascade: builds
+    one timeframe from the 1-minute candles as ORM objects, links them and
+    recurses into the next timeframe, reloading the 1-minute candles each time
+    """
+    from app import db
+    from models import Candle, TimeframeEnum, TIMEFRAME_MINUTES, epoch_bucket_key, bucket_start_time
+    from services.candle_service import link_timeframe_pair
+
+    one_min_candles = Candle.query.filter_by(symbol=symbol, timeframe=TimeframeEnum.M1).order_by(Candle.timestamp).all()
+    timeframe_enum = TimeframeEnum(timeframe)
+    interval = timedelta(minutes=TIMEFRAME_MINUTES[timeframe_enum])
+
+    higher_tf_candles = []
+    if one_min_candles:
+        current_time = bucket_start_time(epoch_bucket_key(one_min_candles[0].timestamp, timeframe_enum),
+                                         timeframe_enum)
+        current_group = []
+        for candle in one_min_candles:
+            next_time = current_time + interval
+            if candle.timestamp >= next_time:
+                if current_group:
+                    higher_tf_candles.append(reference_aggregated_candle(current_group, symbol, timeframe_enum,
+                                                                         current_time))
+                while candle.timestamp >= next_time:
+                    current_time = next_time
+                    next_time = current_time + interval
+                current_group = [candle]
+            else:
+                current_group.append(candle)
+
+        if current_group:
+            higher_tf_candles.append(reference_aggregated_candle(current_group, symbol, timeframe_enum, current_time))
+
+    db.session.add_all(higher_tf_candles)
+    db.session.commit()
+
+    link_timeframe_pair(symbol, TimeframeEnum.M1, timeframe_enum, only_unlinked=False)
+    db.session.commit()
+
+    if timeframe_enum != TimeframeEnum.H4:
+        reference_higher_timeframe_candles(symbol, HIGHER_TIMEFRAMES[HIGHER_TIMEFRAMES.index(timeframe) + 1])
+
+    return higher_tf_candles
+
+
+def reference_aggregated_candle(candles, symbol, timeframe_enum, start_time):
+    """
+    One higher timeframe candle from a group of lower timeframe candles
+    """
+    from models import Candle
+
+    return Candle(
+        symbol=symbol,
+        timeframe=timeframe_enum,
+        open_price=candles[0].open_price,
+        close_price=candles[-1].close_price,
+        high_price=max(c.high_price for c in candles),
+        low_price=min(c.low_price for c in candles),
+        volume=sum(c.volume for c in candles),
+        timestamp=start_time
+    )
+
+
+def bench_aggregation(args):
+    """
+    Recursive per-timeframe generation versus the single-pass cascade
+    """
+    from app import db
+    from models import Candle
+    from services.candle_service import aggregate_timeframe_cascade
+
+    df = make_candle_frame(args.rows)
+
+    reset_symbol(db, Candle)
+    ingest_candle_frame(df)
+    _, baseline_seconds = timed(reference_higher_timeframe_candles, BENCH_SYMBOL, HIGHER_TIMEFRAMES[0])
+
+    reset_symbol(db, Candle)
+    ingest_candle_frame(df)
+    _, optimized_seconds = timed(aggregate_timeframe_cascade, BENCH_SYMBOL)
+
+    reset_symbol(db, Candle)
+    report(f"aggregation ({args.rows} 1m rows)", baseline_seconds, optimized_seconds)
+
+
+def reference_swing_patterns(high, low):
+    """
+    The per-candle swing loop identify_price_action_patterns used to run
+    """
+    from models import PatternTypeEnum
+
+    positions, pattern_types = [], []
+    for i in range(2, len(high) - 2):
+        if (high[i] > high[i-1] and high[i] > high[i-2] and
+                high[i] > high[i+1] and high[i] > high[i+2]):
+            prev_high = None
+            for j in range(i-3, max(0, i-20), -1):
+                if (high[j] > high[j-1] and high[j] > high[j-2] and
+                        high[j] > high[j+1] and high[j] > high[j+2]):
+                    prev_high = j
+                    break
+
+            if prev_high is not None:
+                if high[i] > high[prev_high]:
+                    positions.append(i)
+                    pattern_types.append(PatternTypeEnum.HH)
+                elif high[i] < high[prev_high]:
+                    positions.append(i)
+                    pattern_types.append(PatternTypeEnum.LH)
+
+        if (low[i] < low[i-1] and low[i] < low[i-2] and
+                low[i] < low[i+1] and low[i] < low[i+2]):
+            prev_low = None
+            for j in range(i-3, max(0, i-20), -1):
+                if (low[j] < low[j-1] and low[j] < low[j-2] and
+                        low[j] < low[j+1] and low[j] < low[j+2]):
+                    prev_low = j
+                    break
+
+            if prev_low is not None:
+                if low[i] < low[prev_low]:
+                    positions.append(i)
+                    pattern_types.append(PatternTypeEnum.LL)
+                elif low[i] > low[prev_low]:
+                    positions.append(i)
+                    pattern_types.append(PatternTypeEnum.HL)
+
+    return positions, pattern_types
+
+
+def reference_choch_positions(swing_positions, swing_types, min_bars=5):
+    """
+    The nested CHoCH loop identify_price_action_patterns used to run, on
+    candle positions instead of timestamps
+    """
+    from models import PatternTypeEnum
+
+    changes = {(PatternTypeEnum.HH, PatternTypeEnum.LH), (PatternTypeEnum.HL, PatternTypeEnum.LL),
+               (PatternTypeEnum.LH, PatternTypeEnum.HH), (PatternTypeEnum.LL, PatternTypeEnum.HL)}
+    choch_positions = set()
+    for i in range(len(swing_positions)):
+        for j in range(i + 1, len(swing_positions)):
+            # Check if next pattern is at least min_bars candles later
+            if swing_positions[j] - swing_positions[i] < min_bars:
+                continue
+            if (swing_types[i], swing_types[j]) in changes:
+                choch_positions.add(swing_positions[j])
+
+    return sorted(choch_positions)
+
+
+def bench_swings(args):
+    """
+    Per-candle swing loop versus the vectorized swing detection, with a
+    parity check on random, tied and very short series; CHoCH detection is
+    checked against the original nested loop on the same swings
+    """
+    from models import PatternTypeEnum
+    from services.price_action_service import find_swing_patterns, find_choch_positions
+
+    # A flip that is too close does not hide a later swing of the same type,
+    # and an older swing of the opposite type still counts
+    hh, lh = PatternTypeEnum.HH, PatternTypeEnum.LH
+    assert find_choch_positions([10, 13, 30], [hh, lh, lh]).tolist() == [30]
+    assert find_choch_positions([0, 8, 10], [hh, hh, lh]).tolist() == [10]
+
+    for seed in range(24):
+        rows = [5, 6, 7, 25, 300, 2000][seed % 6]
+        df = make_candle_frame(rows, seed=seed)
+        for decimals in (None, 4):
+            high, low = df['high'].to_numpy(), df['low'].to_numpy()
+            if decimals:
+                # Rounded prices produce equal swings
+                high, low = high.round(decimals), low.round(decimals)
+            positions, pattern_types = find_swing_patterns(high, low)
+            expected = reference_swing_patterns(high.tolist(), low.tolist())
+            assert (positions.tolist(), pattern_types.tolist()) == expected, \
+                f"swing mismatch for seed {seed}, {rows} rows"
+            assert find_choch_positions(positions, pattern_types).tolist() == \
+                reference_choch_positions(*expected), f"CHoCH mismatch for seed {seed}, {rows} rows"
+    print("swings: vectorized output matches the reference loop")
+
+    df = make_candle_frame(args.rows)
+    high, low = df['high'].to_numpy(), df['low'].to_numpy()
+    expected, baseline_seconds = timed(reference_swing_patterns, high.tolist(), low.tolist())
+    (positions, pattern_types), optimized_seconds = timed(find_swing_patterns, high, low)
+    # The nested CHoCH loop is quadratic, so it is only compared on the parity series
+    assert (positions.tolist(), pattern_types.tolist()) == expected
+
+    report(f"swings ({args.rows} candles, {len(positions)} swings)", baseline_seconds, optimized_seconds)
+
+
+def reference_fair_value_gaps(high, low):
+    """
+    The per-window FVG loop and per-gap fill scan identify_fair_value_gaps
+    used to run, without the pattern lookup
+    """
+    gaps = []
+    for i in range(len(high) - 2):
+        if low[i] > high[i + 2]:
+            gaps.append((i, low[i], high[i + 2]))
+        if low[i + 2] > high[i]:
+            gaps.append((i, low[i + 2], high[i]))
+
+    fills = []
+    for i, start_price, end_price in gaps:
+        gap_size = abs(start_price - end_price)
+        max_penetration = 0.0
+        for candle_low, candle_high in zip(low[i + 3:], high[i + 3:]):
+            if start_price > end_price:
+                if candle_low < start_price:
+                    max_penetration = max(max_penetration, min(start_price - candle_low, gap_size))
+            elif candle_high > start_price:
+                max_penetration = max(max_penetration, min(candle_high - start_price, gap_size))
+        fills.append(max_penetration / gap_size * 100.0 if gap_size else 100.0)
+
+    return gaps, fills
+
+
+def bench_fvgs(args):
+    """
+    Per-window FVG detection and fill scan versus the vectorized versions
+    """
+    from services.fvg_service import find_fair_value_gaps, calculate_fvg_fills
+    from services.range_index import RangeExtremeIndex
+
+    def vectorized(high, low):
+        positions, start_prices, end_prices = find_fair_value_gaps(high, low)
+        fills, _, _ = calculate_fvg_fills(start_prices, end_prices, RangeExtremeIndex(low, 'min'),
+                                          RangeExtremeIndex(high, 'max'), positions + 2)
+        return list(zip(positions.tolist(), start_prices.tolist(), end_prices.tolist())), fills.tolist()
+
+    df = make_candle_frame(args.rows)
+    high, low = df['high'].to_numpy(), df['low'].to_numpy()
+    expected, baseline_seconds = timed(reference_fair_value_gaps, high.tolist(), low.tolist())
+    result, optimized_seconds = timed(vectorized, high, low)
+    assert result == expected, "FVG mismatch between the vectorized and reference implementations"
+    print("fvgs: vectorized output matches the reference loop")
+
+    report(f"fvgs ({args.rows} candles, {len(result[0])} gaps)", baseline_seconds, optimized_seconds)
+
+
+def reference_trade_outcomes(low, high, signal_positions, entry_prices, stop_losses, take_profits):
+    """
+    The per-trade candle walk simulate_trade_outcomes used to run, returning
+    status names and exit rows
+    """
+    outcomes = []
+    for position, entry_price, stop_loss, take_profit in zip(signal_positions, entry_prices,
+                                                             stop_losses, take_profits):
+        status, exit_position = 'EXECUTED', -1
+        if position + 1 >= len(low):
+            outcomes.append(('PENDING', -1))
+            continue
+        for i in range(position + 1, len(low)):
+            if take_profit > entry_price:
+                if low[i] <= stop_loss:
+                    status, exit_position = 'LOSS', i
+                    break
+                if high[i] >= take_profit:
+                    status, exit_position = 'WIN', i
+                    break
+            else:
+                if high[i] >= stop_loss:
+                    status, exit_position = 'LOSS', i
+                    break
+                if low[i] <= take_profit:
+                    status, exit_position = 'WIN', i
+                    break
+        outcomes.append((status, exit_position))
+
+    return outcomes
+
+
+def bench_trades(args):
+    """
+    Per-trade candle walk versus the vectorized first-touch simulation, on
+    one trade per 20 candles with levels around the signal close
+    """
+    from services.candle_store import CandleFrame
+    from services.trade_service import simulate_trade_outcomes
+
+    df = make_candle_frame(args.rows)
+    low, high, close = df['low'].to_numpy(), df['high'].to_numpy(), df['close'].to_numpy()
+    frame = CandleFrame(BENCH_SYMBOL, None, np.arange(args.rows, dtype=np.int64),
+                        df['timestamp'].to_numpy(dtype='datetime64[s]'), df['open'].to_numpy(), high, low,
+                        close, df['volume'].to_numpy(), np.arange(args.rows, dtype=np.int64))
+
+    rng = np.random.default_rng(1)
+    signal_positions = np.arange(0, args.rows, 20)
+    entry_prices = close[signal_positions]
+    risks = rng.uniform(0.0005, 0.003, len(signal_positions))
+    direction = np.where(rng.random(len(signal_positions)) < 0.5, 1.0, -1.0)
+    stop_losses = entry_prices - direction * risks
+    take_profits = entry_prices + direction * risks * 2
+
+    def vectorized():
+        statuses, exit_positions = simulate_trade_outcomes(frame, signal_positions, entry_prices,
+                                                           stop_losses, take_profits)
+        return [(status.name, position) for status, position in zip(statuses, exit_positions.tolist())]
+
+    expected, baseline_seconds = timed(reference_trade_outcomes, low.tolist(), high.tolist(),
+                                       signal_positions.tolist(), entry_prices.tolist(),
+                                       stop_losses.tolist(), take_profits.tolist())
+    result, optimized_seconds = timed(vectorized)
+    assert result == expected, "trade outcome mismatch between the vectorized and reference simulations"
+    print("trades: vectorized outcomes match the reference loop")
+
+    report(f"trades ({args.rows} candles, {len(signal_positions)} trades)", baseline_seconds, optimized_seconds)
+
+
+BENCHMARKS = {
+    'aggregation': bench_aggregation,
+    'fvgs': bench_fvgs,
+    'swings': bench_swings,
+    'trades': bench_trades
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Market Analyzer benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument('--rows', type=int, default=5000, help='number of synthetic 1-minute candles')
+    parser.add_argument('--database-url', help='database to run against (default: scratch SQLite file)')
+    args = parser.parse_args()
+
+    scratch_dir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        scratch_dir = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch_dir.name, 'benchmark.db')}"
+
+    from app import app
+
+    names = sorted(BENCHMARKS) if args.benchmark == 'all' else [args.benchmark]
+    with app.app_context():
+        for name in names:
+            BENCHMARKS[name](args)
+
+    if scratch_dir:
+        scratch_dir.cleanup()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
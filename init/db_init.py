@@ -24,6 +24,42 @@ def get_database_url():
     # Use PostgreSQL from environment variables
     return os.environ.get("DATABASE_URL")
 
+def upgrade_schema():
+    """Bring an existing database up to date with the application models"""
+    from app import app, db
+    from models import Candle
+    from services.candle_service import backfill_bucket_keys, link_unlinked_timeframes
+    from services.analysis_run_service import delete_unassigned_results
+    from init.schema import (add_missing_columns, find_missing_indexes, create_missing_indexes,
+                             remove_duplicate_candles)
+    
+    with app.app_context():
+        added = add_missing_columns(db.engine, db.metadata)
+        if added:
+            print(f"Added columns: {', '.join(added)}")
+        
+        # Results from before analysis runs have no run and are never served
+        deleted = delete_unassigned_results()
+        if deleted:
+            print(f"Removed {deleted} analysis results stored without an analysis run.")
+        
+        updated = backfill_bucket_keys()
+        if updated:
+            print(f"Backfilled bucket keys for {updated} candles.")
+        
+        # The unique candle index cannot be built while duplicates exist
+        missing = {index.name for index in find_missing_indexes(db.engine, db.metadata)}
+        if 'uq_candles_symbol_timeframe_timestamp' in missing:
+            removed = remove_duplicate_candles(db.engine)
+            if removed:
+                print(f"Removed {removed} duplicate candles.")
+                for (symbol,) in db.session.query(Candle.symbol).distinct():
+                    link_unlinked_timeframes(symbol)
+        
+        created = create_missing_indexes(db.engine, db.metadata)
+        if created:
+            print(f"Created indexes: {', '.join(created)}")
+
 def init_database():
     """Initialize database connection and create tables"""
     # Get the app and db instances
@@ -63,6 +99,7 @@ def main():
     while retry_count < max_retries:
         try:
             init_database()
+            upgrade_schema()
             print("Database initialization successful.")
             return
         except sqlalchemy.exc.OperationalError as e:
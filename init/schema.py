@@ -0,0 +1,105 @@
+"""
+Schema inspection and upgrade helpers
+
+db.create_all() only creates missing tables. These helpers compare an existing
+database against the application models and add the columns and indexes that
+were introduced after the database was first created.
+"""
+import sqlalchemy
+
+def find_missing_columns(engine, metadata):
+    """
+    Return the model columns missing from existing tables as (table, column) pairs
+    """
+    inspector = sqlalchemy.inspect(engine)
+    existing_tables = inspector.get_table_names()
+    missing = []
+    
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                missing.append((table, column))
+    
+    return missing
+
+def add_missing_columns(engine, metadata):
+    """
+    Add nullable model columns that are missing from existing tables.
+
+    Returns the list of "table.column" names that were added. Missing
+    NOT NULL columns cannot be added without a default and are skipped.
+    """
+    added = []
+    
+    with engine.begin() as connection:
+        for table, column in find_missing_columns(engine, metadata):
+            if not column.nullable:
+                continue
+            
+            column_type = column.type.compile(dialect=engine.dialect)
+            connection.execute(sqlalchemy.text(
+                f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            ))
+            added.append(f"{table.name}.{column.name}")
+    
+    return added
+
+def find_missing_indexes(engine, metadata):
+    """
+    Return the model indexes that do not exist in the database
+    """
+    inspector = sqlalchemy.inspect(engine)
+    existing_tables = inspector.get_table_names()
+    missing = []
+    
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                missing.append(index)
+    
+    return missing
+
+def remove_duplicate_candles(engine):
+    """
+    Delete candles that repeat an earlier (symbol, timeframe, timestamp) row.
+
+    The oldest row of each group is kept. Children pointing at a removed
+    duplicate are unlinked first so the cascading foreign key does not delete
+    them; they can be relinked afterwards. Returns the number of rows deleted.
+    """
+    keep = (
+        'SELECT MIN(candle_id) FROM candles '
+        'GROUP BY symbol, timeframe, timestamp'
+    )
+    
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            f'UPDATE candles SET parent_candle_id = NULL '
+            f'WHERE parent_candle_id IS NOT NULL AND parent_candle_id NOT IN ({keep})'
+        ))
+        result = connection.execute(sqlalchemy.text(
+            f'DELETE FROM candles WHERE candle_id NOT IN ({keep})'
+        ))
+    
+    return result.rowcount
+
+def create_missing_indexes(engine, metadata):
+    """
+    Create the model indexes that do not exist in the database.
+
+    Returns the names of the indexes that were created.
+    """
+    missing = find_missing_indexes(engine, metadata)
+    
+    for index in missing:
+        index.create(engine)
+    
+    return [index.name for index in missing]
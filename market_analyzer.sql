@@ -5,6 +5,8 @@
 DROP TABLE IF EXISTS trade_opportunities;
 DROP TABLE IF EXISTS fair_value_gaps;
 DROP TABLE IF EXISTS price_action_patterns;
+DROP TABLE IF EXISTS analysis_runs;
+DROP TABLE IF EXISTS dataset_versions;
 DROP TABLE IF EXISTS candles;
 
 -- Create Candles table
@@ -18,16 +20,38 @@ CREATE TABLE candles (
     low_price FLOAT NOT NULL,
     volume INTEGER NOT NULL,
     timestamp TIMESTAMP NOT NULL,
+    bucket_key BIGINT,
     parent_candle_id INTEGER REFERENCES candles(candle_id) ON DELETE CASCADE
 );
 
+-- Create Dataset Versions table
+CREATE TABLE dataset_versions (
+    symbol VARCHAR(10) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create Analysis Runs table
+CREATE TABLE analysis_runs (
+    run_id SERIAL PRIMARY KEY,
+    symbol VARCHAR(10) NOT NULL,
+    kind_str VARCHAR(20) NOT NULL,
+    timeframes JSON NOT NULL,
+    parameters JSON,
+    status_str VARCHAR(10) NOT NULL DEFAULT 'Running',
+    parent_run_id INTEGER REFERENCES analysis_runs(run_id) ON DELETE CASCADE,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
 -- Create Price Action Patterns table
 CREATE TABLE price_action_patterns (
     pattern_id SERIAL PRIMARY KEY,
     candle_id INTEGER NOT NULL REFERENCES candles(candle_id) ON DELETE CASCADE,
     pattern_type_str VARCHAR(10) NOT NULL,
     timeframe_str VARCHAR(10) NOT NULL,
-    validation_status_str VARCHAR(10) NOT NULL DEFAULT 'Pending'
+    validation_status_str VARCHAR(10) NOT NULL DEFAULT 'Pending',
+    run_id INTEGER REFERENCES analysis_runs(run_id) ON DELETE CASCADE
 );
 
 -- Create Fair Value Gaps table
@@ -39,7 +63,10 @@ CREATE TABLE fair_value_gaps (
     start_price FLOAT NOT NULL,
     end_price FLOAT NOT NULL,
     fill_percentage FLOAT NOT NULL DEFAULT 0.0,
-    timeframe_str VARCHAR(10) NOT NULL
+    half_fill_candle_id INTEGER REFERENCES candles(candle_id) ON DELETE SET NULL,
+    full_fill_candle_id INTEGER REFERENCES candles(candle_id) ON DELETE SET NULL,
+    timeframe_str VARCHAR(10) NOT NULL,
+    run_id INTEGER REFERENCES analysis_runs(run_id) ON DELETE CASCADE
 );
 
 -- Create Trade Opportunities table
@@ -51,17 +78,31 @@ CREATE TABLE trade_opportunities (
     stop_loss FLOAT NOT NULL,
     take_profit FLOAT NOT NULL,
     status_str VARCHAR(10) NOT NULL DEFAULT 'Pending',
-    creation_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    creation_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    exit_candle_id INTEGER REFERENCES candles(candle_id) ON DELETE SET NULL,
+    exit_time TIMESTAMP,
+    holding_bars INTEGER,
+    run_id INTEGER REFERENCES analysis_runs(run_id) ON DELETE CASCADE
 );
 
 -- Create indexes for better query performance
 CREATE INDEX idx_candles_symbol_timeframe ON candles(symbol, timeframe_str);
+CREATE UNIQUE INDEX uq_candles_symbol_timeframe_timestamp ON candles(symbol, timeframe_str, timestamp);
 CREATE INDEX idx_candles_timestamp ON candles(timestamp);
+CREATE INDEX ix_candles_symbol_timeframe_bucket ON candles(symbol, timeframe_str, bucket_key);
 CREATE INDEX idx_candles_parent ON candles(parent_candle_id);
 CREATE INDEX idx_patterns_candle ON price_action_patterns(candle_id);
 CREATE INDEX idx_patterns_type_timeframe ON price_action_patterns(pattern_type_str, timeframe_str);
 CREATE INDEX idx_fvg_pattern ON fair_value_gaps(pattern_id);
+CREATE INDEX idx_fvg_candle_start ON fair_value_gaps(candle_start_id);
+CREATE INDEX idx_fvg_candle_end ON fair_value_gaps(candle_end_id);
 CREATE INDEX idx_fvg_timeframe ON fair_value_gaps(timeframe_str);
 CREATE INDEX idx_trades_pattern ON trade_opportunities(choch_pattern_id);
 CREATE INDEX idx_trades_fvg ON trade_opportunities(fvg_id);
-CREATE INDEX idx_trades_status ON trade_opportunities(status_str);
\ No newline at end of file
+CREATE INDEX idx_trades_status ON trade_opportunities(status_str);
+CREATE INDEX idx_trades_creation_time ON trade_opportunities(creation_time);
+CREATE INDEX ix_analysis_runs_symbol_kind_status ON analysis_runs(symbol, kind_str, status_str);
+CREATE INDEX ix_analysis_runs_parent_run_id ON analysis_runs(parent_run_id);
+CREATE INDEX ix_price_action_patterns_run_id ON price_action_patterns(run_id);
+CREATE INDEX ix_fair_value_gaps_run_id ON fair_value_gaps(run_id);
+CREATE INDEX ix_trade_opportunities_run_id ON trade_opportunities(run_id);
\ No newline at end of file
@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import calendar
 import enum
 from sqlalchemy import String, DateTime, Float, Integer, ForeignKey
 from app import db
@@ -12,6 +13,40 @@ class TimeframeEnum(enum.Enum):
     H1 = '1H'
     H4 = '4H'
 
+# Length of each candle timeframe in minutes
+TIMEFRAME_MINUTES = {
+    TimeframeEnum.M1: 1,
+    TimeframeEnum.M5: 5,
+    TimeframeEnum.M15: 15,
+    TimeframeEnum.M30: 30,
+    TimeframeEnum.H1: 60,
+    TimeframeEnum.H4: 240
+}
+
+def epoch_bucket_key(timestamp, timeframe_enum):
+    """
+    Integer bucket key of a timestamp in a timeframe: whole minutes since the
+    Unix epoch divided by the timeframe length. A candle and every lower
+    timeframe candle it contains share the same key in its timeframe.
+    """
+    epoch_minutes = calendar.timegm(timestamp.timetuple()) // 60
+    return epoch_minutes // TIMEFRAME_MINUTES[timeframe_enum]
+
+def bucket_start_time(bucket_key, timeframe_enum):
+    """
+    Naive timestamp at which the bucket with the given key starts
+    """
+    return datetime(1970, 1, 1) + timedelta(minutes=bucket_key * TIMEFRAME_MINUTES[timeframe_enum])
+
+def _default_bucket_key(context):
+    params = context.get_current_parameters()
+    timeframe = params.get('timeframe')
+    if params.get('timestamp') is None or timeframe is None:
+        return None
+    if not isinstance(timeframe, TimeframeEnum):
+        timeframe = TimeframeEnum[timeframe]
+    return epoch_bucket_key(params['timestamp'], timeframe)
+
 class AnalysisTimeframeEnum(enum.Enum):
     M5 = '5m'
     M15 = '15m'
@@ -31,6 +66,16 @@ class ValidationStatusEnum(enum.Enum):
     INVALID = 'Invalid'
     PENDING = 'Pending'
 
+class AnalysisKindEnum(enum.Enum):
+    PRICE_ACTION = 'price-action'
+    FVG = 'fvg'
+    OPPORTUNITIES = 'opportunities'
+
+class RunStatusEnum(enum.Enum):
+    RUNNING = 'Running'
+    COMPLETED = 'Completed'
+    FAILED = 'Failed'
+
 class TradeStatusEnum(enum.Enum):
     PENDING = 'Pending'
     EXECUTED = 'Executed'
@@ -50,6 +95,14 @@ class Candle(db.Model):
     low_price = db.Column(db.Float, nullable=False)
     volume = db.Column(db.Integer, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False)
+    # Epoch-aligned bucket of the candle in its own timeframe, see epoch_bucket_key()
+    bucket_key = db.Column(db.BigInteger, nullable=True, default=_default_bucket_key)
+    
+    __table_args__ = (
+        db.Index('uq_candles_symbol_timeframe_timestamp', 'symbol', 'timeframe', 'timestamp', unique=True),
+        db.Index('ix_candles_symbol_timeframe_bucket', 'symbol', 'timeframe', 'bucket_key'),
+        db.Index('ix_candles_parent_candle_id', 'parent_candle_id'),
+    )
     
     @property
     def timeframe_str(self):
@@ -81,6 +134,51 @@ class Candle(db.Model):
         return f"<Candle {self.symbol} {self.timeframe_str} {self.timestamp}>"
 
 
+class DatasetVersion(db.Model):
+    __tablename__ = 'dataset_versions'
+    
+    # Bumped whenever a symbol's candles or analysis results change
+    symbol = db.Column(db.String(10), primary_key=True)
+    version = db.Column(db.Integer, default=1, nullable=False)
+    # Bumped only when the candles themselves change; candle stores compare it before reusing a frame
+    candle_version = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<DatasetVersion {self.symbol} v{self.version}>"
+
+
+class AnalysisRun(db.Model):
+    __tablename__ = 'analysis_runs'
+    
+    run_id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(10), nullable=False)
+    kind = db.Column(db.Enum(AnalysisKindEnum), nullable=False)
+    timeframes = db.Column(db.JSON, nullable=False)
+    parameters = db.Column(db.JSON, nullable=True)
+    status = db.Column(db.Enum(RunStatusEnum), default=RunStatusEnum.RUNNING, nullable=False)
+    # Run whose results this run was built from (price action -> FVG -> opportunities)
+    parent_run_id = db.Column(db.Integer, db.ForeignKey('analysis_runs.run_id', ondelete='CASCADE'), nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_analysis_runs_symbol_kind_status', 'symbol', 'kind', 'status'),
+        db.Index('ix_analysis_runs_parent_run_id', 'parent_run_id'),
+    )
+    
+    @property
+    def kind_str(self):
+        return self.kind.value if self.kind else None
+    
+    @property
+    def status_str(self):
+        return self.status.value if self.status else None
+    
+    def __repr__(self):
+        return f"<AnalysisRun {self.symbol} {self.kind.value} ID:{self.run_id}>"
+
+
 class PriceActionPattern(db.Model):
     __tablename__ = 'price_action_patterns'
     
@@ -89,6 +187,13 @@ class PriceActionPattern(db.Model):
     pattern_type = db.Column(db.Enum(PatternTypeEnum), nullable=False)
     timeframe = db.Column(db.Enum(AnalysisTimeframeEnum), nullable=False)
     validation_status = db.Column(db.Enum(ValidationStatusEnum), default=ValidationStatusEnum.PENDING, nullable=False)
+    run_id = db.Column(db.Integer, db.ForeignKey('analysis_runs.run_id', ondelete='CASCADE'), nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_price_action_patterns_candle_id', 'candle_id'),
+        db.Index('ix_price_action_patterns_timeframe_type', 'timeframe', 'pattern_type'),
+        db.Index('ix_price_action_patterns_run_id', 'run_id'),
+    )
     
     @property
     def pattern_type_str(self):
@@ -139,7 +244,19 @@ class FairValueGap(db.Model):
     start_price = db.Column(db.Float, nullable=False)
     end_price = db.Column(db.Float, nullable=False)
     fill_percentage = db.Column(db.Float, default=0.0, nullable=False)
+    # First candles that traded through the middle and the far edge of the gap
+    half_fill_candle_id = db.Column(db.Integer, db.ForeignKey('candles.candle_id', ondelete='SET NULL'), nullable=True)
+    full_fill_candle_id = db.Column(db.Integer, db.ForeignKey('candles.candle_id', ondelete='SET NULL'), nullable=True)
     timeframe = db.Column(db.Enum(AnalysisTimeframeEnum), nullable=False)
+    run_id = db.Column(db.Integer, db.ForeignKey('analysis_runs.run_id', ondelete='CASCADE'), nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_fair_value_gaps_run_id', 'run_id'),
+        db.Index('ix_fair_value_gaps_pattern_id', 'pattern_id'),
+        db.Index('ix_fair_value_gaps_candle_start_id', 'candle_start_id'),
+        db.Index('ix_fair_value_gaps_candle_end_id', 'candle_end_id'),
+        db.Index('ix_fair_value_gaps_timeframe', 'timeframe'),
+    )
     
     @property
     def timeframe_str(self):
@@ -170,6 +287,19 @@ class TradeOpportunity(db.Model):
     take_profit = db.Column(db.Float, nullable=False)
     status = db.Column(db.Enum(TradeStatusEnum), default=TradeStatusEnum.PENDING, nullable=False)
     creation_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Candle the simulated trade exited in and the number of candles it was held
+    exit_candle_id = db.Column(db.Integer, db.ForeignKey('candles.candle_id', ondelete='SET NULL'), nullable=True)
+    exit_time = db.Column(db.DateTime, nullable=True)
+    holding_bars = db.Column(db.Integer, nullable=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('analysis_runs.run_id', ondelete='CASCADE'), nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_trade_opportunities_run_id', 'run_id'),
+        db.Index('ix_trade_opportunities_choch_pattern_id', 'choch_pattern_id'),
+        db.Index('ix_trade_opportunities_fvg_id', 'fvg_id'),
+        db.Index('ix_trade_opportunities_status', 'status'),
+        db.Index('ix_trade_opportunities_creation_time', 'creation_time'),
+    )
     
     @property
     def status_str(self):
@@ -0,0 +1,168 @@
+import logging
+from datetime import datetime
+
+from app import db
+from models import AnalysisRun, RunStatusEnum
+from models import PriceActionPattern, FairValueGap, TradeOpportunity
+from services.dataset_version_service import bump_dataset_version
+
+logger = logging.getLogger(__name__)
+
+# Result tables in the order their rows must be deleted (dependents first)
+RUN_RESULT_MODELS = [TradeOpportunity, FairValueGap, PriceActionPattern]
+
+def start_run(symbol, kind, timeframes, parameters=None, parent_run_id=None):
+    """
+    Record the start of an analysis run and return it.
+
+    The run is committed right away so concurrent readers can tell it apart
+    from completed runs; the dataset version changes since the run is listed.
+    """
+    run = AnalysisRun(
+        symbol=symbol,
+        kind=kind,
+        timeframes=list(timeframes),
+        parameters=parameters or {},
+        status=RunStatusEnum.RUNNING,
+        parent_run_id=parent_run_id,
+        started_at=datetime.utcnow()
+    )
+    db.session.add(run)
+    db.session.commit()
+    bump_dataset_version(symbol)
+
+    return run
+
+def complete_run(run):
+    """
+    Mark a run as completed, making it the one read endpoints serve, and
+    delete the older runs it supersedes
+    """
+    run.status = RunStatusEnum.COMPLETED
+    run.completed_at = datetime.utcnow()
+    db.session.commit()
+    bump_dataset_version(run.symbol)
+
+    pruned = prune_runs(run.symbol, run.kind, run.run_id)
+    if pruned:
+        logger.info(f"Deleted {len(pruned)} superseded analysis runs for {run.symbol}")
+
+def fail_run(run_id):
+    """
+    Mark a run as failed and delete any results it already wrote.
+
+    Call after rolling back the failed transaction.
+    """
+    delete_run_results([run_id])
+    db.session.query(AnalysisRun).filter(AnalysisRun.run_id == run_id).\
+        update({AnalysisRun.status: RunStatusEnum.FAILED, AnalysisRun.completed_at: datetime.utcnow()},
+               synchronize_session=False)
+    db.session.commit()
+
+    symbol = db.session.query(AnalysisRun.symbol).filter(AnalysisRun.run_id == run_id).scalar()
+    if symbol is not None:
+        bump_dataset_version(symbol)
+
+def latest_run(symbol, kind):
+    """
+    The most recently completed run of a kind for a symbol, or None
+    """
+    return AnalysisRun.query.filter_by(symbol=symbol, kind=kind, status=RunStatusEnum.COMPLETED).\
+        order_by(AnalysisRun.completed_at.desc(), AnalysisRun.run_id.desc()).first()
+
+def latest_run_id(symbol, kind):
+    run = latest_run(symbol, kind)
+    return run.run_id if run else None
+
+def prune_runs(symbol, kind, keep_run_id):
+    """
+    Delete the finished runs of a kind for a symbol that started before
+    keep_run_id, together with the runs built from them. Runs that are
+    still in progress are left alone. Returns the deleted run ids.
+    """
+    run_ids = [run_id for (run_id,) in db.session.query(AnalysisRun.run_id).filter(
+        AnalysisRun.symbol == symbol,
+        AnalysisRun.kind == kind,
+        AnalysisRun.status != RunStatusEnum.RUNNING,
+        AnalysisRun.run_id < keep_run_id
+    )]
+
+    return delete_runs(run_ids)
+
+def delete_runs(run_ids):
+    """
+    Delete runs, every run built from them and all of their results in bulk.
+    A run still in progress is kept together with the runs it was built
+    from. Returns the deleted run ids.
+    """
+    # Follow parent links down to the runs built from these results
+    run_ids = list(run_ids)
+    parents = {}
+    running = []
+    frontier = run_ids
+    while frontier:
+        rows = db.session.query(AnalysisRun.run_id, AnalysisRun.parent_run_id, AnalysisRun.status).\
+            filter(AnalysisRun.parent_run_id.in_(frontier)).all()
+        frontier = [row.run_id for row in rows]
+        run_ids.extend(frontier)
+        for row in rows:
+            parents[row.run_id] = row.parent_run_id
+            if row.status == RunStatusEnum.RUNNING:
+                running.append(row.run_id)
+
+    # Deleting a parent would cascade to the running run, so keep its whole chain
+    kept = set()
+    for run_id in running:
+        while run_id is not None and run_id not in kept:
+            kept.add(run_id)
+            run_id = parents.get(run_id)
+    run_ids = [run_id for run_id in run_ids if run_id not in kept]
+
+    if not run_ids:
+        return []
+
+    delete_run_results(run_ids)
+    db.session.query(AnalysisRun).filter(AnalysisRun.run_id.in_(run_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+    return run_ids
+
+def delete_run_results(run_ids):
+    """
+    Delete the patterns, FVGs and trade opportunities of runs, one bulk
+    statement per table
+    """
+    for model in RUN_RESULT_MODELS:
+        db.session.query(model).filter(model.run_id.in_(run_ids)).delete(synchronize_session=False)
+
+def delete_unassigned_results():
+    """
+    Delete results stored before analysis runs existed. They cannot be
+    attributed to a symbol's run and are never served. Returns the number
+    of rows deleted.
+    """
+    deleted = 0
+    for model in RUN_RESULT_MODELS:
+        deleted += db.session.query(model).filter(model.run_id.is_(None)).delete(synchronize_session=False)
+    db.session.commit()
+
+    return deleted
+
+def run_to_dict(run):
+    """
+    JSON representation of a run for API responses
+    """
+    if run is None:
+        return None
+
+    return {
+        'runId': run.run_id,
+        'symbol': run.symbol,
+        'kind': run.kind_str,
+        'status': run.status_str,
+        'timeframes': run.timeframes,
+        'parameters': run.parameters,
+        'parentRunId': run.parent_run_id,
+        'startedAt': run.started_at.timestamp() if run.started_at else None,
+        'completedAt': run.completed_at.timestamp() if run.completed_at else None
+    }
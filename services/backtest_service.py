@@ -0,0 +1,220 @@
+import itertools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app import db
+from models import PriceActionPattern, AnalysisKindEnum, AnalysisTimeframeEnum, PatternTypeEnum
+from models import ValidationStatusEnum, TimeframeEnum, TradeStatusEnum
+from services.analysis_run_service import latest_run
+from services.candle_store import CandleFrame, get_candle_frame
+from services.fvg_service import find_fair_value_gaps
+from services.trade_service import calculate_trade_levels, simulate_trade_outcomes, summarize_r_multiples
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the number of parameter combinations of one backtest
+MAX_BACKTEST_COMBINATIONS = 1000
+
+# Read-only inputs of the current worker process, set by _init_worker
+_worker_inputs = None
+_worker_frames = {}
+_worker_gaps = {}
+
+def build_parameter_grid(risk_reward_ratios, stop_buffers, choch_timeframes, fvg_timeframes,
+                         validation=(True,)):
+    """
+    Every combination of the given parameter values, as a list of dicts.
+
+    validation holds True to trade only valid CHoCH patterns and False to
+    trade all of them. Raises ValueError for unsupported values or grids
+    larger than MAX_BACKTEST_COMBINATIONS.
+    """
+    values = {
+        'riskRewardRatio': [float(ratio) for ratio in risk_reward_ratios],
+        'stopBuffer': [float(buffer) for buffer in stop_buffers],
+        'chochTimeframe': list(choch_timeframes),
+        'fvgTimeframe': list(fvg_timeframes),
+        'validation': [bool(flag) for flag in validation]
+    }
+
+    for name, options in values.items():
+        if not options:
+            raise ValueError(f"No values given for {name}")
+    if any(ratio <= 0 for ratio in values['riskRewardRatio']):
+        raise ValueError("Risk-reward ratios must be positive")
+    if any(not 0 <= buffer < 1 for buffer in values['stopBuffer']):
+        raise ValueError("Stop buffers must be fractions between 0 and 1")
+
+    supported = {tf.value for tf in AnalysisTimeframeEnum}
+    unsupported = sorted(set(values['chochTimeframe'] + values['fvgTimeframe']) - supported)
+    if unsupported:
+        raise ValueError(f"Unsupported timeframe: {', '.join(unsupported)}")
+
+    grid = [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
+    if len(grid) > MAX_BACKTEST_COMBINATIONS:
+        raise ValueError(f"Backtest grid has {len(grid)} combinations, at most "
+                         f"{MAX_BACKTEST_COMBINATIONS} are allowed")
+
+    return grid
+
+def load_backtest_inputs(symbol, timeframes):
+    """
+    Load everything a backtest of a symbol reads: the candle columns of each
+    timeframe and the CHoCH patterns of the latest price action run.
+
+    Patterns are loaded in one query. Returns plain arrays, so the inputs
+    can be handed to worker processes without a database connection.
+    """
+    run = latest_run(symbol, AnalysisKindEnum.PRICE_ACTION)
+    if run is None:
+        raise ValueError(f"Run price action analysis for {symbol} first")
+
+    missing = sorted(set(timeframes) - set(run.timeframes))
+    if missing:
+        raise ValueError(f"Timeframes {', '.join(missing)} are not part of the latest price action run of {symbol}")
+
+    rows = db.session.query(
+        PriceActionPattern.candle_id,
+        PriceActionPattern.timeframe,
+        PriceActionPattern.pattern_type,
+        PriceActionPattern.validation_status
+    ).filter(PriceActionPattern.run_id == run.run_id).all()
+
+    inputs = {'symbol': symbol, 'priceActionRunId': run.run_id, 'timeframes': {}}
+    for tf in timeframes:
+        frame = get_candle_frame(symbol, tf)
+        tf_rows = [row for row in rows if row.timeframe == AnalysisTimeframeEnum(tf)]
+
+        positions = frame.positions(np.array([row.candle_id for row in tf_rows], dtype=np.int64))
+        in_frame = positions >= 0
+        choch = in_frame & np.array([row.pattern_type == PatternTypeEnum.CHOCH for row in tf_rows], dtype=bool)
+        valid = np.array([row.validation_status == ValidationStatusEnum.VALID for row in tf_rows], dtype=bool)
+
+        inputs['timeframes'][tf] = {
+            'columns': {column: getattr(frame, column) for column in CandleFrame.COLUMNS},
+            'choch_positions': np.unique(positions[choch]),
+            'valid_choch_positions': np.unique(positions[choch & valid]),
+            # FVGs need a pattern at or before their end candle to be stored
+            'first_pattern_position': int(positions[in_frame].min()) if in_frame.any() else -1
+        }
+
+    return inputs
+
+def run_backtest(symbol, grid, workers=None):
+    """
+    Evaluate a parameter grid on a symbol without writing to the database.
+
+    The inputs are loaded once and shared read-only with a pool of worker
+    processes, which rebuild the trade pipeline of the opportunities
+    analysis for each combination. workers is capped at the number of CPUs.
+    Returns the combinations ranked by expectancy, then win rate, then
+    smallest drawdown.
+    """
+    if workers is not None and (not isinstance(workers, int) or workers < 1):
+        raise ValueError("workers must be a positive integer")
+
+    timeframes = sorted({params['chochTimeframe'] for params in grid} | {params['fvgTimeframe'] for params in grid})
+    inputs = load_backtest_inputs(symbol, timeframes)
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or cpu_count, cpu_count, len(grid)))
+
+    if workers == 1:
+        _init_worker(inputs)
+        try:
+            results = [evaluate_parameters(params) for params in grid]
+        finally:
+            _init_worker(None)
+    else:
+        # Forked workers inherit the inputs without pickling; the request's connection goes back to the pool
+        db.session.close()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_init_forked_worker, initargs=(db.engine, inputs)) as executor:
+            results = list(executor.map(evaluate_parameters, grid,
+                                        chunksize=max(1, len(grid) // (workers * 4))))
+
+    results.sort(key=lambda result: (-result['expectancy'], -result['winRate'], result['maxDrawdown']))
+    for rank, result in enumerate(results, start=1):
+        result['rank'] = rank
+
+    return {
+        'symbol': symbol,
+        'priceActionRunId': inputs['priceActionRunId'],
+        'combinationCount': len(grid),
+        'workers': workers,
+        'results': results
+    }
+
+def evaluate_parameters(params):
+    """
+    Simulate the trades of one parameter combination on the worker inputs.
+
+    Trades pair each CHoCH with the first FVG starting at or after it, as
+    identify_trade_opportunities does. The performance is measured in R
+    multiples: a win earns the risk-reward ratio, a loss costs 1R.
+    """
+    choch_tf, fvg_tf = params['chochTimeframe'], params['fvgTimeframe']
+    choch_inputs = _worker_inputs['timeframes'][choch_tf]
+    choch_frame = _worker_frame(choch_tf)
+    fvg_frame = _worker_frame(fvg_tf)
+    gap_positions, gap_start_prices, gap_end_prices = _worker_fair_value_gaps(fvg_tf)
+
+    signal_positions = choch_inputs['valid_choch_positions' if params['validation'] else 'choch_positions']
+
+    # The first FVG starting at or after each CHoCH
+    first_fvg = np.searchsorted(fvg_frame.timestamp[gap_positions], choch_frame.timestamp[signal_positions],
+                                side='left')
+    matched = first_fvg < len(gap_positions)
+    signal_positions, first_fvg = signal_positions[matched], first_fvg[matched]
+
+    entry_prices, stop_losses, take_profits = calculate_trade_levels(
+        gap_start_prices[first_fvg], gap_end_prices[first_fvg], params['riskRewardRatio'], params['stopBuffer'])
+    statuses, exit_positions = simulate_trade_outcomes(choch_frame, signal_positions, entry_prices,
+                                                       stop_losses, take_profits)
+
+    statuses = np.array([status.name for status in statuses], dtype=object)
+    win = statuses == TradeStatusEnum.WIN.name
+    closed = win | (statuses == TradeStatusEnum.LOSS.name)
+
+    # R multiples of the closed trades in the order they exited
+    order = np.argsort(exit_positions[closed], kind='stable')
+    r_multiples = np.where(win, params['riskRewardRatio'], -1.0)[closed][order]
+
+    return {
+        **params,
+        'opportunityCount': len(signal_positions),
+        'openCount': int(np.count_nonzero(statuses == TradeStatusEnum.EXECUTED.name)),
+        'pendingCount': int(np.count_nonzero(statuses == TradeStatusEnum.PENDING.name)),
+        **summarize_r_multiples(r_multiples)
+    }
+
+def _init_worker(inputs):
+    global _worker_inputs
+    _worker_inputs = inputs
+    _worker_frames.clear()
+    _worker_gaps.clear()
+
+def _init_forked_worker(engine, inputs):
+    # Give the worker its own connection pool without closing the connections it shares with the app
+    engine.dispose(close=False)
+    _init_worker(inputs)
+
+def _worker_frame(timeframe):
+    # Frames and their range indexes are built once per worker process
+    if timeframe not in _worker_frames:
+        _worker_frames[timeframe] = CandleFrame(_worker_inputs['symbol'], TimeframeEnum(timeframe),
+                                                **_worker_inputs['timeframes'][timeframe]['columns'])
+    return _worker_frames[timeframe]
+
+def _worker_fair_value_gaps(timeframe):
+    # The FVGs the FVG analysis of this timeframe would store
+    if timeframe not in _worker_gaps:
+        frame = _worker_frame(timeframe)
+        first_pattern_position = _worker_inputs['timeframes'][timeframe]['first_pattern_position']
+        positions, start_prices, end_prices = find_fair_value_gaps(frame.high, frame.low)
+        keep = (first_pattern_position >= 0) & (positions + 2 >= first_pattern_position)
+        _worker_gaps[timeframe] = positions[keep], start_prices[keep], end_prices[keep]
+    return _worker_gaps[timeframe]
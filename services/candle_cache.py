@@ -0,0 +1,139 @@
+import logging
+import os
+import tempfile
+import time
+from urllib.parse import quote
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the file layout changes; files of another version are ignored
+CACHE_FORMAT_VERSION = 1
+CACHE_MAGIC = b'MACANDLE'
+CACHE_SUFFIX = '.candles'
+
+# Fixed-size little-endian header at the start of every cache file
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('column_count', '<u4'),
+    ('rows', '<u8'),
+    ('timeframe_minutes', '<u4'),
+    ('reserved', '<u4'),
+    ('built_at', '<i8')
+])
+HEADER_SIZE = 64
+
+# Columns in file order; every column is 8 bytes wide so offsets stay aligned
+CACHE_COLUMNS = (
+    ('candle_id', '<i8'),
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8'),
+    ('bucket_key', '<i8')
+)
+
+def cache_path(cache_dir, symbol, timeframe_enum):
+    """
+    Path of the cache file of a symbol and timeframe
+    """
+    return os.path.join(cache_dir, f"{quote(symbol, safe='')}_{timeframe_enum.name}{CACHE_SUFFIX}")
+
+def file_stamp(path):
+    """
+    Identity of the file currently at path, or None if there is none.
+
+    Cache files are only ever replaced, never rewritten in place, so a
+    changed stamp means the file was rebuilt.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def write_candle_cache(path, columns, timeframe_minutes):
+    """
+    Write candle columns to a cache file.
+
+    The file is written next to its destination and moved into place, so
+    readers in other processes see either the old or the new file.
+    """
+    rows = len(columns['candle_id'])
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = CACHE_MAGIC
+    header['version'] = CACHE_FORMAT_VERSION
+    header['column_count'] = len(CACHE_COLUMNS)
+    header['rows'] = rows
+    header['timeframe_minutes'] = timeframe_minutes
+    header['built_at'] = time.time_ns()
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+            for name, dtype in CACHE_COLUMNS:
+                column = columns[name]
+                if name == 'timestamp':
+                    column = column.astype('datetime64[s]').view(np.int64)
+                f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+def open_candle_cache(path, timeframe_minutes):
+    """
+    Memory-map the columns of a cache file.
+
+    Returns a dict of read-only arrays backed by the page cache, or None if
+    the file is missing, from another format version or truncated.
+    """
+    try:
+        # A single mapping, so header and columns always come from the same file
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    except (FileNotFoundError, ValueError):
+        # ValueError: numpy refuses to map an empty file
+        return None
+
+    if len(buffer) < HEADER_SIZE:
+        logger.warning(f"Ignoring truncated candle cache {path}")
+        return None
+
+    header = buffer[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+    if header['magic'] != CACHE_MAGIC or header['version'] != CACHE_FORMAT_VERSION:
+        logger.warning(f"Ignoring candle cache {path} with unsupported format")
+        return None
+
+    rows = int(header['rows'])
+    if (header['column_count'] != len(CACHE_COLUMNS)
+            or header['timeframe_minutes'] != timeframe_minutes
+            or len(buffer) != HEADER_SIZE + rows * 8 * len(CACHE_COLUMNS)):
+        logger.warning(f"Ignoring stale candle cache {path}")
+        return None
+
+    columns = {}
+    offset = HEADER_SIZE
+    for name, dtype in CACHE_COLUMNS:
+        column = buffer[offset:offset + rows * 8].view(dtype)
+        if name == 'timestamp':
+            column = column.view('datetime64[s]')
+        columns[name] = column
+        offset += rows * 8
+
+    return columns
+
+def remove_candle_cache(path):
+    """
+    Delete a cache file if it exists
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
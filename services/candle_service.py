@@ -1,190 +1,479 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+import io
 import logging
+from sqlalchemy import BigInteger, cast, func, or_, update
 
 from app import db
-from models import Candle, TimeframeEnum
+from models import Candle, TimeframeEnum, TIMEFRAME_MINUTES
 
 logger = logging.getLogger(__name__)
 
-def process_csv_data(df, symbol):
+# Number of rows sent per INSERT batch when COPY is not available
+BULK_INSERT_BATCH_SIZE = 10000
+
+# Default number of CSV rows parsed and inserted per chunk during streaming ingest
+DEFAULT_CSV_CHUNK_ROWS = 100000
+
+# Timeframes built by the aggregation cascade, each one from the timeframe before it
+TIMEFRAME_CASCADE = [
+    TimeframeEnum.M1,
+    TimeframeEnum.M5,
+    TimeframeEnum.M15,
+    TimeframeEnum.M30,
+    TimeframeEnum.H1,
+    TimeframeEnum.H4
+]
+
+# Candle columns written by the bulk loader, in COPY order
+BULK_CANDLE_COLUMNS = ["symbol", "timeframe", "open_price", "high_price", "low_price",
+                       "close_price", "volume", "timestamp", "bucket_key"]
+
+def prepare_candle_frame(df):
     """
-    Process CSV data and create 1-minute candles
+    Validate and convert raw CSV columns into typed candle columns.
+
+    All conversions are vectorized. Rows with an unparseable timestamp or price
+    are dropped, as are repeated timestamps (the last row wins), and both are
+    reported in the returned skipped count.
     """
     required_columns = ["timestamp", "open", "high", "low", "close", "volume"]
     
-    # Check if all required columns are present
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Missing required column: {col}")
-    
-    # Ensure timestamp is in datetime format
-    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-        try:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        except Exception as e:
-            raise ValueError(f"Could not convert timestamp column to datetime: {str(e)}")
-    
-    # Sort by timestamp
-    df = df.sort_values('timestamp')
-    
-    # Create candles
-    candles = []
-    for _, row in df.iterrows():
-        candle = Candle(
-            symbol=symbol,
-            timeframe=TimeframeEnum.M1,
-            open_price=float(row['open']),
-            high_price=float(row['high']),
-            low_price=float(row['low']),
-            close_price=float(row['close']),
-            volume=int(row['volume']),
-            timestamp=row['timestamp']
+    missing = [col for col in required_columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required column: {missing[0]}")
+    
+    frame = pd.DataFrame({
+        'timestamp': pd.to_datetime(df['timestamp'], errors='coerce'),
+        'open_price': pd.to_numeric(df['open'], errors='coerce'),
+        'high_price': pd.to_numeric(df['high'], errors='coerce'),
+        'low_price': pd.to_numeric(df['low'], errors='coerce'),
+        'close_price': pd.to_numeric(df['close'], errors='coerce'),
+        'volume': pd.to_numeric(df['volume'], errors='coerce')
+    })
+    
+    # A chunk without any valid row yields an empty frame
+    valid = frame.notna().all(axis=1).to_numpy()
+    frame = frame[valid]
+    frame = frame.astype({
+        'open_price': np.float64,
+        'high_price': np.float64,
+        'low_price': np.float64,
+        'close_price': np.float64,
+        'volume': np.int64
+    })
+    frame = frame.sort_values('timestamp', kind='stable')
+    frame = frame.drop_duplicates('timestamp', keep='last').reset_index(drop=True)
+    
+    return frame, len(df) - len(frame)
+
+def bulk_insert_candles(frame, symbol, timeframe_enum, batch_size=BULK_INSERT_BATCH_SIZE, update_existing=False):
+    """
+    Insert a typed candle frame with a set-based load.
+
+    PostgreSQL connections use COPY; other databases fall back to batched
+    executemany INSERTs. With update_existing, rows whose timestamp is
+    already stored overwrite that candle instead of violating the unique
+    index. Returns the number of rows written.
+    """
+    if frame.empty:
+        return 0
+    
+    if update_existing and db.engine.dialect.name != 'postgresql':
+        return len(upsert_candles(frame, symbol, timeframe_enum, update_existing=True, batch_size=batch_size))
+    
+    frame = _with_bucket_keys(frame, timeframe_enum)
+    
+    if db.engine.dialect.name == 'postgresql':
+        _copy_candles(frame, symbol, timeframe_enum, update_existing)
+    else:
+        for rows in _candle_row_batches(frame, symbol, timeframe_enum, batch_size):
+            db.session.execute(Candle.__table__.insert(), rows)
+    
+    return len(frame)
+
+def upsert_candles(frame, symbol, timeframe_enum, update_existing=False, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    Insert a typed candle frame, resolving conflicts on (symbol, timeframe, timestamp).
+
+    Existing candles are left untouched unless update_existing is set, in
+    which case their prices and volume are overwritten. Returns the sorted
+    bucket keys of the rows that were inserted or updated.
+    """
+    if frame.empty:
+        return np.empty(0, dtype=np.int64)
+    
+    frame = _with_bucket_keys(frame, timeframe_enum)
+    table = Candle.__table__
+    
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Upserting candles is not supported on {dialect}")
+    
+    stmt = insert(table)
+    conflict_columns = ['symbol', 'timeframe', 'timestamp']
+    if update_existing:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={col: stmt.excluded[col] for col in ['open_price', 'high_price', 'low_price', 'close_price', 'volume']}
         )
-        candles.append(candle)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+    stmt = stmt.returning(table.c.bucket_key)
     
-    # Add to database
-    db.session.add_all(candles)
-    db.session.commit()
+    written = []
+    for rows in _candle_row_batches(frame, symbol, timeframe_enum, batch_size):
+        written.extend(db.session.execute(stmt, rows).scalars())
     
-    return candles
+    return np.sort(np.array(written, dtype=np.int64))
 
-def generate_higher_timeframe_candles(candles, timeframe):
+def _with_bucket_keys(frame, timeframe_enum):
     """
-    Generate higher timeframe candles from 1-minute candles
+    Add the epoch-aligned bucket key of each candle in its own timeframe
     """
-    if not candles:
-        return []
+    return frame.assign(
+        bucket_key=frame['timestamp'].to_numpy(dtype='datetime64[m]').astype(np.int64)
+        // TIMEFRAME_MINUTES[timeframe_enum]
+    )
+
+def _candle_row_batches(frame, symbol, timeframe_enum, batch_size):
+    """
+    Yield lists of candle row dicts of at most batch_size rows for executemany
+    """
+    value_columns = BULK_CANDLE_COLUMNS[2:]
+    columns = [frame[col].tolist() for col in value_columns]
+    columns[value_columns.index('timestamp')] = list(frame['timestamp'].dt.to_pydatetime())
     
-    # Get all 1-minute candles from the database, sorted by timestamp
-    symbol = candles[0].symbol if candles else None
+    for start in range(0, len(frame), batch_size):
+        yield [
+            dict(zip(value_columns, values), symbol=symbol, timeframe=timeframe_enum)
+            for values in zip(*(col[start:start + batch_size] for col in columns))
+        ]
+
+def _copy_candles(frame, symbol, timeframe_enum, update_existing=False):
+    """
+    Stream a candle frame into PostgreSQL with COPY FROM STDIN.
+
+    With update_existing the rows are copied into a temporary staging table
+    and merged with INSERT ... ON CONFLICT DO UPDATE.
+    """
+    out = frame[BULK_CANDLE_COLUMNS[2:]].copy()
+    out.insert(0, 'timeframe', timeframe_enum.name)
+    out.insert(0, 'symbol', symbol)
+    
+    buffer = io.StringIO()
+    out.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+    buffer.seek(0)
+    
+    # Use the session's DBAPI connection so the COPY joins the current transaction
+    dbapi_connection = db.session.connection().connection
+    columns = ', '.join(BULK_CANDLE_COLUMNS)
+    with dbapi_connection.cursor() as cursor:
+        if not update_existing:
+            cursor.copy_expert(f"COPY {Candle.__tablename__} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            return
+        
+        cursor.execute(f"CREATE TEMPORARY TABLE candle_staging AS SELECT {columns} FROM {Candle.__tablename__} WITH NO DATA")
+        cursor.copy_expert(f"COPY candle_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        updates = ', '.join(f"{col} = EXCLUDED.{col}"
+                            for col in ['open_price', 'high_price', 'low_price', 'close_price', 'volume'])
+        cursor.execute(
+            f"INSERT INTO {Candle.__tablename__} ({columns}) SELECT {columns} FROM candle_staging "
+            f"ON CONFLICT (symbol, timeframe, timestamp) DO UPDATE SET {updates}"
+        )
+        cursor.execute("DROP TABLE candle_staging")
+
+def ingest_csv_stream(stream, symbol, chunk_size=DEFAULT_CSV_CHUNK_ROWS, batch_size=BULK_INSERT_BATCH_SIZE,
+                      append=False, counts=None):
+    """
+    Bulk ingest a CSV file-like object chunk by chunk.
+
+    Only one chunk of at most chunk_size rows is held in memory at a time, so
+    peak memory is bounded by the chunk size rather than the file size.
+    Chunks without any valid row only add to the skipped count; a file
+    without any valid row raises ValueError.
+    
+    In replace mode a timestamp repeated in a later chunk overwrites the
+    earlier row, as repeats within a chunk do, and counts as skipped. In
+    append mode rows that already exist for the symbol are skipped instead
+    of failing the upload, and the sorted 5m bucket keys touched by newly
+    inserted rows are tracked under 'touched_buckets', for
+    reaggregate_touched_buckets().
+    
+    Every chunk is committed on its own. counts, if given, is filled in
+    place, so a caller can tell what was already committed when a later
+    chunk fails.
+    """
+    counts = counts if counts is not None else {}
+    counts.update({
+        'received': 0,
+        'inserted': 0,
+        'skipped': 0,
+        'existing': 0,
+        'chunks': 0,
+        'touched_buckets': np.empty(0, dtype=np.int64)
+    })
+    stored_before = None if append else _count_candles(symbol, TimeframeEnum.M1)
+    written = 0
+    
+    with pd.read_csv(stream, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            frame, skipped = prepare_candle_frame(chunk)
+            if append:
+                new_minutes = upsert_candles(frame, symbol, TimeframeEnum.M1, batch_size=batch_size)
+                counts['inserted'] += len(new_minutes)
+                counts['existing'] += len(frame) - len(new_minutes)
+            else:
+                written += bulk_insert_candles(frame, symbol, TimeframeEnum.M1, batch_size, update_existing=True)
+                counts['inserted'] = written
+            counts['received'] += len(chunk)
+            counts['skipped'] += skipped
+            counts['chunks'] += 1
+            
+            # Commit per chunk so the transaction does not grow with the file
+            db.session.commit()
+            if append:
+                counts['touched_buckets'] = np.union1d(counts['touched_buckets'],
+                                                       new_minutes // TIMEFRAME_MINUTES[TimeframeEnum.M5])
+            logger.debug(f"Ingested chunk {counts['chunks']} ({counts['inserted']} rows so far)")
     
-    # Get all 1-minute candles from database
-    one_min_candles = Candle.query.filter_by(symbol=symbol, timeframe=TimeframeEnum.M1).order_by(Candle.timestamp).all()
+    if not append:
+        # Rows overwritten by a later chunk were written twice but stored once
+        counts['inserted'] = _count_candles(symbol, TimeframeEnum.M1) - stored_before
+        counts['skipped'] += written - counts['inserted']
     
-    # Map string timeframe to Enum
-    timeframe_enum_map = {
-        '5m': TimeframeEnum.M5,
-        '15m': TimeframeEnum.M15,
-        '30m': TimeframeEnum.M30,
-        '1H': TimeframeEnum.H1,
-        '4H': TimeframeEnum.H4
+    if counts['received'] > 0 and counts['skipped'] == counts['received']:
+        raise ValueError("Could not convert any CSV row to a valid candle")
+    
+    return counts
+
+def _count_candles(symbol, timeframe_enum):
+    return db.session.query(func.count(Candle.candle_id)).\
+        filter(Candle.symbol == symbol, Candle.timeframe == timeframe_enum).scalar()
+
+def load_candle_arrays(symbol, timeframe_enum, bucket_ranges=None):
+    """
+    Load the candles of one symbol and timeframe into NumPy arrays.
+
+    Timestamps are returned as integer minutes since the Unix epoch under the
+    'minute' key, sorted ascending. bucket_ranges optionally restricts the
+    load to inclusive (first, last) bucket key ranges of the timeframe.
+    """
+    query = db.session.query(
+        Candle.timestamp,
+        Candle.open_price,
+        Candle.high_price,
+        Candle.low_price,
+        Candle.close_price,
+        Candle.volume
+    ).filter(
+        Candle.symbol == symbol,
+        Candle.timeframe == timeframe_enum
+    )
+    if bucket_ranges is not None:
+        query = query.filter(or_(*[Candle.bucket_key.between(first, last) for first, last in bucket_ranges]))
+    rows = query.order_by(Candle.timestamp).all()
+    
+    frame = pd.DataFrame.from_records(
+        rows, columns=['timestamp', 'open_price', 'high_price', 'low_price', 'close_price', 'volume']
+    )
+    
+    return {
+        'minute': frame['timestamp'].to_numpy(dtype='datetime64[m]').astype(np.int64),
+        'open_price': frame['open_price'].to_numpy(dtype=np.float64),
+        'high_price': frame['high_price'].to_numpy(dtype=np.float64),
+        'low_price': frame['low_price'].to_numpy(dtype=np.float64),
+        'close_price': frame['close_price'].to_numpy(dtype=np.float64),
+        'volume': frame['volume'].to_numpy(dtype=np.int64)
     }
+
+def aggregate_candle_arrays(arrays, interval_minutes):
+    """
+    Aggregate sorted candle arrays into buckets of interval_minutes.
+
+    Buckets are aligned to the Unix epoch, so every timeframe that divides a
+    day lines up with its parent. Each bucket takes the first open, the last
+    close, the highest high, the lowest low and the summed volume.
+    """
+    minute = arrays['minute']
+    if len(minute) == 0:
+        return {key: values[:0] for key, values in arrays.items()}
+    
+    bucket = minute // interval_minutes
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    ends = np.concatenate((starts[1:], [len(minute)]))
     
-    timeframe_enum = timeframe_enum_map.get(timeframe)
-    if not timeframe_enum:
-        raise ValueError(f"Unsupported timeframe: {timeframe}")
-    
-    # Calculate the number of 1-minute candles in the higher timeframe
-    minutes_in_timeframe = {
-        TimeframeEnum.M5: 5,
-        TimeframeEnum.M15: 15,
-        TimeframeEnum.M30: 30,
-        TimeframeEnum.H1: 60,
-        TimeframeEnum.H4: 240
+    return {
+        'minute': bucket[starts] * interval_minutes,
+        'open_price': arrays['open_price'][starts],
+        'high_price': np.maximum.reduceat(arrays['high_price'], starts),
+        'low_price': np.minimum.reduceat(arrays['low_price'], starts),
+        'close_price': arrays['close_price'][ends - 1],
+        'volume': np.add.reduceat(arrays['volume'], starts)
     }
+
+def candle_arrays_to_frame(arrays):
+    """
+    Convert candle arrays into the typed frame accepted by bulk_insert_candles
+    """
+    frame = pd.DataFrame({key: values for key, values in arrays.items() if key != 'minute'})
+    frame.insert(0, 'timestamp', pd.to_datetime(arrays['minute'].astype('datetime64[m]')))
+    return frame
+
+def aggregate_timeframe_cascade(symbol, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    Build every higher timeframe for a symbol in a single pass.
+
+    The 1-minute candles are loaded once; 5m is aggregated from 1m, 15m from
+    5m and so on up the cascade, and each timeframe is written exactly once.
+    Any existing higher timeframe candles for the symbol are replaced.
+    Returns the number of candles written per timeframe.
+    """
+    higher_timeframes = TIMEFRAME_CASCADE[1:]
     
-    interval_minutes = minutes_in_timeframe[timeframe_enum]
+    # Detach 1-minute candles first so the cascading foreign key does not
+    # remove them together with their old parents
+    Candle.query.filter(
+        Candle.symbol == symbol,
+        Candle.parent_candle_id.isnot(None)
+    ).update({Candle.parent_candle_id: None}, synchronize_session=False)
+    Candle.query.filter(
+        Candle.symbol == symbol,
+        Candle.timeframe.in_(higher_timeframes)
+    ).delete(synchronize_session=False)
     
-    # Group candles into the higher timeframe
-    higher_tf_candles = []
+    arrays = load_candle_arrays(symbol, TimeframeEnum.M1)
+    logger.info(f"Loaded {len(arrays['minute'])} 1-minute candles for {symbol}")
     
-    # Get start time aligned to the timeframe boundary
-    if one_min_candles:
-        first_candle = one_min_candles[0]
-        start_time = first_candle.timestamp.replace(
-            second=0, microsecond=0, 
-            minute=(first_candle.timestamp.minute // interval_minutes) * interval_minutes
+    counts = {}
+    for timeframe_enum in higher_timeframes:
+        arrays = aggregate_candle_arrays(arrays, TIMEFRAME_MINUTES[timeframe_enum])
+        counts[timeframe_enum.value] = bulk_insert_candles(
+            candle_arrays_to_frame(arrays), symbol, timeframe_enum, batch_size
         )
-        
-        # Group the candles by the timeframe
-        current_group = []
-        current_time = start_time
-        
-        for candle in one_min_candles:
-            next_time = current_time + timedelta(minutes=interval_minutes)
-            
-            if candle.timestamp >= next_time:
-                # Create a new higher timeframe candle from the current group
-                if current_group:
-                    higher_tf_candle = create_aggregated_candle(current_group, symbol, timeframe_enum, current_time)
-                    higher_tf_candles.append(higher_tf_candle)
-                
-                # Update the current time and clear the group
-                while candle.timestamp >= next_time:
-                    current_time = next_time
-                    next_time = current_time + timedelta(minutes=interval_minutes)
-                
-                current_group = [candle]
-            else:
-                current_group.append(candle)
-        
-        # Process any remaining candles
-        if current_group:
-            higher_tf_candle = create_aggregated_candle(current_group, symbol, timeframe_enum, current_time)
-            higher_tf_candles.append(higher_tf_candle)
+        logger.info(f"Generated {counts[timeframe_enum.value]} {timeframe_enum.value} candles")
     
-    # Add to database
-    db.session.add_all(higher_tf_candles)
     db.session.commit()
     
-    # Now link each 1-minute candle to its parent higher timeframe candle
-    for higher_tf_candle in higher_tf_candles:
-        # Find all 1-minute candles within this higher timeframe period
-        start_time = higher_tf_candle.timestamp
-        end_time = start_time + timedelta(minutes=interval_minutes)
-        
-        child_candles = Candle.query.filter(
-            Candle.symbol == symbol,
-            Candle.timeframe == TimeframeEnum.M1,
-            Candle.timestamp >= start_time,
-            Candle.timestamp < end_time
-        ).all()
+    link_unlinked_timeframes(symbol)
+    
+    return counts
+
+def reaggregate_touched_buckets(symbol, touched_buckets, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    Rebuild only the higher timeframe candles that contain new 1-minute candles.
+
+    touched_buckets are the 5m bucket keys of the new candles. The 1-minute
+    candles of every touched 4H bucket are loaded, the cascade is rerun over
+    them, and only the touched bucket of each timeframe is upserted. New
+    candles are then linked to their parents, so the cost follows the size
+    of the new data rather than the full history. Returns the number of
+    candles written per timeframe.
+    """
+    counts = {tf.value: 0 for tf in TIMEFRAME_CASCADE[1:]}
+    if len(touched_buckets) == 0:
+        return counts
+    
+    touched_minutes = np.asarray(touched_buckets, dtype=np.int64) * TIMEFRAME_MINUTES[TimeframeEnum.M5]
+    
+    # Contiguous runs of touched top-level buckets, as 1-minute bucket key ranges
+    top_minutes = TIMEFRAME_MINUTES[TIMEFRAME_CASCADE[-1]]
+    top_buckets = np.unique(touched_minutes // top_minutes)
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(top_buckets) > 1) + 1))
+    run_ends = np.concatenate((run_starts[1:], [len(top_buckets)])) - 1
+    ranges = [
+        (int(top_buckets[first]) * top_minutes, (int(top_buckets[last]) + 1) * top_minutes - 1)
+        for first, last in zip(run_starts, run_ends)
+    ]
+    
+    # Load in batches of ranges to keep each query's parameter count bounded
+    parts = [
+        load_candle_arrays(symbol, TimeframeEnum.M1, ranges[start:start + 500])
+        for start in range(0, len(ranges), 500)
+    ]
+    arrays = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    
+    for timeframe_enum in TIMEFRAME_CASCADE[1:]:
+        interval_minutes = TIMEFRAME_MINUTES[timeframe_enum]
+        arrays = aggregate_candle_arrays(arrays, interval_minutes)
         
-        # Link each child candle to this higher timeframe candle
-        for child in child_candles:
-            child.parent_candle_id = higher_tf_candle.candle_id
+        touched_rows = np.isin(arrays['minute'] // interval_minutes, np.unique(touched_minutes // interval_minutes))
+        frame = candle_arrays_to_frame({key: values[touched_rows] for key, values in arrays.items()})
+        counts[timeframe_enum.value] = len(upsert_candles(frame, symbol, timeframe_enum,
+                                                          update_existing=True, batch_size=batch_size))
+    
+    db.session.commit()
+    
+    link_unlinked_timeframes(symbol)
+    
+    return counts
+
+def epoch_minute_expression(column):
+    """
+    SQL expression for a timestamp column as integer minutes since the Unix epoch
+    """
+    if db.engine.dialect.name == 'postgresql':
+        seconds = cast(func.extract('epoch', column), BigInteger)
+    else:
+        seconds = cast(func.strftime('%s', column), BigInteger)
+    return seconds // 60
+
+def backfill_bucket_keys(symbol=None):
+    """
+    Fill in bucket keys for candles stored before the column existed.
+
+    Runs one UPDATE per timeframe and returns the number of rows updated.
+    """
+    updated = 0
+    for timeframe_enum, interval_minutes in TIMEFRAME_MINUTES.items():
+        query = Candle.query.filter(
+            Candle.timeframe == timeframe_enum,
+            Candle.bucket_key.is_(None)
+        )
+        if symbol:
+            query = query.filter(Candle.symbol == symbol)
+        updated += query.update(
+            {Candle.bucket_key: epoch_minute_expression(Candle.timestamp) // interval_minutes},
+            synchronize_session=False
+        )
     
     db.session.commit()
+    return updated
+
+def link_timeframe_pair(symbol, lower_tf, higher_tf, only_unlinked=True):
+    """
+    Link the candles of one timeframe to their parents in a higher timeframe.
+
+    A single UPDATE ... FROM joins each child to its parent on the indexed
+    bucket key, instead of one query per candle. Returns the number of child
+    candles linked.
+    """
+    if lower_tf not in TIMEFRAME_MINUTES or higher_tf not in TIMEFRAME_MINUTES:
+        raise ValueError(f"Unsupported timeframe pair: {lower_tf} → {higher_tf}")
+    
+    child = Candle.__table__
+    parent = child.alias('parent')
     
-    # If we're not at the highest timeframe, link to next higher timeframe
-    if timeframe_enum != TimeframeEnum.H4:
-        next_higher_timeframes = {
-            TimeframeEnum.M5: TimeframeEnum.M15,
-            TimeframeEnum.M15: TimeframeEnum.M30,
-            TimeframeEnum.M30: TimeframeEnum.H1,
-            TimeframeEnum.H1: TimeframeEnum.H4
-        }
-        next_tf_enum = next_higher_timeframes[timeframe_enum]
-        next_tf = {v: k for k, v in timeframe_enum_map.items()}[next_tf_enum]
-        next_tf_candles = generate_higher_timeframe_candles(higher_tf_candles, next_tf)
-    
-    return higher_tf_candles
-
-def create_aggregated_candle(candles, symbol, timeframe_enum, start_time):
-    """
-    Create an aggregated candle from a group of lower timeframe candles
-    """
-    if not candles:
-        return None
-    
-    open_price = candles[0].open_price
-    close_price = candles[-1].close_price
-    high_price = max(c.high_price for c in candles)
-    low_price = min(c.low_price for c in candles)
-    volume = sum(c.volume for c in candles)
-    
-    return Candle(
-        symbol=symbol,
-        timeframe=timeframe_enum,
-        open_price=open_price,
-        close_price=close_price,
-        high_price=high_price,
-        low_price=low_price,
-        volume=volume,
-        timestamp=start_time
+    conditions = [
+        child.c.symbol == symbol,
+        child.c.timeframe == lower_tf,
+        parent.c.symbol == symbol,
+        parent.c.timeframe == higher_tf,
+        parent.c.bucket_key ==
+        child.c.bucket_key * TIMEFRAME_MINUTES[lower_tf] // TIMEFRAME_MINUTES[higher_tf]
+    ]
+    if only_unlinked:
+        conditions.append(child.c.parent_candle_id.is_(None))
+    
+    result = db.session.execute(
+        update(child).where(*conditions).values(parent_candle_id=parent.c.candle_id)
     )
+    
+    return result.rowcount
 
 def link_unlinked_timeframes(symbol):
     """
@@ -198,94 +487,23 @@ def link_unlinked_timeframes(symbol):
     - 1H candles → 4H candles
     
     The linking is done using the candle_id and parent_candle_id for
-    establishing the parent-child relationships.
+    establishing the parent-child relationships, with one set-based
+    update per timeframe pair.
     """
     logger.info(f"Linking unlinked timeframes for {symbol}")
     
-    # Define the hierarchy of timeframes
-    timeframe_hierarchy = [
-        TimeframeEnum.M1,
-        TimeframeEnum.M5,
-        TimeframeEnum.M15,
-        TimeframeEnum.M30,
-        TimeframeEnum.H1,
-        TimeframeEnum.H4
-    ]
-    
     # Link each timeframe to the next higher timeframe
-    for i in range(len(timeframe_hierarchy) - 1):
-        lower_tf = timeframe_hierarchy[i]
-        higher_tf = timeframe_hierarchy[i + 1]
-        
-        logger.info(f"Processing: {lower_tf} → {higher_tf}")
-        
-        # Calculate minutes in each timeframe based on timeframe enum
-        minutes_in_higher_tf = {
-            TimeframeEnum.M5: 5,
-            TimeframeEnum.M15: 15,
-            TimeframeEnum.M30: 30,
-            TimeframeEnum.H1: 60,
-            TimeframeEnum.H4: 240
-        }.get(higher_tf)
+    for lower_tf, higher_tf in zip(TIMEFRAME_CASCADE, TIMEFRAME_CASCADE[1:]):
+        logger.info(f"Processing: {lower_tf.value} → {higher_tf.value}")
         
-        if minutes_in_higher_tf is None:
-            raise ValueError(f"Unsupported timeframe for minutes calculation: {higher_tf}")
-        
-        # Get all candles in the lower timeframe that aren't linked yet
-        # Lower timeframe is already an enum from the hierarchy
-        unlinked_candles = Candle.query.filter(
-            Candle.symbol == symbol,
-            Candle.timeframe == lower_tf,
-            Candle.parent_candle_id.is_(None)
-        ).order_by(Candle.timestamp).all()
-        
-        if not unlinked_candles:
-            logger.info(f"No unlinked {lower_tf} candles found")
-            continue
-            
-        logger.info(f"Found {len(unlinked_candles)} unlinked {lower_tf} candles")
-        linked_count = 0
-        
-        # Get all higher timeframe candles for efficient lookup
-        # Higher timeframe is already an enum from the hierarchy
-        higher_tf_candles = {}
-        for candle in Candle.query.filter_by(symbol=symbol, timeframe=higher_tf).all():
-            higher_tf_candles[candle.timestamp] = candle
-            
-        logger.info(f"Found {len(higher_tf_candles)} {higher_tf} candles")
-        
-        # Process each unlinked candle
-        for candle in unlinked_candles:
-            # Calculate which higher timeframe candle this should belong to
-            candle_time = candle.timestamp
-            higher_tf_start = candle_time.replace(
-                second=0, microsecond=0,
-                minute=(candle_time.minute // minutes_in_higher_tf) * minutes_in_higher_tf
-            )
-            
-            # Find the matching higher timeframe candle
-            higher_tf_candle = higher_tf_candles.get(higher_tf_start)
-            
-            if higher_tf_candle:
-                # Link this candle to its parent using the candle_id
-                candle.parent_candle_id = higher_tf_candle.candle_id
-                linked_count += 1
-                
-                # Commit periodically to avoid large transactions
-                if linked_count % 1000 == 0:
-                    db.session.commit()
-                    logger.info(f"Progress: Linked {linked_count} {lower_tf} candles so far")
-            else:
-                logger.debug(f"No matching {higher_tf} candle found for {lower_tf} candle at {candle_time}")
+        linked_count = link_timeframe_pair(symbol, lower_tf, higher_tf)
+        db.session.commit()
         
         if linked_count > 0:
-            db.session.commit()
-            logger.info(f"Successfully linked {linked_count} {lower_tf} candles to {higher_tf} candles")
+            logger.info(f"Successfully linked {linked_count} {lower_tf.value} candles to {higher_tf.value} candles")
         else:
-            logger.warning(f"No {lower_tf} candles were linked to {higher_tf} candles")
+            logger.info(f"No unlinked {lower_tf.value} candles found with a matching {higher_tf.value} candle")
     
-    # Final commit to ensure all changes are saved
-    db.session.commit()
     logger.info("Timeframe linking process completed")
     
     return True
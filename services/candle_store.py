@@ -0,0 +1,330 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+
+from app import db
+from models import Candle, TimeframeEnum, TIMEFRAME_MINUTES
+from services.range_index import RangeExtremeIndex
+from services.candle_cache import (cache_path, file_stamp, write_candle_cache, open_candle_cache,
+                                   remove_candle_cache)
+from services.dataset_version_service import get_candle_version
+
+logger = logging.getLogger(__name__)
+
+# Default memory budget of the in-process candle store
+DEFAULT_CANDLE_STORE_MAX_BYTES = 256 * 1024 * 1024
+
+class CandleFrame:
+    """
+    Columnar view of the candles of one symbol and timeframe.
+
+    Each column is a NumPy array sorted by timestamp; timestamps are
+    datetime64[s]. Frames are shared between requests through the candle
+    store and must be treated as read-only.
+    """
+    COLUMNS = ('candle_id', 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'bucket_key')
+
+    def __init__(self, symbol, timeframe, candle_id, timestamp, open, high, low, close, volume, bucket_key):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.candle_id = candle_id
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.bucket_key = bucket_key
+        self._id_order = None
+        self._range_indexes = {}
+        # Store that caches this frame, told when the frame grows
+        self._store = None
+        
+        for column in self.COLUMNS:
+            getattr(self, column).setflags(write=False)
+
+    @classmethod
+    def load(cls, symbol, timeframe_enum):
+        """
+        Load a frame from the database with a single query
+        """
+        rows = db.session.query(
+            Candle.candle_id,
+            Candle.timestamp,
+            Candle.open_price,
+            Candle.high_price,
+            Candle.low_price,
+            Candle.close_price,
+            Candle.volume
+        ).filter(
+            Candle.symbol == symbol,
+            Candle.timeframe == timeframe_enum
+        ).order_by(Candle.timestamp).all()
+
+        frame = pd.DataFrame.from_records(rows, columns=cls.COLUMNS[:-1])
+        timestamp = frame['timestamp'].to_numpy(dtype='datetime64[s]')
+
+        return cls(
+            symbol=symbol,
+            timeframe=timeframe_enum,
+            candle_id=frame['candle_id'].to_numpy(dtype=np.int64),
+            timestamp=timestamp,
+            open=frame['open'].to_numpy(dtype=np.float64),
+            high=frame['high'].to_numpy(dtype=np.float64),
+            low=frame['low'].to_numpy(dtype=np.float64),
+            close=frame['close'].to_numpy(dtype=np.float64),
+            volume=frame['volume'].to_numpy(dtype=np.int64),
+            bucket_key=timestamp.astype('datetime64[m]').astype(np.int64) // TIMEFRAME_MINUTES[timeframe_enum]
+        )
+
+    @classmethod
+    def open_cache(cls, path, symbol, timeframe_enum):
+        """
+        Open a frame from an on-disk cache file, or return None if it is unusable
+        """
+        columns = open_candle_cache(path, TIMEFRAME_MINUTES[timeframe_enum])
+        if columns is None:
+            return None
+        return cls(symbol=symbol, timeframe=timeframe_enum, **columns)
+
+    def write_cache(self, path):
+        """
+        Write the frame to an on-disk cache file
+        """
+        write_candle_cache(path, {column: getattr(self, column) for column in self.COLUMNS},
+                           TIMEFRAME_MINUTES[self.timeframe])
+
+    def __len__(self):
+        return len(self.candle_id)
+
+    @property
+    def nbytes(self):
+        # Range indexes take O(n log n) memory and usually outweigh the columns
+        return (sum(getattr(self, column).nbytes for column in self.COLUMNS) +
+                sum(index.nbytes for index in list(self._range_indexes.values())))
+
+    def range_index(self, column):
+        """
+        RangeExtremeIndex over the 'low' (minimum) or 'high' (maximum)
+        column, built on first use and kept with the frame
+        """
+        index = self._range_indexes.get(column)
+        if index is None:
+            index = RangeExtremeIndex(getattr(self, column), 'min' if column == 'low' else 'max')
+            self._range_indexes[column] = index
+            if self._store is not None:
+                self._store.trim()
+        return index
+
+    def positions(self, candle_ids):
+        """
+        Row positions of the given candle ids, or -1 for ids not in the frame
+        """
+        if self._id_order is None:
+            self._id_order = np.argsort(self.candle_id, kind='stable')
+
+        candle_ids = np.asarray(candle_ids, dtype=np.int64)
+        if len(self.candle_id) == 0:
+            return np.full(len(candle_ids), -1, dtype=np.int64)
+
+        sorted_ids = self.candle_id[self._id_order]
+        found = np.minimum(np.searchsorted(sorted_ids, candle_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[found] == candle_ids, self._id_order[found], -1)
+
+
+class CandleStore:
+    """
+    Least-recently-used cache of candle frames keyed by (symbol, timeframe).
+
+    Frames are evicted oldest-first once their combined size, including the
+    range indexes built on them, exceeds the memory budget; the most recent
+    frame is always kept.
+
+    With a cache_dir, frames are memory-mapped from cache files that
+    rebuild() writes, so every worker process shares the same page-cached
+    data. A frame is reloaded when its file has been replaced since it was
+    opened; without a cache file frames fall back to the database.
+
+    invalidate() only reaches the current process, and a missing cache file
+    looks the same before and after a change, so frames are also tagged with
+    the symbol's candle version, which every worker reads from the database,
+    and reloaded once it has moved on.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CANDLE_STORE_MAX_BYTES, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._frames = OrderedDict()
+        self._stamps = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol, timeframe_enum, version=0):
+        """
+        Frame of a symbol and timeframe; version is the symbol's candle
+        version, read before any of its candles
+        """
+        key = (symbol, timeframe_enum)
+        path = cache_path(self.cache_dir, symbol, timeframe_enum) if self.cache_dir else None
+        stamp = file_stamp(path) if path else None
+
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None and self._stamps.get(key) == (stamp, version):
+                self._frames.move_to_end(key)
+                return frame
+            generation = self._generations.get(symbol, 0)
+
+        frame = None
+        if stamp is not None:
+            frame = CandleFrame.open_cache(path, symbol, timeframe_enum)
+        if frame is None:
+            stamp = None
+            frame = CandleFrame.load(symbol, timeframe_enum)
+
+        with self._lock:
+            # Don't cache a frame whose symbol was invalidated while it loaded
+            if self._generations.get(symbol, 0) == generation:
+                frame._store = self
+                self._frames[key] = frame
+                self._stamps[key] = (stamp, version)
+                self._frames.move_to_end(key)
+                self._evict()
+
+        return frame
+
+    def invalidate(self, symbol):
+        """
+        Drop every cached frame of a symbol, including its cache files
+        """
+        with self._lock:
+            self._generations[symbol] = self._generations.get(symbol, 0) + 1
+            for key in [key for key in self._frames if key[0] == symbol]:
+                del self._frames[key]
+                self._stamps.pop(key, None)
+
+        # Other workers fall back to the database until the files are rebuilt
+        if self.cache_dir:
+            for timeframe_enum in TimeframeEnum:
+                remove_candle_cache(cache_path(self.cache_dir, symbol, timeframe_enum))
+
+    def rebuild(self, symbol):
+        """
+        Invalidate a symbol and rewrite its cache files from the database
+        """
+        self.invalidate(symbol)
+        if not self.cache_dir:
+            return
+
+        for timeframe_enum in TimeframeEnum:
+            frame = CandleFrame.load(symbol, timeframe_enum)
+            if len(frame):
+                frame.write_cache(cache_path(self.cache_dir, symbol, timeframe_enum))
+
+    def trim(self):
+        """
+        Evict frames until the store fits its memory budget again, e.g.
+        after a cached frame built a range index
+        """
+        with self._lock:
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for symbol, _ in self._frames:
+                self._generations[symbol] = self._generations.get(symbol, 0) + 1
+            self._frames.clear()
+            self._stamps.clear()
+
+    @property
+    def nbytes(self):
+        return sum(frame.nbytes for frame in self._frames.values())
+
+    def _evict(self):
+        total = self.nbytes
+        while total > self.max_bytes and len(self._frames) > 1:
+            key, frame = self._frames.popitem(last=False)
+            self._stamps.pop(key, None)
+            total -= frame.nbytes
+            logger.debug(f"Evicted candle frame {key[0]} {key[1].value} ({frame.nbytes} bytes)")
+
+
+candle_store = CandleStore()
+
+def get_candle_frame(symbol, timeframe):
+    """
+    Get the cached candle frame for a symbol and timeframe ('5m' or TimeframeEnum)
+    """
+    timeframe_enum = timeframe if isinstance(timeframe, TimeframeEnum) else TimeframeEnum(timeframe)
+    _configure_store()
+    return candle_store.get(symbol, timeframe_enum, get_candle_version(symbol))
+
+def invalidate_symbol(symbol):
+    """
+    Forget cached candle frames before or after a symbol's candles change
+    """
+    _configure_store()
+    candle_store.invalidate(symbol)
+
+def rebuild_symbol_cache(symbol):
+    """
+    Forget cached candle frames of a symbol and rewrite its on-disk cache
+    files, if the cache is enabled. Call once the candles are final.
+    """
+    _configure_store()
+    candle_store.rebuild(symbol)
+
+def candle_window(frame, start=None, end=None, limit=None, max_points=None):
+    """
+    Candles of a frame between two epoch times (inclusive), as arrays.
+
+    limit keeps only the latest candles of the window. When the window
+    holds more than max_points candles, runs of consecutive candles are
+    merged into one OHLC candle each (first open, highest high, lowest low,
+    last close, summed volume, time and id of the first candle), so the
+    result never exceeds max_points rows and still shows every extreme.
+    Returns the arrays, the number of candles in the window and the number
+    of candles merged into each row.
+    """
+    times = frame.timestamp.astype(np.int64)
+    first = np.searchsorted(times, start, side='left') if start is not None else 0
+    stop = np.searchsorted(times, end, side='right') if end is not None else len(times)
+    stop = max(first, stop)
+    if limit is not None:
+        first = max(first, stop - limit)
+    count = stop - first
+
+    arrays = {
+        'id': frame.candle_id[first:stop],
+        'time': times[first:stop],
+        'open': frame.open[first:stop],
+        'high': frame.high[first:stop],
+        'low': frame.low[first:stop],
+        'close': frame.close[first:stop],
+        'volume': frame.volume[first:stop]
+    }
+
+    bucket_size = 1
+    if max_points is not None and count > max_points:
+        bucket_size = -(-count // max_points)
+        starts = np.arange(0, count, bucket_size)
+        ends = np.concatenate((starts[1:], [count]))
+        arrays = {
+            'id': arrays['id'][starts],
+            'time': arrays['time'][starts],
+            'open': arrays['open'][starts],
+            'high': np.maximum.reduceat(arrays['high'], starts),
+            'low': np.minimum.reduceat(arrays['low'], starts),
+            'close': arrays['close'][ends - 1],
+            'volume': np.add.reduceat(arrays['volume'], starts)
+        }
+
+    return arrays, count, bucket_size
+
+def _configure_store():
+    candle_store.max_bytes = current_app.config.get('CANDLE_STORE_MAX_BYTES', DEFAULT_CANDLE_STORE_MAX_BYTES)
+    candle_store.cache_dir = current_app.config.get('CANDLE_CACHE_DIR')
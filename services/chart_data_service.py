@@ -0,0 +1,172 @@
+import numpy as np
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import Candle, PriceActionPattern, FairValueGap, TradeOpportunity, AnalysisKindEnum, AnalysisTimeframeEnum
+from models import PatternTypeEnum, ValidationStatusEnum, TradeStatusEnum
+from services.analysis_run_service import latest_run_id
+from services.candle_store import get_candle_frame, candle_window
+from services.columnar import encode_categories
+
+# Category lists of the string columns sent to the chart
+PATTERN_TYPES = [pattern_type.value for pattern_type in PatternTypeEnum]
+VALIDATION_STATUSES = [status.value for status in ValidationStatusEnum]
+ANALYSIS_TIMEFRAMES = [timeframe.value for timeframe in AnalysisTimeframeEnum]
+TRADE_STATUSES = [status.value for status in TradeStatusEnum]
+
+PATTERN_CATEGORIES = {'type': PATTERN_TYPES, 'timeframe': ANALYSIS_TIMEFRAMES, 'status': VALIDATION_STATUSES}
+FVG_CATEGORIES = {'timeframe': ANALYSIS_TIMEFRAMES}
+FVG_NULLABLE = ('halfFillCandleId', 'fullFillCandleId')
+OPPORTUNITY_CATEGORIES = {'status': TRADE_STATUSES, 'patternType': PATTERN_TYPES,
+                          'patternTimeframe': ANALYSIS_TIMEFRAMES, 'fvgTimeframe': ANALYSIS_TIMEFRAMES}
+OPPORTUNITY_NULLABLE = ('exitCandleId', 'holdingBars')
+
+def load_candle_columns(symbol, timeframe, start=None, end=None, limit=None, max_points=None):
+    """
+    Candle columns of a symbol and timeframe window from the candle store,
+    downsampled to max_points rows. Returns the columns and a dict with the
+    window size and the number of candles merged into each row.
+    """
+    arrays, window_count, bucket_size = candle_window(get_candle_frame(symbol, timeframe),
+                                                      start, end, limit, max_points)
+    return arrays, {'windowCount': int(window_count), 'bucketSize': int(bucket_size)}
+
+def load_pattern_columns(symbol, timeframe, start=None, end=None):
+    """
+    Columns of the patterns of the latest completed price action run of a
+    symbol on one timeframe, ordered by time, from a single query. Pattern
+    type, timeframe and status are codes into PATTERN_CATEGORIES.
+    """
+    tf_enum = AnalysisTimeframeEnum(timeframe)
+    run_id = latest_run_id(symbol, AnalysisKindEnum.PRICE_ACTION)
+
+    query = db.session.query(
+        PriceActionPattern.pattern_id,
+        PriceActionPattern.pattern_type,
+        PriceActionPattern.validation_status,
+        Candle.timestamp,
+        Candle.close_price
+    ).join(Candle, PriceActionPattern.candle_id == Candle.candle_id).filter(
+        PriceActionPattern.timeframe == tf_enum,
+        Candle.symbol == symbol,
+        PriceActionPattern.run_id == run_id
+    )
+    query = _filter_window(query, Candle.timestamp, start, end)
+    rows = query.order_by(Candle.timestamp).all()
+
+    return {
+        'id': np.array([row[0] for row in rows], dtype=np.int64),
+        'type': encode_categories([row[1].value for row in rows], PATTERN_TYPES),
+        'timeframe': np.full(len(rows), ANALYSIS_TIMEFRAMES.index(tf_enum.value), dtype=np.int64),
+        'status': encode_categories([row[2].value if row[2] else None for row in rows], VALIDATION_STATUSES),
+        'timestamp': _epoch_seconds([row[3] for row in rows]),
+        'price': np.array([row[4] for row in rows], dtype=np.float64)
+    }
+
+def load_fvg_columns(symbol, timeframe, start=None, end=None):
+    """
+    Columns of the FVGs of the latest completed FVG run of a symbol on one
+    timeframe, ordered by start time, from a single query joining their
+    start and end candles. Missing fill candle ids are -1.
+    """
+    tf_enum = AnalysisTimeframeEnum(timeframe)
+    run_id = latest_run_id(symbol, AnalysisKindEnum.FVG)
+    start_candle = aliased(Candle)
+    end_candle = aliased(Candle)
+
+    query = db.session.query(
+        FairValueGap.fvg_id,
+        start_candle.timestamp,
+        end_candle.timestamp,
+        FairValueGap.start_price,
+        FairValueGap.end_price,
+        FairValueGap.fill_percentage,
+        FairValueGap.half_fill_candle_id,
+        FairValueGap.full_fill_candle_id
+    ).join(start_candle, FairValueGap.candle_start_id == start_candle.candle_id).\
+        join(end_candle, FairValueGap.candle_end_id == end_candle.candle_id).filter(
+        FairValueGap.timeframe == tf_enum,
+        FairValueGap.run_id == run_id,
+        start_candle.symbol == symbol
+    )
+    query = _filter_window(query, start_candle.timestamp, start, end)
+    rows = query.order_by(start_candle.timestamp).all()
+
+    return {
+        'id': np.array([row[0] for row in rows], dtype=np.int64),
+        'timeframe': np.full(len(rows), ANALYSIS_TIMEFRAMES.index(tf_enum.value), dtype=np.int64),
+        'startTime': _epoch_seconds([row[1] for row in rows]),
+        'endTime': _epoch_seconds([row[2] for row in rows]),
+        'startPrice': np.array([row[3] for row in rows], dtype=np.float64),
+        'endPrice': np.array([row[4] for row in rows], dtype=np.float64),
+        'fillPercentage': np.array([row[5] for row in rows], dtype=np.float64),
+        'halfFillCandleId': np.array([row[6] if row[6] is not None else -1 for row in rows], dtype=np.int64),
+        'fullFillCandleId': np.array([row[7] if row[7] is not None else -1 for row in rows], dtype=np.int64)
+    }
+
+def load_opportunity_columns(symbol, start=None, end=None):
+    """
+    Columns of the trade opportunities of the latest completed opportunities
+    run of a symbol, from a single query joining their CHoCH pattern, its
+    candle and their FVG. The window applies to the CHoCH candle time.
+    Missing exit times are NaN and missing exit candle ids and holding bars
+    are -1.
+    """
+    run_id = latest_run_id(symbol, AnalysisKindEnum.OPPORTUNITIES)
+
+    query = db.session.query(
+        TradeOpportunity.opportunity_id,
+        TradeOpportunity.status,
+        TradeOpportunity.entry_price,
+        TradeOpportunity.stop_loss,
+        TradeOpportunity.take_profit,
+        TradeOpportunity.creation_time,
+        TradeOpportunity.exit_candle_id,
+        TradeOpportunity.exit_time,
+        TradeOpportunity.holding_bars,
+        PriceActionPattern.pattern_type,
+        PriceActionPattern.timeframe,
+        FairValueGap.timeframe
+    ).join(PriceActionPattern, TradeOpportunity.choch_pattern_id == PriceActionPattern.pattern_id).\
+        join(Candle, PriceActionPattern.candle_id == Candle.candle_id).\
+        join(FairValueGap, TradeOpportunity.fvg_id == FairValueGap.fvg_id).filter(
+        TradeOpportunity.run_id == run_id,
+        Candle.symbol == symbol
+    )
+    query = _filter_window(query, Candle.timestamp, start, end)
+    rows = query.order_by(TradeOpportunity.creation_time, TradeOpportunity.opportunity_id).all()
+
+    return {
+        'id': np.array([row[0] for row in rows], dtype=np.int64),
+        'status': encode_categories([row[1].value for row in rows], TRADE_STATUSES),
+        'entryPrice': np.array([row[2] for row in rows], dtype=np.float64),
+        'stopLoss': np.array([row[3] for row in rows], dtype=np.float64),
+        'takeProfit': np.array([row[4] for row in rows], dtype=np.float64),
+        'creationTime': _epoch_fractional_seconds([row[5] for row in rows]),
+        'exitCandleId': np.array([row[6] if row[6] is not None else -1 for row in rows], dtype=np.int64),
+        'exitTime': _epoch_fractional_seconds([row[7] for row in rows]),
+        'holdingBars': np.array([row[8] if row[8] is not None else -1 for row in rows], dtype=np.int64),
+        'patternType': encode_categories([row[9].value for row in rows], PATTERN_TYPES),
+        'patternTimeframe': encode_categories([row[10].value for row in rows], ANALYSIS_TIMEFRAMES),
+        'fvgTimeframe': encode_categories([row[11].value for row in rows], ANALYSIS_TIMEFRAMES)
+    }
+
+def _filter_window(query, column, start, end):
+    # Window bounds are epoch seconds; candle timestamps are naive UTC
+    if start is not None:
+        query = query.filter(column >= np.datetime64(int(start), 's').astype(object))
+    if end is not None:
+        query = query.filter(column <= np.datetime64(int(end), 's').astype(object))
+    return query
+
+def _epoch_seconds(timestamps):
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+def _epoch_fractional_seconds(timestamps):
+    # Seconds plus microseconds, as datetime.timestamp() computes them; NaN for None
+    values = np.array(timestamps, dtype='datetime64[us]')
+    seconds = values.astype('datetime64[s]')
+    microseconds = (values - seconds).astype(np.int64)
+    result = seconds.astype(np.int64).astype(np.float64) + microseconds / 1e6
+    result[np.isnat(values)] = np.nan
+    return result
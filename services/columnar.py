@@ -0,0 +1,96 @@
+import json
+import struct
+
+import numpy as np
+
+# Media type of column-oriented responses, selected with ?format=columns or Accept
+COLUMNAR_MIMETYPE = 'application/vnd.market-analyzer.columns'
+COLUMNAR_FORMAT_VERSION = 1
+
+def encode_columns(columns, categories=None, nullable=(), meta=None):
+    """
+    Pack equal-length columns into one binary payload.
+
+    The payload is a little-endian uint32 header length, a UTF-8 JSON header
+    describing the columns, zero padding to an 8-byte boundary and then
+    every column as a raw little-endian buffer in header order. Float
+    columns are sent as float64 and integer columns (epoch seconds, ids) as
+    int64, so browsers can view each buffer as a typed array without
+    copying. categories maps the names of string columns to their category
+    lists; those columns hold int64 codes into the list, -1 for missing.
+    Integer columns named in nullable use -1 for missing values.
+    """
+    categories = categories or {}
+    rows = None
+    specs = []
+    buffers = []
+
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if rows is None:
+            rows = len(values)
+        elif len(values) != rows:
+            raise ValueError(f"Column {name} has {len(values)} rows, expected {rows}")
+
+        spec = {'name': name}
+        if name in categories:
+            spec['type'] = 'category'
+            spec['categories'] = list(categories[name])
+            values = values.astype('<i8')
+        elif values.dtype.kind == 'f':
+            spec['type'] = 'float64'
+            values = values.astype('<f8')
+        elif values.dtype.kind in 'iub':
+            spec['type'] = 'int64'
+            if name in nullable:
+                spec['null'] = -1
+            values = values.astype('<i8')
+        elif values.dtype.kind == 'M':
+            spec['type'] = 'int64'
+            values = values.astype('datetime64[s]').astype('<i8')
+        else:
+            raise ValueError(f"Column {name} of type {values.dtype} cannot be packed")
+
+        specs.append(spec)
+        buffers.append(np.ascontiguousarray(values).tobytes())
+
+    header = json.dumps({
+        'version': COLUMNAR_FORMAT_VERSION,
+        'rows': rows or 0,
+        'columns': specs,
+        'meta': meta or {}
+    }, separators=(',', ':')).encode('utf-8')
+    # Pad so every column buffer starts on an 8-byte boundary
+    padding = -(4 + len(header)) % 8
+
+    return b''.join([struct.pack('<I', len(header)), header, b'\0' * padding] + buffers)
+
+def encode_categories(values, categories):
+    """
+    Codes of string values in a category list, -1 for values not in it
+    """
+    lookup = {category: code for code, category in enumerate(categories)}
+    return np.array([lookup.get(value, -1) for value in values], dtype=np.int64)
+
+def columns_to_records(columns, categories=None, nullable=()):
+    """
+    Convert columns into the list of per-row dicts sent as JSON, decoding
+    category codes and turning missing values (-1 codes and nullable
+    integers, NaN floats) into None
+    """
+    categories = categories or {}
+    decoded = {}
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if name in categories:
+            names = list(categories[name])
+            decoded[name] = [names[code] if code >= 0 else None for code in values.tolist()]
+        elif values.dtype.kind == 'f':
+            decoded[name] = [None if value != value else value for value in values.tolist()]
+        elif name in nullable:
+            decoded[name] = [None if value == -1 else value for value in values.tolist()]
+        else:
+            decoded[name] = values.tolist()
+
+    names = list(decoded)
+    return [dict(zip(names, row)) for row in zip(*decoded.values())]
@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import DatasetVersion
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def get_dataset_version(symbol):
+    """
+    Current dataset version of a symbol, 0 before its data first changed
+    """
+    version = db.session.query(DatasetVersion.version).filter(DatasetVersion.symbol == symbol).scalar()
+    return version or 0
+
+def get_candle_version(symbol):
+    """
+    Current candle version of a symbol, 0 before its candles first changed
+    """
+    version = db.session.query(DatasetVersion.candle_version).filter(DatasetVersion.symbol == symbol).scalar()
+    return version or 0
+
+def bump_dataset_version(symbol, candles=False):
+    """
+    Increment the dataset version of a symbol and return the new version.
+    With candles, the candle version is incremented as well.
+
+    Call after the change is committed: readers look the version up before
+    reading the data, so a response is never stored under a version newer
+    than the data it was built from.
+    """
+    values = {'version': DatasetVersion.version + 1, 'updated_at': datetime.utcnow()}
+    if candles:
+        values['candle_version'] = func.coalesce(DatasetVersion.candle_version, 0) + 1
+    result = db.session.execute(update(DatasetVersion).where(DatasetVersion.symbol == symbol).values(**values))
+    if result.rowcount == 0:
+        db.session.add(DatasetVersion(symbol=symbol, version=1, candle_version=1 if candles else 0,
+                                      updated_at=datetime.utcnow()))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created the row first
+            db.session.rollback()
+            return bump_dataset_version(symbol, candles)
+    else:
+        db.session.commit()
+
+    return get_dataset_version(symbol)
+
+def dataset_etag(version, key):
+    """
+    Entity tag of a response: the dataset version and a digest of everything
+    else that selects the response
+    """
+    digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).hexdigest()
+    return f"{version}-{digest}"
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized responses.
+
+    Keys include the dataset version, so entries of older versions are never
+    hit again and age out as newer responses are stored. Entries are evicted
+    in least recently used order once the bodies exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        The cached (body, status, headers) of a key, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, status, headers):
+        # A body larger than the whole budget is not worth evicting everything for
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= len(previous[0])
+            self._entries[key] = (body, status, headers)
+            self._nbytes += len(body)
+            while self._nbytes > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache()
+
+def get_response_cache():
+    """
+    The process-wide response cache, sized from the app configuration
+    """
+    response_cache.max_bytes = current_app.config.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_RESPONSE_CACHE_MAX_BYTES)
+    return response_cache
@@ -1,12 +1,23 @@
 import logging
+import numpy as np
+from sqlalchemy import bindparam, update
+
 from app import db
 from models import Candle, PriceActionPattern, FairValueGap, TimeframeEnum, AnalysisTimeframeEnum
+from models import AnalysisKindEnum, TIMEFRAME_MINUTES
+from services.analysis_run_service import latest_run
+from services.candle_store import get_candle_frame
+from services.gap_index import OpenGapIndex
 
 logger = logging.getLogger(__name__)
 
-def identify_fair_value_gaps(symbol, timeframe):
+def identify_fair_value_gaps(symbol, timeframe, frame=None, run_id=None, pattern_run_id=None):
     """
-    Identify Fair Value Gaps (FVGs) for a given symbol and timeframe
+    Identify Fair Value Gaps (FVGs) for a given symbol and timeframe.
+    
+    frame is the CandleFrame of the timeframe; it is taken from the shared
+    candle store when not given. Gaps are attached to the patterns of
+    pattern_run_id and stored under run_id.
     """
     # Map string timeframe to Enum
     timeframe_enum_map = {
@@ -31,140 +42,222 @@ def identify_fair_value_gaps(symbol, timeframe):
         raise ValueError(f"Unsupported timeframe: {timeframe}")
     
     # Get candles for the specified symbol and timeframe
-    candles = Candle.query.filter_by(symbol=symbol, timeframe=candle_tf_enum).order_by(Candle.timestamp).all()
+    if frame is None:
+        frame = get_candle_frame(symbol, candle_tf_enum)
     
-    if len(candles) < 3:
+    if len(frame) < 3:
         logger.warning(f"Not enough candles to identify FVGs for {symbol} {timeframe}")
-        return []
-    
-    fvgs = []
+        return 0
     
     # Find all price action patterns for this timeframe
-    patterns = PriceActionPattern.query.filter_by(timeframe=timeframe_enum).all()
-    pattern_map = {p.candle_id: p for p in patterns}
+    patterns_query = db.session.query(PriceActionPattern.pattern_id, PriceActionPattern.candle_id).\
+        filter(PriceActionPattern.timeframe == timeframe_enum)
+    if pattern_run_id is not None:
+        patterns_query = patterns_query.filter(PriceActionPattern.run_id == pattern_run_id)
+    pattern_rows = np.array(patterns_query.all(), dtype=np.int64).reshape(-1, 2)
+    
+    # First pattern found on each candle of the frame, -1 where there is none
+    pattern_positions = frame.positions(pattern_rows[:, 1])
+    in_frame = pattern_positions >= 0
+    pattern_at = np.full(len(frame), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(pattern_at, pattern_positions[in_frame], pattern_rows[in_frame, 0])
+    pattern_at[pattern_at == np.iinfo(np.int64).max] = -1
     
     # Look for FVGs in the candle data
-    for i in range(len(candles) - 2):
-        candle1 = candles[i]
-        candle2 = candles[i + 1]
-        candle3 = candles[i + 2]
-        
-        # Check for bullish FVG: candle1's low > candle3's high
-        if candle1.low_price > candle3.high_price:
-            # Find associated pattern
-            pattern_id = None
-            for j in range(i, i + 3):
-                if candles[j].candle_id in pattern_map:
-                    pattern_id = pattern_map[candles[j].candle_id].pattern_id
-                    break
-            
-            if pattern_id is None:
-                # Use a recent pattern if one isn't directly associated
-                recent_pattern = PriceActionPattern.query.join(Candle).\
-                    filter(Candle.symbol == symbol, 
-                           Candle.timeframe == candle_tf_enum,
-                           PriceActionPattern.timeframe == timeframe_enum,
-                           Candle.timestamp < candle1.timestamp).\
-                    order_by(Candle.timestamp.desc()).first()
-                
-                if recent_pattern:
-                    pattern_id = recent_pattern.pattern_id
-            
-            if pattern_id:
-                # Create bullish FVG
-                fvg = FairValueGap(
-                    pattern_id=pattern_id,
-                    candle_start_id=candle1.candle_id,
-                    candle_end_id=candle3.candle_id,
-                    start_price=candle1.low_price,
-                    end_price=candle3.high_price,
-                    fill_percentage=0.0,
-                    timeframe=timeframe_enum
-                )
-                fvgs.append(fvg)
-        
-        # Check for bearish FVG: candle3's low > candle1's high
-        if candle3.low_price > candle1.high_price:
-            # Find associated pattern
-            pattern_id = None
-            for j in range(i, i + 3):
-                if candles[j].candle_id in pattern_map:
-                    pattern_id = pattern_map[candles[j].candle_id].pattern_id
-                    break
-            
-            if pattern_id is None:
-                # Use a recent pattern if one isn't directly associated
-                recent_pattern = PriceActionPattern.query.join(Candle).\
-                    filter(Candle.symbol == symbol, 
-                           Candle.timeframe == candle_tf_enum,
-                           PriceActionPattern.timeframe == timeframe_enum,
-                           Candle.timestamp < candle1.timestamp).\
-                    order_by(Candle.timestamp.desc()).first()
-                
-                if recent_pattern:
-                    pattern_id = recent_pattern.pattern_id
-            
-            if pattern_id:
-                # Create bearish FVG
-                fvg = FairValueGap(
-                    pattern_id=pattern_id,
-                    candle_start_id=candle1.candle_id,
-                    candle_end_id=candle3.candle_id,
-                    start_price=candle3.low_price,
-                    end_price=candle1.high_price,
-                    fill_percentage=0.0,
-                    timeframe=timeframe_enum
-                )
-                fvgs.append(fvg)
-    
-    # Calculate fill percentage for each FVG
-    for fvg in fvgs:
-        calculate_fvg_fill_percentage(fvg, candles)
-    
-    # Add all FVGs to the database
-    db.session.add_all(fvgs)
+    positions, start_prices, end_prices = find_fair_value_gaps(frame.high, frame.low)
+    
+    # Find associated pattern on one of the three candles
+    pattern_ids = np.full(len(positions), -1, dtype=np.int64)
+    for offset in (2, 1, 0):
+        candidate = pattern_at[positions + offset]
+        pattern_ids = np.where(candidate >= 0, candidate, pattern_ids)
+    
+    # Use the most recent earlier pattern if one isn't directly associated
+    pattern_candles = np.flatnonzero(pattern_at >= 0)
+    previous = np.searchsorted(frame.timestamp[pattern_candles], frame.timestamp[positions], side='left') - 1
+    missing = (pattern_ids < 0) & (previous >= 0)
+    pattern_ids[missing] = pattern_at[pattern_candles[previous[missing]]]
+    
+    # Gaps without any pattern to attach to are dropped
+    keep = pattern_ids >= 0
+    positions, start_prices, end_prices, pattern_ids = \
+        positions[keep], start_prices[keep], end_prices[keep], pattern_ids[keep]
+    
+    # Calculate fill percentage and the half and full fill candles for each FVG
+    fill_percentages, half_fill_positions, full_fill_positions = calculate_fvg_fills(
+        start_prices, end_prices, frame.range_index('low'), frame.range_index('high'), positions + 2)
+    half_fill_ids = np.where(half_fill_positions >= 0, frame.candle_id[half_fill_positions], -1)
+    full_fill_ids = np.where(full_fill_positions >= 0, frame.candle_id[full_fill_positions], -1)
+    
+    # Add all FVGs to the database in one bulk insert
+    rows = [{
+        'pattern_id': pattern_id,
+        'candle_start_id': candle_start_id,
+        'candle_end_id': candle_end_id,
+        'start_price': start_price,
+        'end_price': end_price,
+        'fill_percentage': fill_percentage,
+        'half_fill_candle_id': half_fill_id if half_fill_id >= 0 else None,
+        'full_fill_candle_id': full_fill_id if full_fill_id >= 0 else None,
+        'timeframe': timeframe_enum,
+        'run_id': run_id
+    } for (pattern_id, candle_start_id, candle_end_id, start_price, end_price, fill_percentage,
+           half_fill_id, full_fill_id) in zip(
+        pattern_ids.tolist(),
+        frame.candle_id[positions].tolist(),
+        frame.candle_id[positions + 2].tolist(),
+        start_prices.tolist(),
+        end_prices.tolist(),
+        fill_percentages.tolist(),
+        half_fill_ids.tolist(),
+        full_fill_ids.tolist()
+    )]
+    
+    if rows:
+        db.session.execute(FairValueGap.__table__.insert(), rows)
     db.session.commit()
     
-    return fvgs
+    return len(rows)
 
-def calculate_fvg_fill_percentage(fvg, candles):
+def find_fair_value_gaps(high, low):
     """
-    Calculate the fill percentage for a Fair Value Gap
+    Find three-candle Fair Value Gaps in high and low arrays.
+    
+    A bullish gap is candle 1's low above candle 3's high, a bearish gap
+    candle 3's low above candle 1's high. Returns the position of candle 1,
+    the start price and the end price of each gap, ordered by position.
     """
-    start_candle = Candle.query.get(fvg.candle_start_id)
-    end_candle = Candle.query.get(fvg.candle_end_id)
+    # Check for bullish FVG: candle1's low > candle3's high
+    bullish = low[:-2] > high[2:]
+    # Check for bearish FVG: candle3's low > candle1's high
+    bearish = low[2:] > high[:-2]
+    
+    positions = np.flatnonzero(bullish | bearish)
+    start_prices = np.where(bullish[positions], low[positions], low[positions + 2])
+    end_prices = np.where(bullish[positions], high[positions + 2], high[positions])
     
-    # Get all candles after the end candle
-    subsequent_candles = [c for c in candles if c.timestamp > end_candle.timestamp]
+    return positions, start_prices, end_prices
+
+def calculate_fvg_fills(start_prices, end_prices, low_index, high_index, end_positions):
+    """
+    Calculate how far later candles filled Fair Value Gaps.
     
-    if not subsequent_candles:
-        fvg.fill_percentage = 0.0
-        return
+    low_index and high_index are RangeExtremeIndex instances over the lows
+    and highs; end_positions are the rows of the gaps' end candles. Fill is
+    the deepest penetration into the gap by any later candle, as a
+    percentage of the gap size. Returns the fill percentages and the rows
+    of the first candles that reached the middle (half fill) and the far
+    edge (full fill) of each gap, -1 where that has not happened.
+    """
+    start_prices = np.asarray(start_prices, dtype=np.float64)
+    end_prices = np.asarray(end_prices, dtype=np.float64)
+    first_after = np.asarray(end_positions, dtype=np.int64) + 1
+    size = low_index.size
     
     # Calculate the gap size
-    gap_size = abs(fvg.start_price - fvg.end_price)
-    
-    if gap_size == 0:
-        fvg.fill_percentage = 100.0
-        return
-    
-    # Find the maximum penetration into the gap
-    max_penetration = 0.0
-    
-    for candle in subsequent_candles:
-        # For bullish FVG (start_price > end_price)
-        if fvg.start_price > fvg.end_price:
-            # Check if price went down into the gap
-            if candle.low_price < fvg.start_price:
-                penetration = min(fvg.start_price - candle.low_price, gap_size)
-                max_penetration = max(max_penetration, penetration)
-        
-        # For bearish FVG (end_price > start_price)
-        else:
-            # Check if price went up into the gap
-            if candle.high_price > fvg.start_price:
-                penetration = min(candle.high_price - fvg.start_price, gap_size)
-                max_penetration = max(max_penetration, penetration)
-    
-    # Calculate fill percentage
-    fvg.fill_percentage = (max_penetration / gap_size) * 100.0
\ No newline at end of file
+    gap_size = np.abs(start_prices - end_prices)
+    middle_prices = (start_prices + end_prices) / 2
+    
+    # For bullish FVG (start_price > end_price) price goes down into the gap,
+    # for bearish FVG (end_price > start_price) it goes up into the gap
+    downward = start_prices > end_prices
+    lowest_after = low_index.extreme(first_after, np.full(len(first_after), size))
+    highest_after = high_index.extreme(first_after, np.full(len(first_after), size))
+    penetration = np.where(downward, start_prices - lowest_after, highest_after - start_prices)
+    penetration = np.clip(penetration, 0.0, gap_size)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fill_percentages = penetration / gap_size * 100.0
+    
+    # A gap of zero size counts as filled, unless nothing came after it
+    fill_percentages = np.where(gap_size == 0, 100.0, fill_percentages)
+    fill_percentages = np.where(first_after < size, fill_percentages, 0.0)
+    
+    # First candles to trade through the middle and the far edge of the gap
+    half_fill_positions = np.where(downward,
+                                   low_index.first_reaching(first_after, middle_prices),
+                                   high_index.first_reaching(first_after, middle_prices))
+    full_fill_positions = np.where(downward,
+                                   low_index.first_reaching(first_after, end_prices),
+                                   high_index.first_reaching(first_after, end_prices))
+    
+    return fill_percentages, half_fill_positions, full_fill_positions
+
+def update_open_fvg_fills(symbol, touched_buckets):
+    """
+    Bring the fills of a symbol's open Fair Value Gaps up to date with newly
+    ingested candles.
+
+    touched_buckets are the 5m bucket keys of the new 1-minute candles, as
+    returned by ingest_csv_stream(). The open gaps of the latest FVG run,
+    those without a full fill candle, are put into an OpenGapIndex and the
+    candles of the touched buckets are applied in time order, so each
+    candle only visits the gaps it trades into. Gaps that get fully
+    filled are closed by recording their full fill candle. Gaps formed by
+    the new candles are found by the next FVG analysis. Returns the number
+    of gaps updated and closed.
+    """
+    counts = {'updated': 0, 'closed': 0}
+    run = latest_run(symbol, AnalysisKindEnum.FVG)
+    if run is None or len(touched_buckets) == 0:
+        return counts
+
+    gaps = db.session.query(
+        FairValueGap.fvg_id,
+        FairValueGap.start_price,
+        FairValueGap.end_price,
+        FairValueGap.fill_percentage,
+        FairValueGap.half_fill_candle_id,
+        Candle.timestamp
+    ).join(Candle, FairValueGap.candle_end_id == Candle.candle_id).filter(
+        FairValueGap.run_id == run.run_id,
+        FairValueGap.full_fill_candle_id.is_(None)
+    ).all()
+    if not gaps:
+        return counts
+
+    index = OpenGapIndex()
+    for fvg_id, start_price, end_price, fill_percentage, half_fill_candle_id, end_time in gaps:
+        index.add(fvg_id, start_price, end_price, np.datetime64(end_time, 's'), fill_percentage,
+                  half_fill_candle_id)
+
+    # Candles of the gaps' timeframe that contain new 1-minute candles
+    candle_tf_enum = TimeframeEnum(run.timeframes[0])
+    frame = get_candle_frame(symbol, candle_tf_enum)
+    touched_minutes = np.asarray(touched_buckets, dtype=np.int64) * TIMEFRAME_MINUTES[TimeframeEnum.M5]
+    rows = np.flatnonzero(np.isin(frame.bucket_key,
+                                  np.unique(touched_minutes // TIMEFRAME_MINUTES[candle_tf_enum])))
+
+    changed = set()
+    for candle_id, timestamp, low, high in zip(frame.candle_id[rows].tolist(), frame.timestamp[rows],
+                                               frame.low[rows].tolist(), frame.high[rows].tolist()):
+        changed.update(index.apply_candle(candle_id, timestamp, low, high))
+        if not len(index):
+            break
+
+    # Write the new fills back in one executemany update
+    updates = []
+    for fvg_id in changed:
+        fill_percentage, half_fill_candle_id, full_fill_candle_id = index.state(fvg_id)
+        updates.append({
+            'b_fvg_id': fvg_id,
+            'b_fill_percentage': fill_percentage,
+            'b_half_fill_candle_id': half_fill_candle_id,
+            'b_full_fill_candle_id': full_fill_candle_id
+        })
+        counts['closed'] += full_fill_candle_id is not None
+
+    if updates:
+        table = FairValueGap.__table__
+        db.session.execute(
+            update(table).where(table.c.fvg_id == bindparam('b_fvg_id')).values(
+                fill_percentage=bindparam('b_fill_percentage'),
+                half_fill_candle_id=bindparam('b_half_fill_candle_id'),
+                full_fill_candle_id=bindparam('b_full_fill_candle_id')
+            ),
+            updates
+        )
+    db.session.commit()
+
+    counts['updated'] = len(updates)
+    return counts
@@ -0,0 +1,113 @@
+from bisect import bisect_right, insort
+
+class OpenGapIndex:
+    """
+    Open Fair Value Gaps of one symbol and timeframe, ordered by the price
+    each gap has been filled to so far.
+
+    Gaps filled downward (start above end) are touched by a candle whose low
+    trades below their fill level, gaps filled upward by a candle whose high
+    trades above it. Each side is kept sorted so that the gaps a candle
+    touches are the tail of its list, found by bisection. Every gap the
+    candle fills moves to the candle's price, which sorts before the levels
+    of the other touched gaps. The tail is therefore rebuilt in order
+    without searching, so applying a candle costs O(log n) plus the number
+    of gaps it touches. Gaps that get fully filled are closed and leave the
+    index.
+    """
+
+    def __init__(self):
+        self._gaps = {}
+        # (key, fvg_id) pairs sorted by key: the fill level of downward gaps,
+        # the negated fill level of upward gaps
+        self._down = []
+        self._up = []
+
+    def __len__(self):
+        # Number of open gaps
+        return len(self._down) + len(self._up)
+
+    def add(self, fvg_id, start_price, end_price, end_time, fill_percentage=0.0,
+            half_fill_candle_id=None):
+        """
+        Track an open gap. end_time is the timestamp of the gap's last
+        candle; only later candles fill it.
+        """
+        gap_size = abs(start_price - end_price)
+        penetration = gap_size * min(max(fill_percentage or 0.0, 0.0), 100.0) / 100.0
+        downward = start_price > end_price
+        level = start_price - penetration if downward else start_price + penetration
+
+        self._gaps[fvg_id] = {
+            'start_price': start_price,
+            'end_price': end_price,
+            'middle_price': (start_price + end_price) / 2,
+            'gap_size': gap_size,
+            'downward': downward,
+            'end_time': end_time,
+            'level': level,
+            'fill_percentage': fill_percentage or 0.0,
+            'half_fill_candle_id': half_fill_candle_id,
+            'full_fill_candle_id': None
+        }
+        if downward:
+            insort(self._down, (level, fvg_id))
+        else:
+            insort(self._up, (-level, fvg_id))
+
+    def apply_candle(self, candle_id, timestamp, low, high):
+        """
+        Fill the gaps a new candle trades into.
+
+        Returns the ids of the gaps whose fill changed; closed gaps are
+        removed from the index.
+        """
+        # Downward gaps with a fill level above the low, upward gaps with one below the high
+        changed = self._apply(self._down, low, candle_id, timestamp, low)
+        changed += self._apply(self._up, -high, candle_id, timestamp, high)
+        return changed
+
+    def state(self, fvg_id):
+        """
+        Fill percentage and half and full fill candle ids of a tracked gap
+        """
+        gap = self._gaps[fvg_id]
+        return gap['fill_percentage'], gap['half_fill_candle_id'], gap['full_fill_candle_id']
+
+    def _fill(self, gap, candle_id, price, penetration):
+        downward = gap['downward']
+        gap['level'] = price
+        gap['fill_percentage'] = penetration / gap['gap_size'] * 100.0 if gap['gap_size'] else 100.0
+
+        reached_middle = price <= gap['middle_price'] if downward else price >= gap['middle_price']
+        if reached_middle and gap['half_fill_candle_id'] is None:
+            gap['half_fill_candle_id'] = candle_id
+
+        reached_end = price <= gap['end_price'] if downward else price >= gap['end_price']
+        if reached_end:
+            gap['full_fill_candle_id'] = candle_id
+
+    def _apply(self, side, key, candle_id, timestamp, price):
+        # The touched gaps are the entries of the side above key
+        first = bisect_right(side, (key, float('inf')))
+        touched, side[first:] = side[first:], []
+
+        changed = []
+        waiting = []
+        for entry in touched:
+            fvg_id = entry[1]
+            gap = self._gaps[fvg_id]
+            if timestamp <= gap['end_time']:
+                # Formed after this candle, keeps its place
+                waiting.append(entry)
+                continue
+
+            penetration = gap['start_price'] - price if gap['downward'] else price - gap['start_price']
+            self._fill(gap, candle_id, price, min(penetration, gap['gap_size']))
+            changed.append(fvg_id)
+            # Closed gaps keep their final state but are no longer indexed
+            if gap['full_fill_candle_id'] is None:
+                side.append((key, fvg_id))
+
+        side.extend(waiting)
+        return changed
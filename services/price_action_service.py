@@ -1,15 +1,22 @@
 import logging
-from sqlalchemy import and_, func
-from datetime import timedelta
+import numpy as np
+from sqlalchemy import and_, bindparam, func, update
 
 from app import db
 from models import Candle, PriceActionPattern, TimeframeEnum, AnalysisTimeframeEnum, PatternTypeEnum, ValidationStatusEnum
+from services.candle_store import get_candle_frame
 
 logger = logging.getLogger(__name__)
 
-def identify_price_action_patterns(symbol, timeframe):
+# Minimum number of candles between two swings for a change of character
+CHOCH_MIN_BARS = 5
+
+def identify_price_action_patterns(symbol, timeframe, frame=None, run_id=None):
     """
-    Identify price action patterns for a given symbol and timeframe
+    Identify price action patterns for a given symbol and timeframe.
+    
+    frame is the CandleFrame of the timeframe; it is taken from the shared
+    candle store when not given. The patterns are stored under run_id.
     """
     # Map string timeframe to Enum
     timeframe_enum_map = {
@@ -23,162 +30,38 @@ def identify_price_action_patterns(symbol, timeframe):
     if not timeframe_enum:
         raise ValueError(f"Unsupported timeframe for analysis: {timeframe}")
     
-    # Map string timeframe to candle timeframe Enum
-    candle_timeframe_map = {
-        '5m': TimeframeEnum.M5,
-        '15m': TimeframeEnum.M15,
-        '30m': TimeframeEnum.M30,
-        '1H': TimeframeEnum.H1
-    }
-    
-    candle_tf_enum = candle_timeframe_map.get(timeframe)
-    
     # Get candles for the specified symbol and timeframe
-    candles = Candle.query.filter_by(symbol=symbol, timeframe=candle_tf_enum).order_by(Candle.timestamp).all()
+    if frame is None:
+        frame = get_candle_frame(symbol, timeframe)
     
-    if len(candles) < 5:
+    if len(frame) < 5:
         logger.warning(f"Not enough candles to identify patterns for {symbol} {timeframe}")
         return []
     
+    high, low, close = frame.high, frame.low, frame.close
+    candle_ids = frame.candle_id.tolist()
     patterns = []
     
-    # Identify swing highs and lows
-    for i in range(2, len(candles) - 2):
-        current = candles[i]
-        
-        # Check for swing high (HH or LH)
-        if (current.high_price > candles[i-1].high_price and 
-            current.high_price > candles[i-2].high_price and 
-            current.high_price > candles[i+1].high_price and 
-            current.high_price > candles[i+2].high_price):
-            
-            # Find previous swing high
-            prev_high = None
-            for j in range(i-3, max(0, i-20), -1):
-                if (candles[j].high_price > candles[j-1].high_price and 
-                    candles[j].high_price > candles[j-2].high_price and 
-                    candles[j].high_price > candles[j+1].high_price and 
-                    candles[j].high_price > candles[j+2].high_price):
-                    prev_high = candles[j]
-                    break
-            
-            if prev_high:
-                # Higher High (HH)
-                if current.high_price > prev_high.high_price:
-                    pattern = PriceActionPattern(
-                        candle_id=current.candle_id,
-                        pattern_type=PatternTypeEnum.HH,
-                        timeframe=timeframe_enum,
-                        validation_status=ValidationStatusEnum.PENDING
-                    )
-                    patterns.append(pattern)
-                
-                # Lower High (LH)
-                elif current.high_price < prev_high.high_price:
-                    pattern = PriceActionPattern(
-                        candle_id=current.candle_id,
-                        pattern_type=PatternTypeEnum.LH,
-                        timeframe=timeframe_enum,
-                        validation_status=ValidationStatusEnum.PENDING
-                    )
-                    patterns.append(pattern)
-        
-        # Check for swing low (LL or HL)
-        if (current.low_price < candles[i-1].low_price and 
-            current.low_price < candles[i-2].low_price and 
-            current.low_price < candles[i+1].low_price and 
-            current.low_price < candles[i+2].low_price):
-            
-            # Find previous swing low
-            prev_low = None
-            for j in range(i-3, max(0, i-20), -1):
-                if (candles[j].low_price < candles[j-1].low_price and 
-                    candles[j].low_price < candles[j-2].low_price and 
-                    candles[j].low_price < candles[j+1].low_price and 
-                    candles[j].low_price < candles[j+2].low_price):
-                    prev_low = candles[j]
-                    break
-            
-            if prev_low:
-                # Lower Low (LL)
-                if current.low_price < prev_low.low_price:
-                    pattern = PriceActionPattern(
-                        candle_id=current.candle_id,
-                        pattern_type=PatternTypeEnum.LL,
-                        timeframe=timeframe_enum,
-                        validation_status=ValidationStatusEnum.PENDING
-                    )
-                    patterns.append(pattern)
-                
-                # Higher Low (HL)
-                elif current.low_price > prev_low.low_price:
-                    pattern = PriceActionPattern(
-                        candle_id=current.candle_id,
-                        pattern_type=PatternTypeEnum.HL,
-                        timeframe=timeframe_enum,
-                        validation_status=ValidationStatusEnum.PENDING
-                    )
-                    patterns.append(pattern)
-    
-    # Identify BOS (Break of Structure)
-    for i in range(4, len(candles) - 1):
-        current = candles[i]
-        
-        # Bullish BOS
-        if (current.close_price > candles[i-1].high_price and
-            candles[i-1].high_price > candles[i-2].high_price and
-            candles[i-2].high_price > candles[i-3].high_price):
-            
-            pattern = PriceActionPattern(
-                candle_id=current.candle_id,
-                pattern_type=PatternTypeEnum.BOS,
-                timeframe=timeframe_enum,
-                validation_status=ValidationStatusEnum.PENDING
-            )
-            patterns.append(pattern)
-        
-        # Bearish BOS
-        if (current.close_price < candles[i-1].low_price and
-            candles[i-1].low_price < candles[i-2].low_price and
-            candles[i-2].low_price < candles[i-3].low_price):
-            
-            pattern = PriceActionPattern(
-                candle_id=current.candle_id,
-                pattern_type=PatternTypeEnum.BOS,
-                timeframe=timeframe_enum,
-                validation_status=ValidationStatusEnum.PENDING
-            )
-            patterns.append(pattern)
-    
-    # Identify CHoCH (Change of Character)
-    # First, get all HH, HL, LH, LL patterns
-    for i in range(len(patterns)):
-        pattern = patterns[i]
-        if pattern.pattern_type in [PatternTypeEnum.HH, PatternTypeEnum.HL, PatternTypeEnum.LH, PatternTypeEnum.LL]:
-            candle = Candle.query.get(pattern.candle_id)
-            
-            # Look for patterns that occur after this one
-            for j in range(i + 1, len(patterns)):
-                next_pattern = patterns[j]
-                next_candle = Candle.query.get(next_pattern.candle_id)
-                
-                # Check if next pattern is at least 5 candles later
-                if (next_candle.timestamp - candle.timestamp).total_seconds() < 5 * 60:
-                    continue
-                
-                # Check for CHoCH
-                if ((pattern.pattern_type == PatternTypeEnum.HH and next_pattern.pattern_type == PatternTypeEnum.LH) or
-                    (pattern.pattern_type == PatternTypeEnum.HL and next_pattern.pattern_type == PatternTypeEnum.LL) or
-                    (pattern.pattern_type == PatternTypeEnum.LH and next_pattern.pattern_type == PatternTypeEnum.HH) or
-                    (pattern.pattern_type == PatternTypeEnum.LL and next_pattern.pattern_type == PatternTypeEnum.HL)):
-                    
-                    choch_pattern = PriceActionPattern(
-                        candle_id=next_candle.candle_id,
-                        pattern_type=PatternTypeEnum.CHOCH,
-                        timeframe=timeframe_enum,
-                        validation_status=ValidationStatusEnum.PENDING
-                    )
-                    patterns.append(choch_pattern)
+    def add_pattern(i, pattern_type):
+        patterns.append(PriceActionPattern(
+            candle_id=candle_ids[i],
+            pattern_type=pattern_type,
+            timeframe=timeframe_enum,
+            validation_status=ValidationStatusEnum.PENDING,
+            run_id=run_id
+        ))
+    
+    # Identify swing highs and lows, then BOS (Break of Structure)
+    swing_positions, swing_types = find_swing_patterns(high, low)
+    for position, pattern_type in zip(swing_positions, swing_types):
+        add_pattern(position, pattern_type)
+    
+    for position, pattern_type in zip(*find_bos_patterns(high, low, close)):
+        add_pattern(position, pattern_type)
+    
+    # Identify CHoCH (Change of Character) from the swing sequence
+    for position in find_choch_positions(swing_positions, swing_types):
+        add_pattern(position, PatternTypeEnum.CHOCH)
     
     # Add all patterns to the database
     db.session.add_all(patterns)
@@ -186,9 +69,130 @@ def identify_price_action_patterns(symbol, timeframe):
     
     return patterns
 
-def validate_patterns(symbol, pivot_timeframe, timeframes):
+def _swing_mask(values, compare):
     """
-    Validate price action patterns against other timeframes
+    Mask of candles whose value beats the two candles on either side
+    """
+    mask = np.zeros(len(values), dtype=bool)
+    centre = values[2:-2]
+    mask[2:-2] = (compare(centre, values[1:-3]) & compare(centre, values[:-4]) &
+                  compare(centre, values[3:-1]) & compare(centre, values[4:]))
+    return mask
+
+def _classify_swings(values, compare, higher_type, lower_type):
+    """
+    Classify each swing against the previous swing at most 19 candles back
+    """
+    positions = np.arange(len(values))
+    swings = _swing_mask(values, compare)
+    
+    # Candidates for the previous swing. Candle 1 is also checked against
+    # values[-1] (the last candle), as the lookback always has been.
+    candidates = swings.copy()
+    candidates[1] = (compare(values[1], values[0]) and compare(values[1], values[-1]) and
+                     compare(values[1], values[2]) and compare(values[1], values[3]))
+    
+    # Latest candidate at or before each position
+    latest = np.maximum.accumulate(np.where(candidates, positions, -1))
+    
+    current = np.flatnonzero(swings)
+    current = current[current >= 4]
+    previous = latest[current - 3]
+    found = previous >= np.maximum(1, current - 19)
+    current, previous = current[found], previous[found]
+    
+    # Equal swings are neither higher nor lower
+    higher = values[current] > values[previous]
+    classified = higher | (values[current] < values[previous])
+    pattern_types = np.array([lower_type, higher_type], dtype=object)[higher.astype(np.int64)]
+    
+    return current[classified], pattern_types[classified]
+
+def find_swing_patterns(high, low):
+    """
+    Find swing highs (HH/LH) and swing lows (LL/HL) in high and low arrays.
+    
+    A swing is compared with the nearest earlier swing between 3 and 19
+    candles back. Returns (positions, pattern_types) ordered by position,
+    with the swing high first when a candle is both.
+    """
+    if len(high) < 5:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+    
+    high_positions, high_types = _classify_swings(high, np.greater, PatternTypeEnum.HH, PatternTypeEnum.LH)
+    low_positions, low_types = _classify_swings(low, np.less, PatternTypeEnum.HL, PatternTypeEnum.LL)
+    
+    positions = np.concatenate((high_positions, low_positions))
+    sides = np.concatenate((np.zeros(len(high_positions)), np.ones(len(low_positions))))
+    order = np.lexsort((sides, positions))
+    
+    return positions[order], np.concatenate((high_types, low_types))[order]
+
+def find_bos_patterns(high, low, close):
+    """
+    Find breaks of structure: a close beyond three consecutive higher highs
+    (bullish) or lower lows (bearish). Returns (positions, pattern_types)
+    ordered by position.
+    """
+    if len(close) < 5:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+    
+    i = np.arange(4, len(close) - 1)
+    bullish = (close[i] > high[i-1]) & (high[i-1] > high[i-2]) & (high[i-2] > high[i-3])
+    bearish = (close[i] < low[i-1]) & (low[i-1] < low[i-2]) & (low[i-2] < low[i-3])
+    
+    positions = np.concatenate((i[bullish], i[bearish]))
+    sides = np.concatenate((np.zeros(bullish.sum()), np.ones(bearish.sum())))
+    order = np.lexsort((sides, positions))
+    
+    return positions[order], np.full(len(positions), PatternTypeEnum.BOS, dtype=object)
+
+def find_choch_positions(swing_positions, swing_types, min_bars=CHOCH_MIN_BARS):
+    """
+    Find changes of character in a swing sequence from find_swing_patterns.
+    
+    Swing highs (HH/LH) and swing lows (HL/LL) are followed separately: a
+    swing changes character when any earlier swing of the opposite type on
+    its side (LH for an HH, HH for an LH, LL for an HL, HL for an LL) is at
+    least min_bars candles before it. The earliest such swing is the
+    furthest back, so each swing is only compared with it. Returns the
+    sorted, unique positions of those swings.
+    """
+    swing_positions = np.asarray(swing_positions, dtype=np.int64)
+    swing_types = np.asarray(swing_types, dtype=object)
+    choch_positions = [np.empty(0, dtype=np.int64)]
+    
+    for side_types in ((PatternTypeEnum.HH, PatternTypeEnum.LH), (PatternTypeEnum.HL, PatternTypeEnum.LL)):
+        on_side = (swing_types == side_types[0]) | (swing_types == side_types[1])
+        positions = swing_positions[on_side]
+        is_first_type = swing_types[on_side] == side_types[0]
+        
+        # Later swings of the other type against the earliest swing of each type
+        for is_opposite in (is_first_type, ~is_first_type):
+            if not is_opposite.any():
+                continue
+            earliest = np.argmax(is_opposite)
+            changed = ((np.arange(len(positions)) > earliest) & ~is_opposite &
+                       (positions - positions[earliest] >= min_bars))
+            choch_positions.append(positions[changed])
+    
+    return np.unique(np.concatenate(choch_positions))
+
+def validate_patterns(symbol, pivot_timeframe, timeframes, run_id=None):
+    """
+    Validate price action patterns against other timeframes.
+    
+    A pivot pattern is confirmed by a higher timeframe whose containing
+    candle has a pattern of the same type, and contradicted when that candle
+    only has contradicting types. A lower timeframe confirms (contradicts)
+    when more (fewer) of the candles inside the pivot candle have a pattern
+    of the same type than a contradicting one. Patterns with more
+    confirmations than contradictions are VALID, all others INVALID.
+    
+    All patterns of the symbol are loaded once and joined as arrays; the
+    statuses are written back with one bulk update. Only the patterns of
+    run_id are considered when it is given. Returns the number of validated
+    pivot patterns.
     """
     # Map string timeframe to Enum
     timeframe_enum_map = {
@@ -210,144 +214,122 @@ def validate_patterns(symbol, pivot_timeframe, timeframes):
     if not pivot_tf_enum:
         raise ValueError(f"Unsupported pivot timeframe: {pivot_timeframe}")
     
-    # Get all patterns for the pivot timeframe
-    pivot_patterns = PriceActionPattern.query.filter_by(timeframe=pivot_tf_enum).all()
+    # Load every pattern of the symbol with its candle's timeframe and start minute
+    query = db.session.query(
+        PriceActionPattern.pattern_id,
+        PriceActionPattern.pattern_type,
+        PriceActionPattern.timeframe,
+        Candle.timeframe,
+        Candle.timestamp
+    ).join(Candle, PriceActionPattern.candle_id == Candle.candle_id).\
+        filter(Candle.symbol == symbol)
+    if run_id is not None:
+        query = query.filter(PriceActionPattern.run_id == run_id)
+    rows = query.all()
+    
+    if not rows:
+        return 0
+    
+    pattern_ids, pattern_types, analysis_tfs, candle_tfs, timestamps = zip(*rows)
+    pattern_ids = np.array(pattern_ids, dtype=np.int64)
+    type_codes = np.array([PATTERN_TYPE_CODES[t] for t in pattern_types], dtype=np.int64)
+    analysis_tfs = np.array(analysis_tfs, dtype=object)
+    candle_tfs = np.array(candle_tfs, dtype=object)
+    minutes = np.array(timestamps, dtype='datetime64[m]').astype(np.int64)
+    
+    pivot = analysis_tfs == pivot_tf_enum
+    pivot_ids = pattern_ids[pivot]
+    pivot_types = type_codes[pivot]
+    pivot_minutes = minutes[pivot]
+    pivot_minutes_span = get_timeframe_minutes(pivot_timeframe)
     
-    for pattern in pivot_patterns:
-        pivot_candle = Candle.query.get(pattern.candle_id)
+    confirmations = np.zeros(len(pivot_ids), dtype=np.int64)
+    contradictions = np.zeros(len(pivot_ids), dtype=np.int64)
+    
+    for tf in timeframes:
+        if tf == pivot_timeframe:
+            continue
         
-        # Initialize validation counts
-        confirmations = 0
-        contradictions = 0
+        tf_enum = timeframe_enum_map.get(tf)
+        candle_tf_enum = candle_timeframe_map.get(tf)
         
-        # Check other timeframes for confirmation or contradiction
-        for tf in timeframes:
-            if tf == pivot_timeframe:
-                continue
+        if not tf_enum or not candle_tf_enum:
+            logger.warning(f"Skipping unsupported timeframe: {tf}")
+            continue
+        
+        # Pattern types present on each candle of this timeframe
+        on_tf = candle_tfs == candle_tf_enum
+        candle_minutes, has_type = _pattern_type_presence(minutes[on_tf], type_codes[on_tf])
+        if len(candle_minutes) == 0:
+            # Nothing on this timeframe can confirm or contradict
+            continue
+        contradicts = has_type.astype(np.int64) @ CONTRADICTION_MATRIX.T.astype(np.int64) > 0
+        
+        if compare_timeframes(tf, pivot_timeframe) > 0:  # tf is higher than pivot
+            # The higher timeframe candle that contains the pivot candle
+            tf_minutes = get_timeframe_minutes(tf)
+            rows_found = _lookup_rows(candle_minutes, pivot_minutes // tf_minutes * tf_minutes)
+            found = rows_found >= 0
+            safe_rows = np.where(found, rows_found, 0)
             
-            tf_enum = timeframe_enum_map.get(tf)
-            candle_tf_enum = candle_timeframe_map.get(tf)
+            confirming = found & has_type[safe_rows, pivot_types]
+            contradicting = found & ~confirming & contradicts[safe_rows, pivot_types]
             
-            if not tf_enum or not candle_tf_enum:
-                logger.warning(f"Skipping unsupported timeframe: {tf}")
-                continue
+            confirmations += confirming
+            contradictions += contradicting
+        
+        else:  # tf is lower than or equal to pivot
+            # Count the lower timeframe candles within each pivot candle
+            start = np.searchsorted(candle_minutes, pivot_minutes, side='left')
+            end = np.searchsorted(candle_minutes, pivot_minutes + pivot_minutes_span, side='left')
             
-            # Get candles from other timeframe that overlap with the pivot candle
-            # For higher timeframes, find the candle that contains the pivot candle
-            # For lower timeframes, find candles within the pivot candle time window
+            confirming_cumsum = np.vstack((np.zeros((1, len(PATTERN_TYPE_CODES)), dtype=np.int64),
+                                           np.cumsum(has_type, axis=0)))
+            contradicting_cumsum = np.vstack((np.zeros((1, len(PATTERN_TYPE_CODES)), dtype=np.int64),
+                                              np.cumsum(contradicts, axis=0)))
             
-            if compare_timeframes(tf, pivot_timeframe) > 0:  # tf is higher than pivot
-                # Find the higher timeframe candle that contains the pivot candle
-                higher_tf_candle = find_containing_candle(pivot_candle, candle_tf_enum)
-                
-                if higher_tf_candle:
-                    # Check if this candle has a pattern of the same type
-                    higher_patterns = PriceActionPattern.query.filter_by(
-                        candle_id=higher_tf_candle.candle_id,
-                        pattern_type=pattern.pattern_type
-                    ).all()
-                    
-                    if higher_patterns:
-                        confirmations += 1
-                    else:
-                        # Check if it has a contradicting pattern
-                        contradicting_types = get_contradicting_pattern_types(pattern.pattern_type)
-                        # Using individual filter_by queries since SQLite doesn't support in_
-                        contradicting_patterns = []
-                        for c_type in contradicting_types:
-                            patterns = PriceActionPattern.query.filter_by(
-                                candle_id=higher_tf_candle.candle_id,
-                                pattern_type=c_type
-                            ).all()
-                            contradicting_patterns.extend(patterns)
-                        
-                        if contradicting_patterns:
-                            contradictions += 1
+            confirming_count = confirming_cumsum[end, pivot_types] - confirming_cumsum[start, pivot_types]
+            contradicting_count = contradicting_cumsum[end, pivot_types] - contradicting_cumsum[start, pivot_types]
             
-            else:  # tf is lower than or equal to pivot
-                # Find lower timeframe candles within the pivot candle time window
-                pivot_timeframe_minutes = get_timeframe_minutes(pivot_timeframe)
-                pivot_start_time = pivot_candle.timestamp
-                pivot_end_time = pivot_start_time + timedelta(minutes=pivot_timeframe_minutes)
-                
-                lower_candles = Candle.query.filter(
-                    Candle.symbol == symbol,
-                    Candle.timeframe == candle_tf_enum,
-                    Candle.timestamp >= pivot_start_time,
-                    Candle.timestamp < pivot_end_time
-                ).all()
-                
-                # Check for patterns in these candles
-                confirming_count = 0
-                contradicting_count = 0
-                
-                for lower_candle in lower_candles:
-                    # Check for confirming patterns
-                    confirming_patterns = PriceActionPattern.query.filter_by(
-                        candle_id=lower_candle.candle_id,
-                        pattern_type=pattern.pattern_type
-                    ).all()
-                    
-                    if confirming_patterns:
-                        confirming_count += 1
-                    
-                    # Check for contradicting patterns
-                    contradicting_types = get_contradicting_pattern_types(pattern.pattern_type)
-                    # Using individual filter_by queries since SQLite doesn't support in_
-                    contradicting_patterns = []
-                    for c_type in contradicting_types:
-                        patterns = PriceActionPattern.query.filter_by(
-                            candle_id=lower_candle.candle_id,
-                            pattern_type=c_type
-                        ).all()
-                        contradicting_patterns.extend(patterns)
-                    
-                    if contradicting_patterns:
-                        contradicting_count += 1
-                
-                # If more confirming than contradicting, consider it a confirmation
-                if confirming_count > contradicting_count:
-                    confirmations += 1
-                elif contradicting_count > confirming_count:
-                    contradictions += 1
-        
-        # Update pattern validation status based on confirmations and contradictions
-        if confirmations > contradictions:
-            pattern.validation_status = ValidationStatusEnum.VALID
-        else:
-            pattern.validation_status = ValidationStatusEnum.INVALID
+            # If more confirming than contradicting, consider it a confirmation
+            confirmations += confirming_count > contradicting_count
+            contradictions += contradicting_count > confirming_count
+    
+    # Update pattern validation statuses in one bulk statement
+    valid = confirmations > contradictions
+    statuses = [{
+        'b_pattern_id': int(pattern_id),
+        'b_status': ValidationStatusEnum.VALID if is_valid else ValidationStatusEnum.INVALID
+    } for pattern_id, is_valid in zip(pivot_ids, valid)]
     
+    if statuses:
+        table = PriceActionPattern.__table__
+        db.session.execute(
+            update(table).
+            where(table.c.pattern_id == bindparam('b_pattern_id')).
+            values(validation_status=bindparam('b_status')),
+            statuses
+        )
     db.session.commit()
     
-    return pivot_patterns
+    return len(statuses)
 
-def find_containing_candle(candle, higher_timeframe_enum):
+def _pattern_type_presence(minutes, type_codes):
     """
-    Find the higher timeframe candle that contains the given candle
+    Sorted unique candle start minutes and a boolean matrix of which pattern
+    types (columns, by PATTERN_TYPE_CODES) each candle has
     """
-    # Get timeframe values for calculating time windows
-    candle_tf = candle.timeframe.value
-    higher_tf = higher_timeframe_enum.value
-    
-    # Convert enum values to minutes for calculations
-    lower_tf_minutes = get_timeframe_minutes(candle_tf)
-    higher_tf_minutes = get_timeframe_minutes(higher_tf)
-    
-    # Calculate the start time of the higher timeframe candle
-    candle_time = candle.timestamp
-    higher_tf_start = candle_time.replace(
-        second=0, microsecond=0,
-        minute=(candle_time.minute // higher_tf_minutes) * higher_tf_minutes
-    )
-    
-    # Find the higher timeframe candle
-    higher_tf_candle = Candle.query.filter_by(
-        symbol=candle.symbol,
-        timeframe=higher_timeframe_enum,
-        timestamp=higher_tf_start
-    ).first()
-    
-    return higher_tf_candle
+    candle_minutes, candle_rows = np.unique(minutes, return_inverse=True)
+    has_type = np.zeros((len(candle_minutes), len(PATTERN_TYPE_CODES)), dtype=bool)
+    has_type[candle_rows, type_codes] = True
+    return candle_minutes, has_type
+
+def _lookup_rows(sorted_keys, keys):
+    """
+    Row of each key in the non-empty sorted_keys, or -1 for keys that are missing
+    """
+    rows = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return np.where(sorted_keys[rows] == keys, rows, -1)
 
 def compare_timeframes(tf1, tf2):
     """
@@ -385,3 +367,11 @@ def get_contradicting_pattern_types(pattern_type_enum):
     }
     
     return contradictions.get(pattern_type_enum, [])
+
+
+# Column of each pattern type in the validation arrays
+PATTERN_TYPE_CODES = {pattern_type: code for code, pattern_type in enumerate(PatternTypeEnum)}
+
+# CONTRADICTION_MATRIX[a, b] is True when pattern type b contradicts type a
+CONTRADICTION_MATRIX = np.array([[b in get_contradicting_pattern_types(a) for b in PatternTypeEnum]
+                                 for a in PatternTypeEnum])
@@ -0,0 +1,85 @@
+import numpy as np
+
+class RangeExtremeIndex:
+    """
+    Sparse table over a price array answering range-minimum (mode 'min') or
+    range-maximum (mode 'max') queries in constant time.
+
+    Level k holds the extreme of every window of 2**k values, so any range
+    is covered by two overlapping windows. Building takes O(n log n) time
+    and memory. All queries are vectorized over arrays of ranges.
+    """
+
+    def __init__(self, values, mode='min'):
+        if mode not in ('min', 'max'):
+            raise ValueError(f"Unsupported range index mode: {mode}")
+
+        values = np.asarray(values, dtype=np.float64)
+        self.mode = mode
+        self.size = len(values)
+        self._reduce = np.minimum if mode == 'min' else np.maximum
+        # Identity of the reduction, returned for empty ranges
+        self.empty = np.inf if mode == 'min' else -np.inf
+
+        levels = max(1, int(self.size).bit_length())
+        self._table = np.full((levels, self.size), self.empty)
+        if self.size:
+            self._table[0] = values
+        for level in range(1, levels):
+            width = 1 << level
+            half = width >> 1
+            previous = self._table[level - 1]
+            self._table[level, :self.size - width + 1] = self._reduce(previous[:self.size - width + 1],
+                                                                      previous[half:self.size - half + 1])
+
+    @property
+    def nbytes(self):
+        return self._table.nbytes
+
+    def extreme(self, starts, stops):
+        """
+        Minimum (or maximum) of values[start:stop] for each range; the
+        reduction identity for empty ranges
+        """
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, self.size)
+        stops = np.clip(np.asarray(stops, dtype=np.int64), 0, self.size)
+        lengths = stops - starts
+        nonempty = lengths > 0
+
+        result = np.full(np.shape(starts), self.empty)
+        if not nonempty.any():
+            return result
+
+        starts, stops, lengths = starts[nonempty], stops[nonempty], lengths[nonempty]
+        levels = np.floor(np.log2(lengths)).astype(np.int64)
+        # Guard against log2 rounding up just below a power of two
+        levels -= (1 << levels) > lengths
+        result[nonempty] = self._reduce(self._table[levels, starts],
+                                        self._table[levels, stops - (1 << levels)])
+        return result
+
+    def first_reaching(self, starts, levels):
+        """
+        First position at or after each start whose value is at or below
+        (mode 'min') or at or above (mode 'max') the level, or -1 if the
+        price never gets there.
+
+        Uses binary lifting over the table: whole windows that stay on the
+        wrong side of the level are skipped, largest first.
+        """
+        positions = np.asarray(starts, dtype=np.int64).copy()
+        levels = np.asarray(levels, dtype=np.float64)
+        if self.size == 0:
+            return np.full(np.shape(positions), -1, dtype=np.int64)
+        reached = np.less_equal if self.mode == 'min' else np.greater_equal
+
+        for level in range(len(self._table) - 1, -1, -1):
+            width = 1 << level
+            inside = (positions >= 0) & (positions + width <= self.size)
+            window = self._table[level, np.where(inside, positions, 0)]
+            skip = inside & ~reached(window, levels)
+            positions[skip] += width
+
+        found = (positions >= 0) & (positions < self.size)
+        found[found] = reached(self._table[0, positions[found]], levels[found])
+        return np.where(found, positions, -1)
@@ -1,16 +1,27 @@
 import logging
 from datetime import datetime
-from sqlalchemy import and_, func
+import numpy as np
 
 from app import db
 from models import Candle, PriceActionPattern, FairValueGap, TradeOpportunity
 from models import TimeframeEnum, AnalysisTimeframeEnum, PatternTypeEnum, ValidationStatusEnum, TradeStatusEnum
+from models import TIMEFRAME_MINUTES
+from services.candle_service import load_candle_arrays
+from services.candle_store import get_candle_frame
+from services.range_index import RangeExtremeIndex
 
 logger = logging.getLogger(__name__)
 
-def identify_trade_opportunities(symbol, choch_timeframe, fvg_timeframe):
+def identify_trade_opportunities(symbol, choch_timeframe, fvg_timeframe, run_id=None,
+                                 pattern_run_id=None, fvg_run_id=None, intrabar=False):
     """
-    Identify trade opportunities based on CHoCH patterns and FVGs
+    Identify trade opportunities based on CHoCH patterns and FVGs.
+    
+    Uses the patterns of pattern_run_id and the FVGs of fvg_run_id when
+    given; the opportunities are stored under run_id together with their
+    simulated outcomes. With intrabar, candles that reach both the stop
+    loss and the take profit are resolved on their 1-minute candles.
+    Returns the number of opportunities stored.
     """
     # Map string timeframe to Enum
     timeframe_enum_map = {
@@ -35,196 +46,348 @@ def identify_trade_opportunities(symbol, choch_timeframe, fvg_timeframe):
     if not choch_tf_enum or not fvg_tf_enum or not candle_choch_tf_enum:
         raise ValueError(f"Unsupported timeframe: choch={choch_timeframe}, fvg={fvg_timeframe}")
     
-    # Get all valid CHoCH patterns for the specified timeframe
-    choch_patterns = PriceActionPattern.query.join(Candle).\
+    # Get all valid CHoCH patterns for the specified timeframe, ordered by time
+    choch_query = db.session.query(PriceActionPattern.pattern_id, PriceActionPattern.candle_id, Candle.timestamp).\
+        join(Candle, PriceActionPattern.candle_id == Candle.candle_id).\
         filter(Candle.symbol == symbol,
                PriceActionPattern.timeframe == choch_tf_enum,
                PriceActionPattern.pattern_type == PatternTypeEnum.CHOCH,
-               PriceActionPattern.validation_status == ValidationStatusEnum.VALID).\
-        order_by(Candle.timestamp).all()
-    
-    opportunities = []
-    
-    for pattern in choch_patterns:
-        # Get the candle where this pattern was identified
-        pattern_candle = Candle.query.get(pattern.candle_id)
-        
-        # Find FVGs on the lower timeframe that occurred after this pattern
-        fvgs = FairValueGap.query.join(Candle, FairValueGap.candle_start_id == Candle.candle_id).\
-            filter(Candle.symbol == symbol,
-                   FairValueGap.timeframe == fvg_tf_enum,
-                   Candle.timestamp >= pattern_candle.timestamp).\
-            order_by(Candle.timestamp).all()
-        
-        if fvgs:
-            # Take the first FVG that occurs after the CHoCH
-            fvg = fvgs[0]
-            
-            # Create a trade opportunity
-            # For risk management, we'll use 1:2 risk-reward ratio
-            entry_price, stop_loss, take_profit = calculate_trade_levels(pattern, fvg)
-            
-            opportunity = TradeOpportunity(
-                choch_pattern_id=pattern.pattern_id,
-                fvg_id=fvg.fvg_id,
-                entry_price=entry_price,
-                stop_loss=stop_loss,
-                take_profit=take_profit,
-                status=TradeStatusEnum.PENDING,
-                creation_time=datetime.utcnow()
-            )
-            
-            opportunities.append(opportunity)
-    
-    # Add all opportunities to the database
-    db.session.add_all(opportunities)
-    db.session.commit()
+               PriceActionPattern.validation_status == ValidationStatusEnum.VALID)
+    if pattern_run_id is not None:
+        choch_query = choch_query.filter(PriceActionPattern.run_id == pattern_run_id)
+    choch_rows = choch_query.order_by(Candle.timestamp, PriceActionPattern.pattern_id).all()
+    
+    # Get all FVGs of the lower timeframe, ordered by the time they start
+    fvg_query = db.session.query(FairValueGap.fvg_id, FairValueGap.start_price, FairValueGap.end_price,
+                                 Candle.timestamp).\
+        join(Candle, FairValueGap.candle_start_id == Candle.candle_id).\
+        filter(Candle.symbol == symbol,
+               FairValueGap.timeframe == fvg_tf_enum)
+    if fvg_run_id is not None:
+        fvg_query = fvg_query.filter(FairValueGap.run_id == fvg_run_id)
+    fvg_rows = fvg_query.order_by(Candle.timestamp, FairValueGap.fvg_id).all()
+    
+    if not choch_rows or not fvg_rows:
+        db.session.commit()
+        return 0
+    
+    choch_ids = np.array([row[0] for row in choch_rows], dtype=np.int64)
+    choch_candle_ids = np.array([row[1] for row in choch_rows], dtype=np.int64)
+    choch_times = np.array([row[2] for row in choch_rows], dtype='datetime64[s]')
+    fvg_ids = np.array([row[0] for row in fvg_rows], dtype=np.int64)
+    fvg_start_prices = np.array([row[1] for row in fvg_rows], dtype=np.float64)
+    fvg_end_prices = np.array([row[2] for row in fvg_rows], dtype=np.float64)
+    fvg_times = np.array([row[3] for row in fvg_rows], dtype='datetime64[s]')
+    
+    # Merge the two sorted streams: the first FVG starting at or after each CHoCH
+    first_fvg = np.searchsorted(fvg_times, choch_times, side='left')
+    matched = first_fvg < len(fvg_rows)
+    choch_ids, choch_candle_ids, first_fvg = choch_ids[matched], choch_candle_ids[matched], first_fvg[matched]
     
-    # Simulate trade outcomes
-    simulate_trade_outcomes(opportunities)
+    # For risk management, we'll use 1:2 risk-reward ratio
+    entry_prices, stop_losses, take_profits = calculate_trade_levels(fvg_start_prices[first_fvg],
+                                                                     fvg_end_prices[first_fvg])
     
-    return opportunities
+    # Simulate trade outcomes on the CHoCH timeframe, starting after each CHoCH candle
+    frame = get_candle_frame(symbol, candle_choch_tf_enum)
+    signal_positions = frame.positions(choch_candle_ids)
+    statuses, exit_positions = simulate_trade_outcomes(frame, signal_positions, entry_prices,
+                                                       stop_losses, take_profits, intrabar=intrabar)
+    exited = exit_positions >= 0
+    exit_rows = np.where(exited, exit_positions, 0)
+    exit_candle_ids = frame.candle_id[exit_rows]
+    exit_times = frame.timestamp[exit_rows].astype(object)
+    holding_bars = np.where(exited, exit_positions - signal_positions, -1)
+    
+    # Add all opportunities to the database in one bulk insert
+    creation_time = datetime.utcnow()
+    rows = [{
+        'choch_pattern_id': choch_pattern_id,
+        'fvg_id': fvg_id,
+        'entry_price': entry_price,
+        'stop_loss': stop_loss,
+        'take_profit': take_profit,
+        'status': status,
+        'creation_time': creation_time,
+        'exit_candle_id': exit_candle_id if has_exit else None,
+        'exit_time': exit_time if has_exit else None,
+        'holding_bars': holding if has_exit else None,
+        'run_id': run_id
+    } for (choch_pattern_id, fvg_id, entry_price, stop_loss, take_profit, status,
+           has_exit, exit_candle_id, exit_time, holding) in zip(
+        choch_ids.tolist(),
+        fvg_ids[first_fvg].tolist(),
+        entry_prices.tolist(),
+        stop_losses.tolist(),
+        take_profits.tolist(),
+        statuses,
+        exited.tolist(),
+        exit_candle_ids.tolist(),
+        exit_times,
+        holding_bars.tolist()
+    )]
+    
+    if rows:
+        db.session.execute(TradeOpportunity.__table__.insert(), rows)
+    db.session.commit()
+    
+    return len(rows)
 
-def calculate_trade_levels(pattern, fvg):
+def calculate_trade_levels(start_prices, end_prices, risk_reward_ratio=2.0, stop_buffer=0.001):
     """
-    Calculate entry, stop-loss, and take-profit levels for a trade opportunity
+    Calculate entry, stop-loss, and take-profit levels for trade
+    opportunities from the start and end prices of their FVGs.
+    
+    stop_buffer is the fraction of the price the stop loss is placed beyond
+    the far side of the FVG; the take profit is risk_reward_ratio times the
+    risk away from the entry.
     """
-    pattern_candle = Candle.query.get(pattern.candle_id)
+    start_prices = np.asarray(start_prices, dtype=np.float64)
+    end_prices = np.asarray(end_prices, dtype=np.float64)
     
     # Calculate entry price - use the middle of the FVG
-    entry_price = (fvg.start_price + fvg.end_price) / 2
+    entry_prices = (start_prices + end_prices) / 2
     
     # Calculate stop loss - use the opposite side of the FVG with a small buffer
-    if fvg.start_price > fvg.end_price:  # Bullish FVG
-        stop_loss = fvg.end_price * 0.999  # Just below the bottom of the FVG
-        risk = entry_price - stop_loss
-        take_profit = entry_price + (risk * 2)  # 1:2 risk-reward ratio
-    else:  # Bearish FVG
-        stop_loss = fvg.end_price * 1.001  # Just above the top of the FVG
-        risk = stop_loss - entry_price
-        take_profit = entry_price - (risk * 2)  # 1:2 risk-reward ratio
-    
-    return entry_price, stop_loss, take_profit
+    bullish = start_prices > end_prices
+    # Bullish FVG: just below the bottom, bearish FVG: just above the top of the FVG
+    stop_losses = np.where(bullish, end_prices * (1 - stop_buffer), end_prices * (1 + stop_buffer))
+    risks = np.where(bullish, entry_prices - stop_losses, stop_losses - entry_prices)
+    take_profits = np.where(bullish, entry_prices + risks * risk_reward_ratio,
+                            entry_prices - risks * risk_reward_ratio)
+    
+    return entry_prices, stop_losses, take_profits
 
-def simulate_trade_outcomes(opportunities):
+def simulate_trade_outcomes(frame, signal_positions, entry_prices, stop_losses, take_profits,
+                            intrabar=False):
     """
-    Simulate the outcomes of the trade opportunities
+    Simulate the outcomes of trades entered after their signal candles.
+    
+    signal_positions are the rows of the signal candles in the CandleFrame,
+    -1 for candles missing from it. A trade wins when its take profit is
+    reached before its stop loss; when both are reached in the same candle
+    the stop loss is assumed to come first, unless intrabar is set and the
+    candle's 1-minute candles show the take profit came first. Returns the
+    TradeStatusEnum of each trade and the row of the candle it exited in,
+    -1 for trades that are still open or have no data after the signal.
     """
-    for opportunity in opportunities:
-        pattern = PriceActionPattern.query.get(opportunity.choch_pattern_id)
-        pattern_candle = Candle.query.get(pattern.candle_id)
-        
-        # Get the candles after the pattern occurred
-        future_candles = Candle.query.filter(
-            Candle.symbol == pattern_candle.symbol,
-            Candle.timeframe == pattern_candle.timeframe,  # Use the candle's timeframe directly
-            Candle.timestamp > pattern_candle.timestamp
-        ).order_by(Candle.timestamp).all()
-        
-        if not future_candles:
-            # Not enough future data to simulate
-            opportunity.status = TradeStatusEnum.PENDING
-            continue
-        
-        # Check if stop loss or take profit was hit
-        stop_loss_hit = False
-        take_profit_hit = False
-        
-        # For a bullish trade (expecting price to go up)
-        if opportunity.take_profit > opportunity.entry_price:
-            for candle in future_candles:
-                # Check if stop loss was hit
-                if candle.low_price <= opportunity.stop_loss:
-                    stop_loss_hit = True
-                    break
-                
-                # Check if take profit was hit before stop loss
-                if candle.high_price >= opportunity.take_profit:
-                    take_profit_hit = True
-                    break
-        
-        # For a bearish trade (expecting price to go down)
-        else:
-            for candle in future_candles:
-                # Check if stop loss was hit
-                if candle.high_price >= opportunity.stop_loss:
-                    stop_loss_hit = True
-                    break
-                
-                # Check if take profit was hit before stop loss
-                if candle.low_price <= opportunity.take_profit:
-                    take_profit_hit = True
-                    break
-        
-        # Update the opportunity status
-        if take_profit_hit:
-            opportunity.status = TradeStatusEnum.WIN
-        elif stop_loss_hit:
-            opportunity.status = TradeStatusEnum.LOSS
-        else:
-            # No conclusive outcome yet
-            opportunity.status = TradeStatusEnum.EXECUTED
+    signal_positions = np.asarray(signal_positions, dtype=np.int64)
+    entry_prices = np.asarray(entry_prices, dtype=np.float64)
+    first_after = signal_positions + 1
     
-    db.session.commit()
+    stop_losses = np.asarray(stop_losses, dtype=np.float64)
+    take_profits = np.asarray(take_profits, dtype=np.float64)
+    long_trades = take_profits > entry_prices
+    
+    stop_positions, target_positions = find_first_touches(
+        frame.range_index('low'), frame.range_index('high'), first_after,
+        stop_losses, take_profits, long_trades)
+    
+    # Check if take profit was hit before stop loss
+    win = (target_positions >= 0) & ((stop_positions < 0) | (target_positions < stop_positions))
+    
+    # Look inside candles that reached both levels
+    ambiguous = np.flatnonzero((stop_positions >= 0) & (stop_positions == target_positions))
+    if intrabar and len(ambiguous) and frame.timeframe != TimeframeEnum.M1:
+        win[ambiguous] = resolve_intrabar_outcomes(frame, stop_positions[ambiguous], stop_losses[ambiguous],
+                                                   take_profits[ambiguous], long_trades[ambiguous])
+    loss = (stop_positions >= 0) & ~win
+    # Not enough future data to simulate
+    pending = (signal_positions < 0) | (first_after >= len(frame))
+    
+    # No conclusive outcome yet unless one of the levels was hit
+    statuses = np.full(len(signal_positions), TradeStatusEnum.EXECUTED, dtype=object)
+    statuses[win] = TradeStatusEnum.WIN
+    statuses[loss] = TradeStatusEnum.LOSS
+    statuses[pending] = TradeStatusEnum.PENDING
+    
+    exit_positions = np.where(win, target_positions, np.where(loss, stop_positions, -1))
+    exit_positions[pending] = -1
+    
+    return statuses.tolist(), exit_positions
+
+def resolve_intrabar_outcomes(frame, positions, stop_losses, take_profits, long_trades):
+    """
+    Decide trades whose stop loss and take profit were both reached in the
+    same candle by replaying that candle's 1-minute candles.
+    
+    positions are the rows of those candles in the frame. Only the 1-minute
+    candles of their buckets are loaded, in batches of bucket ranges. Returns
+    whether each trade's take profit was reached in an earlier 1-minute
+    candle than its stop loss; a 1-minute candle that reaches both still
+    counts as a loss, as does a candle without 1-minute data.
+    """
+    interval_minutes = TIMEFRAME_MINUTES[frame.timeframe]
+    bucket_keys = frame.bucket_key[positions]
+    
+    # 1-minute bucket key ranges of the ambiguous candles, each loaded once
+    first_minutes = np.unique(bucket_keys) * interval_minutes
+    ranges = [(first, first + interval_minutes - 1) for first in first_minutes.tolist()]
+    parts = [
+        load_candle_arrays(frame.symbol, TimeframeEnum.M1, ranges[start:start + 500])
+        for start in range(0, len(ranges), 500)
+    ]
+    minute = np.concatenate([part['minute'] for part in parts])
+    low = np.concatenate([part['low_price'] for part in parts])
+    high = np.concatenate([part['high_price'] for part in parts])
+    
+    # The 1-minute rows [child_starts, child_stops) of each ambiguous candle
+    child_starts = np.searchsorted(minute, bucket_keys * interval_minutes, side='left')
+    child_stops = np.searchsorted(minute, (bucket_keys + 1) * interval_minutes, side='left')
+    
+    stop_positions, target_positions = find_first_touches(
+        RangeExtremeIndex(low, 'min'), RangeExtremeIndex(high, 'max'), child_starts,
+        stop_losses, take_profits, long_trades)
+    stop_positions = np.where(stop_positions < child_stops, stop_positions, -1)
+    target_positions = np.where(target_positions < child_stops, target_positions, -1)
+    
+    return (target_positions >= 0) & ((stop_positions < 0) | (target_positions < stop_positions))
 
-def get_trade_statistics():
+def find_first_touches(low_index, high_index, first_positions, stop_losses, take_profits, long_trades):
     """
-    Get statistics on trade opportunities
+    First candle at or after each trade's first position that reaches its
+    stop loss and its take profit, -1 where the level is never reached.
+    
+    low_index and high_index are RangeExtremeIndex instances over the lows
+    and highs. A long trade is stopped by a low at or below its stop loss
+    and takes profit on a high at or above its target; a short trade the
+    other way around.
     """
-    # Count total opportunities
-    total_opportunities = TradeOpportunity.query.count()
+    first_positions = np.asarray(first_positions, dtype=np.int64)
+    stop_losses = np.asarray(stop_losses, dtype=np.float64)
+    take_profits = np.asarray(take_profits, dtype=np.float64)
+    long_trades = np.asarray(long_trades, dtype=bool)
+    short_trades = ~long_trades
     
-    # Count by status
-    pending_count = TradeOpportunity.query.filter_by(status=TradeStatusEnum.PENDING).count()
-    executed_count = TradeOpportunity.query.filter_by(status=TradeStatusEnum.EXECUTED).count()
-    win_count = TradeOpportunity.query.filter_by(status=TradeStatusEnum.WIN).count()
-    loss_count = TradeOpportunity.query.filter_by(status=TradeStatusEnum.LOSS).count()
+    stop_positions = np.full(len(first_positions), -1, dtype=np.int64)
+    target_positions = np.full(len(first_positions), -1, dtype=np.int64)
     
-    # Calculate win rate
-    completed_trades = win_count + loss_count
-    win_rate = (win_count / completed_trades * 100) if completed_trades > 0 else 0
+    stop_positions[long_trades] = low_index.first_reaching(first_positions[long_trades],
+                                                           stop_losses[long_trades])
+    target_positions[long_trades] = high_index.first_reaching(first_positions[long_trades],
+                                                              take_profits[long_trades])
+    stop_positions[short_trades] = high_index.first_reaching(first_positions[short_trades],
+                                                             stop_losses[short_trades])
+    target_positions[short_trades] = low_index.first_reaching(first_positions[short_trades],
+                                                              take_profits[short_trades])
     
-    # Calculate expectancy
-    # For 1:2 risk-reward, wins gain 2R and losses lose 1R
-    expectancy = ((win_count * 2) - loss_count) / completed_trades if completed_trades > 0 else 0
+    return stop_positions, target_positions
+
+def summarize_r_multiples(r_multiples):
+    """
+    Performance of a sequence of closed trades given in R multiples (the
+    result divided by the risk taken), in the order they closed: win rate,
+    expectancy per trade, the maximum drawdown of the cumulative R curve,
+    profit factor and the longest run of consecutive losses
+    """
+    r_multiples = np.asarray(r_multiples, dtype=np.float64)
+    wins = int(np.count_nonzero(r_multiples > 0))
+    losses = int(np.count_nonzero(r_multiples < 0))
+    completed = len(r_multiples)
+    
+    equity = np.cumsum(r_multiples)
+    # Peaks include the flat start, so an opening loss counts as drawdown
+    peaks = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:]
+    max_drawdown = float(np.max(peaks - equity)) if completed else 0.0
+    
+    # Gross profit over gross loss, undefined without losses
+    gross_profit = float(r_multiples[r_multiples > 0].sum())
+    gross_loss = float(-r_multiples[r_multiples < 0].sum())
+    profit_factor = round(gross_profit / gross_loss, 4) if gross_loss > 0 else None
+    
+    # Longest run of losses: distance between the trades that are not losses
+    breaks = np.flatnonzero(np.concatenate(([True], r_multiples >= 0, [True])))
+    longest_losing_streak = int(np.max(np.diff(breaks)) - 1)
+    
+    return {
+        'tradeCount': completed,
+        'winCount': wins,
+        'lossCount': losses,
+        'winRate': round(wins / completed * 100, 2) if completed else 0,
+        'expectancy': round(float(r_multiples.mean()), 4) if completed else 0,
+        'totalR': round(float(equity[-1]), 4) if completed else 0,
+        'maxDrawdown': round(max_drawdown, 4),
+        'profitFactor': profit_factor,
+        'longestLosingStreak': longest_losing_streak
+    }
+
+def get_trade_statistics(symbol, run_id):
+    """
+    Get statistics on the trade opportunities of an analysis run.
+    
+    The opportunities are loaded in one query and summarized in a single
+    pass over their arrays, including the equity curve in R multiples in
+    the order trades exited.
+    """
+    rows = db.session.query(
+        TradeOpportunity.opportunity_id,
+        TradeOpportunity.status,
+        TradeOpportunity.entry_price,
+        TradeOpportunity.stop_loss,
+        TradeOpportunity.take_profit,
+        TradeOpportunity.exit_time,
+        PriceActionPattern.timeframe
+    ).join(
+        PriceActionPattern,
+        TradeOpportunity.choch_pattern_id == PriceActionPattern.pattern_id
+    ).filter(TradeOpportunity.run_id == run_id).all()
+    
+    statuses = np.array([row.status.name for row in rows], dtype=object)
+    timeframes = np.array([row.timeframe.value for row in rows], dtype=object)
+    entry_prices = np.array([row.entry_price for row in rows], dtype=np.float64)
+    stop_losses = np.array([row.stop_loss for row in rows], dtype=np.float64)
+    take_profits = np.array([row.take_profit for row in rows], dtype=np.float64)
+    exit_times = np.array([row.exit_time for row in rows], dtype='datetime64[s]')
+    opportunity_ids = np.array([row.opportunity_id for row in rows], dtype=np.int64)
+    
+    win = statuses == TradeStatusEnum.WIN.name
+    loss = statuses == TradeStatusEnum.LOSS.name
+    closed = win | loss
+    
+    # A win earns the reward to risk ratio of its levels, a loss costs 1R
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reward_ratios = np.abs(take_profits - entry_prices) / np.abs(entry_prices - stop_losses)
+    r_multiples = np.where(win, reward_ratios, -1.0)
+    
+    # Closed trades in the order they exited; trades without an exit time last
+    order = np.lexsort((opportunity_ids[closed], exit_times[closed]))
+    closed_r = r_multiples[closed][order]
+    summary = summarize_r_multiples(closed_r)
+    equity_curve = [
+        {'time': float(exit_time.astype(np.int64)) if not np.isnat(exit_time) else None, 'equity': round(equity, 4)}
+        for exit_time, equity in zip(exit_times[closed][order], np.cumsum(closed_r).tolist())
+    ]
     
     # Group by timeframes
     timeframe_stats = {}
-    
-    # For each analysis timeframe, collect stats
     for tf_enum in AnalysisTimeframeEnum:
-        # Get the corresponding string value for display
-        tf_value = tf_enum.value
-        
-        patterns = db.session.query(
-            func.count(TradeOpportunity.opportunity_id).label('count'),
-            func.sum(TradeOpportunity.status == TradeStatusEnum.WIN).label('wins'),
-            func.sum(TradeOpportunity.status == TradeStatusEnum.LOSS).label('losses')
-        ).join(
-            PriceActionPattern, 
-            TradeOpportunity.choch_pattern_id == PriceActionPattern.pattern_id
-        ).filter(
-            PriceActionPattern.timeframe == tf_enum
-        ).first()
-        
-        if patterns and patterns.count > 0:
-            count, wins, losses = patterns
-            total = (wins or 0) + (losses or 0)
-            win_rate_tf = (wins / total * 100) if total > 0 else 0
-            timeframe_stats[tf_value] = {
+        in_tf = timeframes == tf_enum.value
+        count = int(np.count_nonzero(in_tf))
+        if count > 0:
+            wins = int(np.count_nonzero(win & in_tf))
+            losses = int(np.count_nonzero(loss & in_tf))
+            total = wins + losses
+            timeframe_stats[tf_enum.value] = {
                 'count': count,
-                'wins': wins or 0,
-                'losses': losses or 0,
-                'winRate': round(win_rate_tf, 2)
+                'wins': wins,
+                'losses': losses,
+                'winRate': round(wins / total * 100, 2) if total > 0 else 0
             }
     
-    return {
-        'totalOpportunities': total_opportunities,
-        'pendingCount': pending_count,
-        'executedCount': executed_count,
-        'winCount': win_count,
-        'lossCount': loss_count,
-        'winRate': round(win_rate, 2),
-        'expectancy': round(expectancy, 2),
+    stats = {
+        'totalOpportunities': len(rows),
+        'pendingCount': int(np.count_nonzero(statuses == TradeStatusEnum.PENDING.name)),
+        'executedCount': int(np.count_nonzero(statuses == TradeStatusEnum.EXECUTED.name)),
+        'winCount': int(np.count_nonzero(win)),
+        'lossCount': int(np.count_nonzero(loss)),
+        'winRate': round(np.count_nonzero(win) / np.count_nonzero(closed) * 100, 2) if closed.any() else 0,
+        'expectancy': round(summary['expectancy'], 2),
+        'totalR': summary['totalR'],
+        'maxDrawdown': summary['maxDrawdown'],
+        'profitFactor': summary['profitFactor'],
+        'longestLosingStreak': summary['longestLosingStreak'],
+        'equityCurve': equity_curve,
         'timeframeStats': timeframe_stats
     }
+    
+    return stats
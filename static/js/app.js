@@ -269,8 +269,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 // Switch to this timeframe and show FVGs
                 document.getElementById('timeframe-select').value = timeframe;
-                chart.loadCandleData(symbol, timeframe);
-                chart.showFVGs(symbol, timeframe);
+                chart.loadChart(symbol, timeframe, ['fvgs']);
             }
             this.disabled = false;
             this.textContent = 'Find Fair Value Gaps';
@@ -325,7 +324,8 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Load trade opportunities
     function loadTradeOpportunities() {
-        fetch('/api/data/opportunities')
+        const symbol = document.getElementById('currency-select').value;
+        fetch(`/api/data/opportunities?symbol=${encodeURIComponent(symbol)}`)
             .then(response => response.json())
             .then(data => {
                 if (data.error) {
@@ -369,7 +369,8 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Load trade statistics
     function loadTradeStatistics() {
-        fetch('/api/statistics/trades')
+        const symbol = document.getElementById('currency-select').value;
+        fetch(`/api/statistics/trades?symbol=${encodeURIComponent(symbol)}`)
             .then(response => response.json())
             .then(data => {
                 if (data.error) {
@@ -384,6 +385,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 document.getElementById('pending-count').textContent = data.pendingCount;
                 document.getElementById('win-rate').textContent = `${data.winRate}%`;
                 document.getElementById('expectancy').textContent = data.expectancy;
+                document.getElementById('profit-factor').textContent = data.profitFactor !== null ? data.profitFactor : '-';
+                document.getElementById('max-drawdown').textContent = data.maxDrawdown;
+                document.getElementById('losing-streak').textContent = data.longestLosingStreak;
                 
                 // Update timeframe statistics
                 const tfStatsBody = document.getElementById('timeframe-stats-body');
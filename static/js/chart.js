@@ -99,29 +99,33 @@ class CandlestickChart {
         // Clear existing data
         this.clear();
 
-        // Fetch candle data from API
-        fetch(`/api/candles?symbol=${symbol}&timeframe=${timeframe}`)
-            .then(response => response.json())
+        // Fetch candle data from API, at most about one candle per pixel of chart width
+        const maxPoints = Math.max(100, Math.floor(this.container.clientWidth));
+        fetchColumns(`/api/candles?symbol=${symbol}&timeframe=${timeframe}&maxPoints=${maxPoints}`)
             .then(data => {
                 if (!data || data.error) {
                     console.error('Error loading candle data:', data?.error || 'No data');
                     return;
                 }
 
-                // Prepare data for chart
-                const candleData = data.map(candle => ({
-                    time: candle.time,
-                    open: candle.open,
-                    high: candle.high,
-                    low: candle.low,
-                    close: candle.close
-                }));
-
-                const volumeData = data.map(candle => ({
-                    time: candle.time,
-                    value: candle.volume,
-                    color: candle.close >= candle.open ? '#26a69a' : '#ef5350'
-                }));
+                // Prepare data for chart straight from the typed arrays
+                const { time, open, high, low, close, volume } = data.columns;
+                const candleData = new Array(data.rows);
+                const volumeData = new Array(data.rows);
+                for (let i = 0; i < data.rows; i++) {
+                    candleData[i] = {
+                        time: time[i],
+                        open: open[i],
+                        high: high[i],
+                        low: low[i],
+                        close: close[i]
+                    };
+                    volumeData[i] = {
+                        time: time[i],
+                        value: volume[i],
+                        color: close[i] >= open[i] ? '#26a69a' : '#ef5350'
+                    };
+                }
 
                 // Set data
                 this.candleSeries.setData(candleData);
@@ -149,25 +153,7 @@ class CandlestickChart {
                     return;
                 }
 
-                // Clear existing pattern markers
-                this.patternMarkers.forEach(marker => {
-                    this.candleSeries.removePriceLine(marker);
-                });
-                this.patternMarkers = [];
-
-                // Add pattern markers
-                data.forEach(pattern => {
-                    const markerColor = this.getPatternColor(pattern.type, pattern.status);
-                    const marker = this.candleSeries.createPriceLine({
-                        price: pattern.price,
-                        color: markerColor,
-                        lineWidth: 2,
-                        lineStyle: 2, // Dashed line
-                        axisLabelVisible: true,
-                        title: `${pattern.type} (${pattern.status})`,
-                    });
-                    this.patternMarkers.push(marker);
-                });
+                this.drawPatterns(data);
             })
             .catch(error => {
                 console.error('Error fetching pattern data:', error);
@@ -188,42 +174,120 @@ class CandlestickChart {
                     return;
                 }
 
-                // Clear existing FVG markers
-                this.fvgMarkers.forEach(marker => {
-                    this.candleSeries.removePriceLine(marker);
-                });
-                this.fvgMarkers = [];
-
-                // Add FVG zones
-                data.forEach(fvg => {
-                    // Top line of FVG
-                    const topLine = this.candleSeries.createPriceLine({
-                        price: Math.max(fvg.startPrice, fvg.endPrice),
-                        color: 'rgba(76, 175, 80, 0.5)',
-                        lineWidth: 1,
-                        lineStyle: 0, // Solid line
-                        axisLabelVisible: true,
-                        title: `FVG Top (${fvg.fillPercentage.toFixed(1)}%)`,
-                    });
-                    
-                    // Bottom line of FVG
-                    const bottomLine = this.candleSeries.createPriceLine({
-                        price: Math.min(fvg.startPrice, fvg.endPrice),
-                        color: 'rgba(76, 175, 80, 0.5)',
-                        lineWidth: 1,
-                        lineStyle: 0, // Solid line
-                        axisLabelVisible: true,
-                        title: 'FVG Bottom',
-                    });
-                    
-                    this.fvgMarkers.push(topLine, bottomLine);
-                });
+                this.drawFVGs(data);
             })
             .catch(error => {
                 console.error('Error fetching FVG data:', error);
             });
     }
 
+    /**
+     * Draw price action patterns as price lines
+     * @param {Array<Object>} patterns - Rows of /api/data/patterns
+     */
+    drawPatterns(patterns) {
+        // Clear existing pattern markers
+        this.patternMarkers.forEach(marker => {
+            this.candleSeries.removePriceLine(marker);
+        });
+        this.patternMarkers = [];
+
+        // Add pattern markers
+        patterns.forEach(pattern => {
+            const markerColor = this.getPatternColor(pattern.type, pattern.status);
+            const marker = this.candleSeries.createPriceLine({
+                price: pattern.price,
+                color: markerColor,
+                lineWidth: 2,
+                lineStyle: 2, // Dashed line
+                axisLabelVisible: true,
+                title: `${pattern.type} (${pattern.status})`,
+            });
+            this.patternMarkers.push(marker);
+        });
+    }
+
+    /**
+     * Draw fair value gaps as pairs of price lines
+     * @param {Array<Object>} fvgs - Rows of /api/data/fvgs
+     */
+    drawFVGs(fvgs) {
+        // Clear existing FVG markers
+        this.fvgMarkers.forEach(marker => {
+            this.candleSeries.removePriceLine(marker);
+        });
+        this.fvgMarkers = [];
+
+        // Add FVG zones
+        fvgs.forEach(fvg => {
+            // Top line of FVG
+            const topLine = this.candleSeries.createPriceLine({
+                price: Math.max(fvg.startPrice, fvg.endPrice),
+                color: 'rgba(76, 175, 80, 0.5)',
+                lineWidth: 1,
+                lineStyle: 0, // Solid line
+                axisLabelVisible: true,
+                title: `FVG Top (${fvg.fillPercentage.toFixed(1)}%)`,
+            });
+            
+            // Bottom line of FVG
+            const bottomLine = this.candleSeries.createPriceLine({
+                price: Math.min(fvg.startPrice, fvg.endPrice),
+                color: 'rgba(76, 175, 80, 0.5)',
+                lineWidth: 1,
+                lineStyle: 0, // Solid line
+                axisLabelVisible: true,
+                title: 'FVG Bottom',
+            });
+            
+            this.fvgMarkers.push(topLine, bottomLine);
+        });
+    }
+
+    /**
+     * Load candles and overlays of a window in one request
+     * @param {string} symbol - Currency symbol
+     * @param {string} timeframe - Candle and overlay timeframe
+     * @param {Array<string>} overlays - Overlays to draw: 'patterns' and/or 'fvgs'
+     */
+    loadChart(symbol, timeframe, overlays) {
+        this.clear();
+
+        const maxPoints = Math.max(100, Math.floor(this.container.clientWidth));
+        fetch(`/api/chart?symbol=${symbol}&timeframe=${timeframe}&maxPoints=${maxPoints}&include=${overlays.join(',')}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data || data.error) {
+                    console.error('Error loading chart data:', data?.error || 'No data');
+                    return;
+                }
+
+                this.candleSeries.setData(data.candles.map(candle => ({
+                    time: candle.time,
+                    open: candle.open,
+                    high: candle.high,
+                    low: candle.low,
+                    close: candle.close
+                })));
+                this.volumeSeries.setData(data.candles.map(candle => ({
+                    time: candle.time,
+                    value: candle.volume,
+                    color: candle.close >= candle.open ? '#26a69a' : '#ef5350'
+                })));
+                this.chart.timeScale().fitContent();
+
+                if (data.patterns) {
+                    this.drawPatterns(data.patterns);
+                }
+                if (data.fvgs) {
+                    this.drawFVGs(data.fvgs);
+                }
+            })
+            .catch(error => {
+                console.error('Error fetching chart data:', error);
+            });
+    }
+
     /**
      * Clear all markers and lines from the chart
      */
@@ -0,0 +1,88 @@
+/**
+ * Decoder for column-oriented API responses
+ * (application/vnd.market-analyzer.columns, requested with ?format=columns)
+ */
+const COLUMNAR_MIMETYPE = 'application/vnd.market-analyzer.columns';
+
+/**
+ * Decode a columnar payload into typed arrays
+ * @param {ArrayBuffer} buffer - Response body
+ * @returns {{rows: number, columns: Object, meta: Object, nulls: Object}} Float
+ *     columns as Float64Array, integer columns as Float64Array of their values,
+ *     category columns as arrays of strings (null for missing values) and the
+ *     missing-value sentinels of nullable integer columns
+ */
+function decodeColumns(buffer) {
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(0, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+
+    // Column buffers start on the next 8-byte boundary, in header order
+    let offset = Math.ceil((4 + headerLength) / 8) * 8;
+    const columns = {};
+    header.columns.forEach(spec => {
+        if (spec.type === 'float64') {
+            columns[spec.name] = new Float64Array(buffer, offset, header.rows);
+        } else {
+            // Ids and epoch seconds fit in a double without loss
+            const values = new BigInt64Array(buffer, offset, header.rows);
+            const numbers = new Float64Array(header.rows);
+            for (let i = 0; i < header.rows; i++) {
+                numbers[i] = Number(values[i]);
+            }
+            columns[spec.name] = spec.type === 'category'
+                ? Array.from(numbers, code => code >= 0 ? spec.categories[code] : null)
+                : numbers;
+        }
+        offset += header.rows * 8;
+    });
+
+    // Integer columns that use a sentinel for missing values
+    const nulls = {};
+    header.columns.forEach(spec => {
+        if (spec.null !== undefined) {
+            nulls[spec.name] = spec.null;
+        }
+    });
+
+    return { rows: header.rows, columns: columns, meta: header.meta, nulls: nulls };
+}
+
+/**
+ * Convert decoded columns into the row objects the JSON format returns
+ * @param {Object} decoded - Result of decodeColumns
+ * @returns {Array<Object>} One object per row
+ */
+function columnsToRows(decoded) {
+    const names = Object.keys(decoded.columns);
+    const rows = new Array(decoded.rows);
+    for (let i = 0; i < decoded.rows; i++) {
+        const row = {};
+        names.forEach(name => {
+            const value = decoded.columns[name][i];
+            row[name] = (Number.isNaN(value) || value === decoded.nulls[name]) ? null : value;
+        });
+        rows[i] = row;
+    }
+    return rows;
+}
+
+/**
+ * Fetch a read endpoint in the columnar format
+ * @param {string} url - Endpoint URL including its query string
+ * @returns {Promise<Object>} Decoded columns, or the JSON error body
+ */
+function fetchColumns(url) {
+    return fetch(url, { headers: { 'Accept': COLUMNAR_MIMETYPE } })
+        .then(response => {
+            // Errors are always sent as JSON
+            if (!response.headers.get('Content-Type')?.startsWith(COLUMNAR_MIMETYPE)) {
+                return response.json();
+            }
+            return response.arrayBuffer().then(decodeColumns);
+        });
+}
+
+window.decodeColumns = decodeColumns;
+window.columnsToRows = columnsToRows;
+window.fetchColumns = fetchColumns;